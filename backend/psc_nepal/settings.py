@@ -88,14 +88,29 @@ WSGI_APPLICATION = 'psc_nepal.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# The web tier runs under ASGI, where sync views run in per-request threads
+# and persistent connections are not reliably reused or closed, so they are
+# off by default; the worker commands can opt in with DB_CONN_MAX_AGE
 DATABASES = {
     'default': dj_database_url.config(
         default=f"sqlite:///{str(BASE_DIR / 'db.sqlite3')}",
-        conn_max_age=600,
+        conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', '0')),
     )
 }
 
 
+# Cache
+# Quiz content caches are versioned through this cache, so with several
+# workers point it at a shared backend (e.g. django.core.cache.backends.redis.RedisCache)
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'psc-nepal'),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -122,6 +137,12 @@ LANGUAGE_CODE = 'en-us'
 
 TIME_ZONE = 'UTC'
 
+# Calendar days for leaderboards and streaks follow Nepal time
+LOCAL_TIME_ZONE = 'Asia/Kathmandu'
+
+# Longest a cached leaderboard may lag behind new results
+LEADERBOARD_CACHE_SECONDS = 60
+
 USE_I18N = True
 
 USE_TZ = True
@@ -166,3 +187,31 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_FILTER_BACKENDS': [],
 }
+
+# Viewsets with query budgets (quizzes/query_budget.py) log a warning when
+# an action goes over budget; in strict mode they raise instead (tests)
+QUERY_BUDGET_STRICT = os.environ.get('QUERY_BUDGET_STRICT', 'false').lower() == 'true'
+
+# View/download counters are buffered in process memory and written in
+# batches (quizzes/counter_buffer.py); 0 seconds writes every tap directly
+COUNTER_BUFFER_FLUSH_SECONDS = float(os.environ.get('COUNTER_BUFFER_FLUSH_SECONDS', '10'))
+COUNTER_BUFFER_MAX_PENDING = int(os.environ.get('COUNTER_BUFFER_MAX_PENDING', '500'))
+
+# Push delivery (quizzes/delivery.py): transports keyed by name, each with
+# its own batch size and per-process rate limit
+DELIVERY_TRANSPORTS = {
+    'default': {
+        'BACKEND': os.environ.get('DELIVERY_BACKEND', 'quizzes.delivery.FileTransport'),
+        'RATE_PER_SECOND': float(os.environ.get('DELIVERY_RATE_PER_SECOND', '1000')),
+        'BATCH_SIZE': int(os.environ.get('DELIVERY_BATCH_SIZE', '500')),
+        'OPTIONS': {'path': os.environ.get('DELIVERY_FILE_PATH', str(BASE_DIR / 'push-deliveries.jsonl'))},
+    },
+}
+
+# Live updates (quizzes/live.py): pub/sub broker behind /api/live/ and how
+# long one event stream stays open before the client reconnects
+# LocalBroker only reaches clients of the publishing process; keep the
+# database broker whenever more than one web worker runs
+LIVE_BROKER = os.environ.get('LIVE_BROKER', 'quizzes.live.DatabaseBroker')
+LIVE_POLL_SECONDS = float(os.environ.get('LIVE_POLL_SECONDS', '0.5'))
+LIVE_STREAM_SECONDS = int(os.environ.get('LIVE_STREAM_SECONDS', '300'))
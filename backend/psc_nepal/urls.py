@@ -7,7 +7,7 @@ from quizzes.views import (
     SubjectViewSet, BadgeViewSet, StreakViewSet, BookmarkViewSet, QuestionReportViewSet,
     leaderboard, google_login, AchievementViewSet, UserAnalyticsViewSet,
     DailyChallengeViewSet, ChallengeParticipationViewSet, QuestionFeedbackViewSet,
-    ForumPostViewSet, ForumCommentViewSet
+    ForumPostViewSet, ForumCommentViewSet, live_stream
 )
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
@@ -47,4 +47,5 @@ urlpatterns = [
     path('api/analytics/', analytics, name='analytics'),
     path('api/leaderboard/', leaderboard, name='leaderboard'),
     path('api/auth/google/', google_login, name='google_login'),
+    path('api/live/', live_stream, name='live'),
 ]
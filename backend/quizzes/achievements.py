@@ -0,0 +1,181 @@
+"""
+Declarative achievement and badge rules.
+
+Every badge and achievement is a Rule whose predicate looks only at the
+user's UserCounters row. The counters are kept current incrementally by
+signals (results, bookmarks, reports, streaks), so evaluating every rule
+after an event is a couple of indexed lookups plus O(rules) Python, never
+a scan over the user's history. The evaluate_achievements command rebuilds
+the counters and evaluates everyone in bulk.
+"""
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .local_time import local_date
+from .models import Achievement, Badge, UserCounters
+
+BADGE = 'badge'
+ACHIEVEMENT = 'achievement'
+# Window of the "quizzes in the last N days" counter
+RECENT_DAYS = 7
+
+Rule = namedtuple(
+    'Rule', ['kind', 'code', 'predicate', 'title', 'description', 'icon', 'points'],
+    defaults=('', '', 'trophy', 10)
+)
+
+
+def recent_quizzes(counters, today=None):
+    """Quizzes taken in the last RECENT_DAYS Nepal-time days, today included"""
+    first_day = (today or local_date()) - timedelta(days=RECENT_DAYS - 1)
+    return sum(n for day, n in counters.daily_quizzes.items() if day >= first_day.isoformat())
+
+
+RULES = [
+    Rule(BADGE, 'score_90', lambda c, today: c.best_score >= 90),
+    Rule(BADGE, 'attempt_10', lambda c, today: c.total_quizzes >= 10),
+    Rule(BADGE, 'streak_7', lambda c, today: c.longest_streak >= 7),
+    Rule(ACHIEVEMENT, 'first_quiz', lambda c, today: c.total_quizzes >= 1,
+         'First Quiz Completed', 'Completed the first quiz', 'rocket', 10),
+    Rule(ACHIEVEMENT, 'perfect_score', lambda c, today: c.perfect_scores >= 1,
+         'Perfect Score', 'Achieved a 100% score in a quiz', 'star', 25),
+    Rule(ACHIEVEMENT, 'quiz_master', lambda c, today: c.total_quizzes >= 50,
+         'Quiz Master', 'Completed 50 quizzes', 'crown', 50),
+    Rule(ACHIEVEMENT, 'consistent', lambda c, today: c.total_quizzes >= 100,
+         'Consistent', 'Completed 100 quizzes', 'calendar', 100),
+    Rule(ACHIEVEMENT, 'streak_warrior', lambda c, today: c.longest_streak >= 30,
+         'Streak Warrior', 'Kept a 30-day streak', 'fire', 50),
+    Rule(ACHIEVEMENT, 'fast_learner', lambda c, today: recent_quizzes(c, today) >= 10,
+         'Fast Learner', 'Completed 10 quizzes in a week', 'bolt', 30),
+    Rule(ACHIEVEMENT, 'bookworm', lambda c, today: c.bookmarks >= 100,
+         'Bookworm', 'Bookmarked 100 questions', 'book', 30),
+    Rule(ACHIEVEMENT, 'helpful', lambda c, today: c.reports >= 10,
+         'Helpful', 'Reported 10 questions', 'flag', 20),
+]
+
+# Evaluated once per category the user has taken quizzes in
+CATEGORY_RULES = [
+    Rule(ACHIEVEMENT, 'category_expert', lambda count: count >= 20,
+         'Category Expert', 'Completed 20 quizzes in {category}', 'medal', 30),
+]
+
+
+# Counter maintenance
+
+def _ensure_counters(user_id):
+    try:
+        with transaction.atomic():
+            UserCounters.objects.get_or_create(user_id=user_id)
+    except IntegrityError:
+        # Created by a concurrent event
+        pass
+
+
+def bump_counter(user_id, field, delta=1):
+    """Atomically add delta to one integer counter"""
+    if delta > 0:
+        _ensure_counters(user_id)
+    UserCounters.objects.filter(user_id=user_id).update(**{field: F(field) + delta})
+
+
+def raise_longest_streak(user_id, longest_streak):
+    _ensure_counters(user_id)
+    UserCounters.objects.filter(user_id=user_id, longest_streak__lt=longest_streak).update(
+        longest_streak=longest_streak
+    )
+
+
+def record_result_counters(results, sign=1):
+    """Add (sign=1) or remove (sign=-1) results from their users' counters"""
+    per_user = defaultdict(list)
+    for result in results:
+        per_user[result.user_id].append(result)
+
+    first_day = (local_date() - timedelta(days=RECENT_DAYS - 1)).isoformat()
+    for user_id, user_results in per_user.items():
+        if sign > 0:
+            _ensure_counters(user_id)
+        with transaction.atomic():
+            counters = UserCounters.objects.select_for_update().filter(user_id=user_id).first()
+            if counters is None:
+                # Nothing to remove from (e.g. the user is being deleted)
+                continue
+            for result in user_results:
+                counters.total_quizzes += sign
+                if result.score >= 100:
+                    counters.perfect_scores += sign
+                if sign > 0:
+                    counters.best_score = max(counters.best_score, result.score)
+                category = result.quiz.category
+                counters.category_quizzes[category] = counters.category_quizzes.get(category, 0) + sign
+                day = local_date(result.date_taken).isoformat()
+                if day >= first_day:
+                    counters.daily_quizzes[day] = counters.daily_quizzes.get(day, 0) + sign
+            counters.category_quizzes = {k: n for k, n in counters.category_quizzes.items() if n > 0}
+            counters.daily_quizzes = {
+                day: n for day, n in counters.daily_quizzes.items() if n > 0 and day >= first_day
+            }
+            counters.save()
+
+
+# Rule evaluation
+
+def satisfied_rules(counters, today=None):
+    """Yield (rule, category) for every rule the counters satisfy"""
+    today = today or local_date()
+    for rule in RULES:
+        if rule.predicate(counters, today):
+            yield rule, ''
+    for rule in CATEGORY_RULES:
+        for category, count in counters.category_quizzes.items():
+            if rule.predicate(count):
+                yield rule, category
+
+
+def evaluate_many(counters_list, today=None):
+    """
+    Award every satisfied badge/achievement the users do not have yet.
+    Costs two lookups of what the users already earned plus the inserts,
+    whatever the number of users. Returns the number of new awards.
+    """
+    user_ids = [c.user_id for c in counters_list]
+    badges = set(Badge.objects.filter(user_id__in=user_ids).values_list('user_id', 'type'))
+    achievements = set(
+        Achievement.objects.filter(user_id__in=user_ids).values_list('user_id', 'achievement_type', 'category')
+    )
+
+    new_badges = []
+    new_achievements = []
+    for counters in counters_list:
+        for rule, category in satisfied_rules(counters, today):
+            if rule.kind == BADGE:
+                if (counters.user_id, rule.code) not in badges:
+                    badges.add((counters.user_id, rule.code))
+                    new_badges.append(Badge(user_id=counters.user_id, type=rule.code))
+            elif (counters.user_id, rule.code, category) not in achievements:
+                achievements.add((counters.user_id, rule.code, category))
+                new_achievements.append(Achievement(
+                    user_id=counters.user_id,
+                    achievement_type=rule.code,
+                    category=category,
+                    title=rule.title,
+                    description=rule.description.format(category=category),
+                    icon=rule.icon,
+                    points=rule.points
+                ))
+
+    # The unique constraints guard against a concurrent evaluation of the same user
+    Badge.objects.bulk_create(new_badges, ignore_conflicts=True)
+    Achievement.objects.bulk_create(new_achievements, ignore_conflicts=True)
+    return len(new_badges) + len(new_achievements)
+
+
+def evaluate_achievements(user_id, today=None):
+    """Evaluate all rules for one user; returns the number of new awards"""
+    counters = UserCounters.objects.filter(user_id=user_id).first()
+    if counters is None:
+        return 0
+    return evaluate_many([counters], today)
@@ -0,0 +1,113 @@
+"""
+Per-user activity calendars stored as bitsets.
+
+Each ActivityCalendar row holds one bit per day of a year (Nepal time), so
+marking a day is a single-row update and "was the user active on D",
+heatmaps and streak lengths are bit operations over a handful of rows
+instead of scans over Result.date_taken.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.db import IntegrityError, transaction
+
+from .models import ActivityCalendar
+
+
+def _to_int(days):
+    return int.from_bytes(bytes(days or b''), 'little')
+
+
+def _to_bytes(bits):
+    return bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+
+def mark_active(user_id, days):
+    """Set the bits of the given dates; idempotent"""
+    per_year = defaultdict(int)
+    for day in days:
+        per_year[day.year] |= 1 << (day - date(day.year, 1, 1)).days
+
+    for year, mask in per_year.items():
+        try:
+            with transaction.atomic():
+                ActivityCalendar.objects.get_or_create(user_id=user_id, year=year)
+        except IntegrityError:
+            # Created by a concurrent event
+            pass
+        with transaction.atomic():
+            calendar = ActivityCalendar.objects.select_for_update().get(user_id=user_id, year=year)
+            bits = _to_int(calendar.days)
+            if bits | mask != bits:
+                calendar.days = _to_bytes(bits | mask)
+                calendar.save(update_fields=['days'])
+
+
+def active_days(bits, year):
+    """Dates whose bit is set in a year bitset"""
+    first = date(year, 1, 1)
+    result = []
+    while bits:
+        low = bits & -bits
+        result.append(first + timedelta(days=low.bit_length() - 1))
+        bits ^= low
+    return result
+
+
+def history(user_id):
+    """
+    (origin, bits) with all of the user's years joined into one int where
+    bit n is origin + n days, so runs carry across new year.
+    """
+    rows = list(ActivityCalendar.objects.filter(user_id=user_id).order_by('year').values_list('year', 'days'))
+    if not rows:
+        return None, 0
+    origin = date(rows[0][0], 1, 1)
+    bits = 0
+    for year, days in rows:
+        bits |= _to_int(days) << (date(year, 1, 1) - origin).days
+    return origin, bits
+
+
+def run_ending_at(bits, position):
+    """Number of consecutive set bits ending at `position` (0 if it is unset)"""
+    if position < 0:
+        return 0
+    gaps = ~bits & ((1 << (position + 1)) - 1)
+    if not gaps:
+        return position + 1
+    return position - (gaps.bit_length() - 1)
+
+
+def longest_run(bits):
+    """Length of the longest run of set bits"""
+    length = 0
+    while bits:
+        bits &= bits >> 1
+        length += 1
+    return length
+
+
+def year_bits(origin, bits, year):
+    """The bitset of one year out of a joined history"""
+    if origin is None or year < origin.year:
+        return 0
+    first = date(year, 1, 1)
+    length = (date(year + 1, 1, 1) - first).days
+    return (bits >> (first - origin).days) & ((1 << length) - 1)
+
+
+def summarize(origin, bits, today):
+    """
+    (current, longest, last_active) for a joined history: current is the
+    run ending today, or yesterday if the user has not been active yet today.
+    """
+    if not bits:
+        return 0, 0, None
+    position = (today - origin).days
+    current = run_ending_at(bits, position) or run_ending_at(bits, position - 1)
+    return current, longest_run(bits), origin + timedelta(days=bits.bit_length() - 1)
+
+
+def streak_summary(user_id, today):
+    return summarize(*history(user_id), today)
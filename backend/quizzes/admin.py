@@ -5,8 +5,10 @@ from django.contrib import messages
 import json
 from .models import (
     Quiz, Question, Result, StudyMaterial, Notification, 
-    UserProfile, Subject, Badge, Streak, Bookmark, QuestionReport
+    UserProfile, Subject, Badge, Streak, Bookmark, QuestionReport, QueuedEvent, QuestionStats,
+    Delivery
 )
+from .question_upload import replace_questions
 
 
 class QuizAdminForm(forms.ModelForm):
@@ -130,20 +132,10 @@ class QuizAdmin(admin.ModelAdmin):
         
         # Now create questions from JSON if provided
         if questions_data:
-            # Delete existing questions if updating
-            obj.questions.all().delete()
-            
-            # Create new questions
-            for q_data in questions_data['questions']:
-                Question.objects.create(
-                    quiz=obj,
-                    subject=obj.subject,
-                    question_text=q_data['question_text'],
-                    options=q_data['options'],
-                    correct_option=q_data['correct_option'],
-                    explanation=q_data.get('explanation', ''),
-                    difficulty=q_data.get('difficulty', 'medium')
-                )
+            # Questions already in the quiz are updated in place (matched by text)
+            updated, created, removed, answers_removed = replace_questions(
+                obj, questions_data['questions'], obj.subject
+            )
             
             # Update total_questions to match actual count
             obj.total_questions = obj.questions.count()
@@ -152,15 +144,33 @@ class QuizAdmin(admin.ModelAdmin):
             # Success message
             messages.success(
                 request,
-                f'✅ Quiz created successfully! {obj.total_questions} questions uploaded. '
-                f'Topic: "{obj.topic}"'
+                f'✅ Quiz created successfully! {obj.total_questions} questions uploaded '
+                f'({updated} updated, {created} new). Topic: "{obj.topic}"'
             )
+            if removed:
+                messages.warning(
+                    request,
+                    f'{removed} question(s) missing from the upload were deleted, with '
+                    f'{answers_removed} recorded answer(s) and their statistics.'
+                )
 
 @admin.register(Question)
 class QuestionAdmin(admin.ModelAdmin):
-    list_display = ['question_text', 'quiz', 'subject', 'difficulty', 'correct_option']
+    list_display = ['question_text', 'quiz', 'subject', 'difficulty', 'correct_option', 'p_value', 'discrimination']
     list_filter = ['difficulty', 'quiz__category', 'subject']
     search_fields = ['question_text']
+    list_select_related = ['quiz', 'subject', 'stats']
+
+    # Filled by the compute_question_stats command
+    def p_value(self, obj):
+        return obj.stats.p_value if hasattr(obj, 'stats') else None
+    p_value.short_description = 'P-value'
+    p_value.admin_order_field = 'stats__p_value'
+
+    def discrimination(self, obj):
+        return obj.stats.discrimination if hasattr(obj, 'stats') else None
+    discrimination.short_description = 'Discrimination'
+    discrimination.admin_order_field = 'stats__discrimination'
 
 @admin.register(Result)
 class ResultAdmin(admin.ModelAdmin):
@@ -176,7 +186,7 @@ class StudyMaterialAdmin(admin.ModelAdmin):
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ['title', 'notification_type', 'is_active', 'timestamp']
+    list_display = ['title', 'notification_type', 'is_active', 'is_broadcast', 'timestamp']
     list_filter = ['notification_type', 'is_active', 'timestamp']
     search_fields = ['title', 'message']
 
@@ -231,3 +241,23 @@ class QuestionReportAdmin(admin.ModelAdmin):
     def question_preview(self, obj):
         return obj.question.question_text[:50] + '...' if len(obj.question.question_text) > 50 else obj.question.question_text
     question_preview.short_description = 'Question'
+
+@admin.register(QuestionStats)
+class QuestionStatsAdmin(admin.ModelAdmin):
+    list_display = ['question', 'responses', 'p_value', 'discrimination', 'unanswered_rate', 'avg_time', 'computed_at']
+    list_select_related = ['question']
+    search_fields = ['question__question_text']
+    readonly_fields = ['computed_at']
+
+@admin.register(QueuedEvent)
+class QueuedEventAdmin(admin.ModelAdmin):
+    list_display = ['event_type', 'user', 'status', 'attempts', 'available_at', 'created_at']
+    list_filter = ['event_type', 'status']
+    search_fields = ['user__username']
+
+@admin.register(Delivery)
+class DeliveryAdmin(admin.ModelAdmin):
+    list_display = ['title', 'kind', 'transport', 'status', 'total_recipients', 'sent_count', 'failed_count', 'created_at']
+    list_filter = ['kind', 'status', 'transport']
+    search_fields = ['title']
+    readonly_fields = ['status', 'expanded_until', 'total_recipients', 'sent_count', 'failed_count']
@@ -0,0 +1,218 @@
+"""
+Incrementally maintained UserAnalytics.
+
+Every result adds to running per-category sums kept in
+UserAnalytics.category_stats:
+
+    {"GK": {"quizzes": 10, "questions": 200, "score_sum": 855.0,
+            "avg_score": 85.5, "best_score": 95.0,
+            "weak_quizzes": 1, "weak_score_sum": 40.0}, ...}
+
+and the headline fields (totals, average, best/worst category) are derived
+from those sums, so reading analytics is a single-row lookup. Updates take a
+row lock on the user's analytics row, so concurrent submissions never lose
+an increment. Deleting a result cannot lower best_score; the
+reconcile_analytics command rebuilds rows from Result to fix such drift.
+
+The /api/analytics/ payload is cached per user under a stamp that changes
+whenever the user's analytics, streak or badges change; clients can poll
+with ?since=<stamp> and get 304 until it moves.
+"""
+import uuid
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Q, Sum
+
+from .models import Badge, Result, Streak, UserAnalytics
+
+WEAK_SCORE = 50
+STAMP_KEY = 'analytics:{user_id}:stamp'
+# Part of every user's stamp; bulk jobs (streak expiry) move it for everyone
+EPOCH_KEY = 'analytics:epoch'
+PAYLOAD_KEY = 'analytics:{user_id}:{stamp}'
+PAYLOAD_TIMEOUT = 60 * 60
+
+
+def _empty_stats():
+    return {
+        'quizzes': 0, 'questions': 0, 'score_sum': 0.0, 'avg_score': 0, 'best_score': 0,
+        'weak_quizzes': 0, 'weak_score_sum': 0.0
+    }
+
+
+def apply_category_stats(analytics, category_stats):
+    """Set the derived UserAnalytics fields from per-category running sums"""
+    category_stats = {cat: stats for cat, stats in category_stats.items() if stats['quizzes'] > 0}
+    for stats in category_stats.values():
+        stats['avg_score'] = round(stats['score_sum'] / stats['quizzes'], 2)
+        stats['best_score'] = round(stats['best_score'], 2)
+
+    total_quizzes = sum(stats['quizzes'] for stats in category_stats.values())
+    score_sum = sum(stats['score_sum'] for stats in category_stats.values())
+    analytics.total_quizzes = total_quizzes
+    analytics.total_questions_answered = sum(stats['questions'] for stats in category_stats.values())
+    analytics.average_score = round(score_sum / total_quizzes, 2) if total_quizzes else 0.0
+    analytics.category_stats = category_stats
+
+    ordered = sorted(category_stats.items(), key=lambda item: item[1]['avg_score'])
+    analytics.worst_category = ordered[0][0] if ordered else ''
+    analytics.best_category = ordered[-1][0] if ordered else ''
+    return analytics
+
+
+def _locked_analytics(user_id, create=True):
+    if create:
+        try:
+            with transaction.atomic():
+                UserAnalytics.objects.get_or_create(user_id=user_id)
+        except IntegrityError:
+            # Created by a concurrent submission
+            pass
+    return UserAnalytics.objects.select_for_update().filter(user_id=user_id).first()
+
+
+def record_analytics(results, sign=1):
+    """
+    Add (sign=1) or remove (sign=-1) results from their users' analytics.
+    Results need quiz loaded (or cheap to load) for the category.
+    """
+    per_user = defaultdict(list)
+    for result in results:
+        per_user[result.user_id].append(result)
+
+    for user_id, user_results in per_user.items():
+        with transaction.atomic():
+            analytics = _locked_analytics(user_id, create=sign > 0)
+            if analytics is None:
+                # Nothing to remove from (e.g. the user is being deleted)
+                continue
+            category_stats = analytics.category_stats or {}
+            for result in user_results:
+                stats = category_stats.setdefault(result.quiz.category, _empty_stats())
+                # Rows written before running sums existed only had averages
+                stats.setdefault('questions', 0)
+                stats.setdefault('score_sum', stats.get('avg_score', 0) * stats.get('quizzes', 0))
+                stats.setdefault('weak_quizzes', 0)
+                stats.setdefault('weak_score_sum', 0.0)
+                stats['quizzes'] += sign
+                stats['questions'] += sign * (result.correct_count + result.wrong_count)
+                stats['score_sum'] += sign * result.score
+                if result.score < WEAK_SCORE:
+                    stats['weak_quizzes'] += sign
+                    stats['weak_score_sum'] += sign * result.score
+                if sign > 0:
+                    stats['best_score'] = max(stats.get('best_score', 0), result.score)
+            apply_category_stats(analytics, category_stats)
+            analytics.save(update_fields=[
+                'total_quizzes', 'total_questions_answered', 'average_score',
+                'best_category', 'worst_category', 'category_stats', 'last_updated'
+            ])
+        invalidate_user_analytics(user_id)
+
+
+def expected_category_stats(user_ids):
+    """{user_id: category_stats} computed from Result in one grouped query"""
+    expected = defaultdict(dict)
+    rows = (
+        Result.objects.filter(user_id__in=user_ids)
+        .values('user_id', 'quiz__category')
+        .annotate(
+            quizzes=Count('id'),
+            questions=Sum('correct_count') + Sum('wrong_count'),
+            score_sum=Sum('score'),
+            best_score=Max('score'),
+            weak_quizzes=Count('id', filter=Q(score__lt=WEAK_SCORE)),
+            weak_score_sum=Sum('score', filter=Q(score__lt=WEAK_SCORE))
+        )
+    )
+    for row in rows:
+        expected[row['user_id']][row['quiz__category']] = {
+            'quizzes': row['quizzes'],
+            'questions': row['questions'] or 0,
+            'score_sum': row['score_sum'] or 0.0,
+            'avg_score': 0,
+            'best_score': row['best_score'] or 0,
+            'weak_quizzes': row['weak_quizzes'],
+            'weak_score_sum': row['weak_score_sum'] or 0.0
+        }
+    return expected
+
+
+def rebuild_analytics(user_id):
+    """Recompute one user's analytics from scratch; returns the saved row"""
+    with transaction.atomic():
+        analytics = _locked_analytics(user_id)
+        apply_category_stats(analytics, expected_category_stats([user_id]).get(user_id, {}))
+        analytics.save()
+    invalidate_user_analytics(user_id)
+    return analytics
+
+
+def _token(key, known):
+    token = known.get(key)
+    if token is None:
+        token = uuid.uuid4().hex[:12]
+        if not cache.add(key, token, None):
+            token = cache.get(key, token)
+    return token
+
+
+def get_analytics_stamp(user_id):
+    """Current analytics stamp of a user (opaque string)"""
+    key = STAMP_KEY.format(user_id=user_id)
+    known = cache.get_many([key, EPOCH_KEY])
+    return _token(key, known) + _token(EPOCH_KEY, known)
+
+
+def invalidate_user_analytics(user_id):
+    """Move the user's stamp once the current transaction commits"""
+    transaction.on_commit(
+        lambda: cache.set(STAMP_KEY.format(user_id=user_id), uuid.uuid4().hex[:12], None)
+    )
+
+
+def invalidate_all_analytics():
+    """Move every user's stamp at once, for bulk changes such as streak expiry"""
+    cache.set(EPOCH_KEY, uuid.uuid4().hex[:12], None)
+
+
+def _build_payload(user):
+    analytics = UserAnalytics.objects.filter(user=user).first() or UserAnalytics(user=user)
+    category_stats = analytics.category_stats or {}
+    streak = Streak.objects.filter(user=user).values('current_streak', 'longest_streak').first() or {}
+    return {
+        'total_quizzes': analytics.total_quizzes,
+        'average_score': round(analytics.average_score, 2),
+        'category_stats': [
+            {'quiz__category': category, 'avg_score': stats['avg_score'], 'count': stats['quizzes']}
+            for category, stats in category_stats.items()
+        ],
+        'recent_scores': list(
+            Result.objects.filter(user=user).order_by('-date_taken').values_list('score', flat=True)[:5]
+        ),
+        'weak_topics': [
+            {
+                'quiz__category': category,
+                'count': stats['weak_quizzes'],
+                'avg_score': round(stats['weak_score_sum'] / stats['weak_quizzes'], 2)
+            }
+            for category, stats in category_stats.items() if stats.get('weak_quizzes')
+        ],
+        'current_streak': streak.get('current_streak', 0),
+        'longest_streak': streak.get('longest_streak', 0),
+        'badges': list(Badge.objects.filter(user=user).values('type', 'date_awarded')),
+        'user_name': user.username,
+    }
+
+
+def analytics_payload(user):
+    """Return (stamp, payload) for the analytics endpoint, cached per stamp"""
+    stamp = get_analytics_stamp(user.id)
+    key = PAYLOAD_KEY.format(user_id=user.id, stamp=stamp)
+    payload = cache.get(key)
+    if payload is None:
+        payload = _build_payload(user)
+        cache.set(key, payload, PAYLOAD_TIMEOUT)
+    return stamp, dict(payload, stamp=stamp)
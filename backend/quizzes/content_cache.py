@@ -0,0 +1,189 @@
+"""
+Per-quiz content caches used on the quiz-taking hot paths.
+
+Each quiz has a content version token kept in the shared cache. Anything
+derived from a quiz's questions is cached under that version, so bumping the
+token (on question save/delete or bulk imports) invalidates every process at
+once without having to delete individual entries.
+"""
+import gzip
+import threading
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from .models import Quiz, Question, UserAnswer
+from .serializers import QuestionSerializer
+
+VERSION_KEY = 'quiz:{quiz_id}:version'
+CONTENT_KEY = 'quiz:{quiz_id}:{name}:{version}'
+CACHE_TIMEOUT = 60 * 60 * 24
+
+# (name, quiz_id) -> (version, value) for this process
+_local_cache = {}
+_local_lock = threading.Lock()
+
+
+def get_content_version(quiz_id):
+    """Return the current content version token for a quiz"""
+    key = VERSION_KEY.format(quiz_id=quiz_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex[:12]
+        # Another process may have set it meanwhile; keep whichever won
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def invalidate_quiz(quiz_id):
+    """
+    Bump the content version so everything cached for the quiz is rebuilt,
+    once the current transaction commits: a bump before the commit lets a
+    concurrent read cache the old rows under the new version.
+    """
+    def bump():
+        cache.set(VERSION_KEY.format(quiz_id=quiz_id), uuid.uuid4().hex[:12], None)
+        with _local_lock:
+            for key in [k for k in _local_cache if k[1] == quiz_id]:
+                del _local_cache[key]
+
+    transaction.on_commit(bump)
+
+
+def _get_versioned(name, quiz_id, loader):
+    """
+    Return (version, value) for a derived per-quiz value. Looks in process
+    memory first, then in the shared cache, and only then calls loader().
+    Values are never mutated once built, so they can be shared freely.
+    """
+    version = get_content_version(quiz_id)
+    local = _local_cache.get((name, quiz_id))
+    if local is not None and local[0] == version:
+        return local
+
+    shared_key = CONTENT_KEY.format(quiz_id=quiz_id, name=name, version=version)
+    value = cache.get(shared_key)
+    if value is None:
+        value = loader()
+        if value is None:
+            return version, None
+        cache.set(shared_key, value, CACHE_TIMEOUT)
+
+    with _local_lock:
+        _local_cache[(name, quiz_id)] = (version, value)
+    return version, value
+
+
+def get_versioned_answer_key(quiz_id):
+    """
+    Return (version, answer_key) where answer_key is the ordered tuple of
+    (question_id, correct_option, option_count) of the quiz's questions.
+    """
+    # Named after its shape so entries cached as pairs are never read back
+    return _get_versioned('answer_key_options', quiz_id, lambda: tuple(
+        (question_id, correct_option, len(options or ()))
+        for question_id, correct_option, options in
+        Question.objects.filter(quiz_id=quiz_id).order_by('id').values_list('id', 'correct_option', 'options')
+    ))
+
+
+def get_answer_key(quiz_id):
+    return get_versioned_answer_key(quiz_id)[1]
+
+
+def get_question_payload(quiz_id):
+    """
+    Return {question_id: {...}} with the display fields of every question
+    of the quiz, for rendering result reviews.
+    """
+    return _get_versioned('question_payload', quiz_id, lambda: {
+        q['id']: q for q in Question.objects.filter(quiz_id=quiz_id).values(
+            'id', 'question_text', 'options', 'explanation', 'difficulty'
+        )
+    })[1]
+
+
+def _render_questions(quiz_id):
+    if not Quiz.objects.filter(pk=quiz_id).exists():
+        return None
+    questions = Question.objects.filter(quiz_id=quiz_id).select_related('subject').order_by('id')
+    body = JSONRenderer().render(QuestionSerializer(questions, many=True).data)
+    return body, gzip.compress(body)
+
+
+def get_rendered_questions(quiz_id):
+    """
+    Return (version, json_bytes, gzipped_bytes) for the questions endpoint
+    of a quiz, or None if the quiz does not exist.
+    """
+    version, rendered = _get_versioned('questions_json', quiz_id, lambda: _render_questions(quiz_id))
+    if rendered is None:
+        return None
+    return (version,) + rendered
+
+
+def grade_answers(answer_key, answers):
+    """
+    Grade submitted answers ({question_id: option}, keys as str or int)
+    against an answer key. Unanswered questions count as wrong.
+
+    Returns (correct_count, wrong_count, score, graded) where graded is a
+    list of [question_id, chosen_option or None, correct_option] in key
+    order; results keep it as their grading snapshot. Raises ValueError for
+    a choice that is not one of the question's options.
+    """
+    graded = []
+    correct_count = 0
+    total_questions = len(answer_key)
+
+    for question_id, correct_option, option_count in answer_key:
+        user_answer = answers.get(str(question_id))
+        if user_answer is None:
+            user_answer = answers.get(question_id)
+        chosen = int(user_answer) if user_answer is not None else None
+        if chosen is not None and not 0 <= chosen < option_count:
+            raise ValueError(f'Option {chosen} out of range for question {question_id}')
+        if chosen == correct_option:
+            correct_count += 1
+        graded.append([question_id, chosen, correct_option])
+
+    wrong_count = total_questions - correct_count
+    score = (correct_count / total_questions * 100) if total_questions > 0 else 0
+    return correct_count, wrong_count, score, graded
+
+
+def parse_answer_times(answer_times):
+    """
+    Normalise an optional {question_id: seconds} payload to {int: int},
+    dropping entries that are not non-negative numbers.
+    """
+    times = {}
+    if not isinstance(answer_times, dict):
+        return times
+    for question_id, seconds in answer_times.items():
+        try:
+            question_id, seconds = int(question_id), int(seconds)
+        except (TypeError, ValueError):
+            continue
+        if seconds >= 0:
+            times[question_id] = seconds
+    return times
+
+
+def build_user_answers(result, graded, times=None):
+    """Unsaved UserAnswer rows for a result, ready for bulk_create"""
+    times = times or {}
+    return [
+        UserAnswer(
+            result_id=result.id,
+            user_id=result.user_id,
+            question_id=question_id,
+            chosen_option=chosen,
+            is_correct=chosen == correct_option,
+            time_spent=times.get(question_id)
+        )
+        for question_id, chosen, correct_option in graded
+    ]
@@ -0,0 +1,117 @@
+"""
+Write-coalescing buffer for high-frequency counters.
+
+Taps on counters such as ForumPost.views and StudyMaterial.download_count
+are added up in process memory, keyed by (model, field, pk), instead of
+issuing one UPDATE each. Pending increments are written when
+COUNTER_BUFFER_MAX_PENDING taps have accumulated, by a timer
+COUNTER_BUFFER_FLUSH_SECONDS after the first pending tap, and at process
+exit. A flush is one UPDATE per (model, field) covering every pending row.
+
+Readers add pending(...) to the stored value so responses stay
+approximately current. Increments still buffered when a process is killed
+are lost, which is acceptable for view/download counts.
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+logger = logging.getLogger(__name__)
+
+
+class CounterBuffer:
+    def __init__(self):
+        self._pending = defaultdict(int)
+        self._taps = 0
+        self._lock = threading.Lock()
+        self._timer = None
+
+    @property
+    def flush_seconds(self):
+        return getattr(settings, 'COUNTER_BUFFER_FLUSH_SECONDS', 10)
+
+    @property
+    def max_pending(self):
+        return getattr(settings, 'COUNTER_BUFFER_MAX_PENDING', 500)
+
+    def increment(self, model, pk, field, amount=1):
+        """
+        Add to a counter and return how far the stored value is now behind
+        (pending increments including this one), so callers can show
+        stored + returned. Written directly when buffering is off.
+        """
+        if self.flush_seconds <= 0:
+            model.objects.filter(pk=pk).update(**{field: F(field) + amount})
+            return amount
+        with self._lock:
+            self._pending[(model, field, pk)] += amount
+            behind = self._pending[(model, field, pk)]
+            self._taps += 1
+            full = self._taps >= self.max_pending
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.flush_seconds, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+        return behind
+
+    def pending(self, model, pk, field):
+        """Increments of one counter not yet written to the database"""
+        return self._pending.get((model, field, pk), 0)
+
+    def flush(self):
+        """Write all pending increments; returns the number of rows updated"""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+            self._taps = 0
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return 0
+
+        grouped = defaultdict(dict)
+        for (model, field, pk), amount in pending.items():
+            grouped[(model, field)][pk] = amount
+        try:
+            with transaction.atomic():
+                for (model, field), amounts in grouped.items():
+                    model.objects.filter(pk__in=amounts).update(**{field: F(field) + Case(
+                        *[When(pk=pk, then=Value(amount)) for pk, amount in amounts.items()],
+                        default=Value(0), output_field=IntegerField()
+                    )})
+        except Exception:
+            # Put the increments back so the next flush retries them
+            with self._lock:
+                for key, amount in pending.items():
+                    self._pending[key] += amount
+            raise
+        return len(pending)
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        close_old_connections()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Counter buffer flush failed")
+        finally:
+            connection.close()
+
+
+counters = CounterBuffer()
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        counters.flush()
+    except Exception:
+        logger.exception("Counter buffer flush at exit failed")
@@ -0,0 +1,337 @@
+"""
+Push delivery of notifications, exam alerts and study reminders.
+
+A Delivery is one message to an audience. It is processed by the
+deliver_notifications command in two phases, so web workers only ever
+insert the Delivery row:
+
+1. Expansion: recipients are added as DeliveryRecipient rows, EXPAND_CHUNK
+   users per round in user id order (the audience is resolved then, not
+   when the Delivery is created).
+2. Sending: workers claim up to the transport's batch size of due
+   recipients of one delivery with a conditional UPDATE, hand them to the
+   transport in a single send and record the per-recipient outcome.
+   Failures are retried with exponential backoff up to MAX_ATTEMPTS.
+
+Transports are configured like CACHES:
+
+    DELIVERY_TRANSPORTS = {
+        'default': {
+            'BACKEND': 'quizzes.delivery.FileTransport',
+            'RATE_PER_SECOND': 1000,
+            'BATCH_SIZE': 500,
+            'OPTIONS': {'path': '/var/log/psc/push.jsonl'},
+        },
+    }
+
+and every send waits on the transport's rate limiter (per process).
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .local_time import local_tz
+from .models import Delivery, DeliveryRecipient
+
+logger = logging.getLogger(__name__)
+
+EXPAND_CHUNK = 5000
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = timedelta(seconds=30)
+BACKOFF_MAX = timedelta(hours=1)
+# Recipients claimed by a worker that died are retried after this long
+LOCK_TIMEOUT = timedelta(minutes=5)
+REMINDER_WINDOW_MINUTES = 5
+
+
+# Transports
+
+class RateLimiter:
+    """Token bucket shared by the threads of one process"""
+
+    def __init__(self, rate_per_second):
+        self.rate = float(rate_per_second or 0)
+        self.allowance = self.rate
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, count=1):
+        """Block until `count` messages may be sent"""
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate)
+            self.last = now
+            self.allowance -= count
+            wait = -self.allowance / self.rate if self.allowance < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class Transport:
+    """
+    Sends one message to a batch of users. send() returns {user_id: error}
+    for the recipients that failed; raising fails the whole batch.
+    """
+    batch_size = 500
+
+    def __init__(self, name, rate_per_second=0, batch_size=None, **options):
+        self.name = name
+        self.rate_limiter = RateLimiter(rate_per_second)
+        if batch_size:
+            self.batch_size = batch_size
+
+    def send(self, message, user_ids):
+        raise NotImplementedError
+
+
+class LoopbackTransport(Transport):
+    """Keeps sent batches in memory; for tests and local development"""
+
+    def __init__(self, name, **kwargs):
+        super().__init__(name, **kwargs)
+        self.sent = []
+        self.fail_users = {}
+
+    def send(self, message, user_ids):
+        self.sent.append((message, list(user_ids)))
+        return {user_id: self.fail_users[user_id] for user_id in user_ids if user_id in self.fail_users}
+
+
+class FileTransport(Transport):
+    """Appends one JSON line per batch to a file"""
+
+    def __init__(self, name, path='push-deliveries.jsonl', **kwargs):
+        super().__init__(name, **kwargs)
+        self.path = path
+        self.lock = threading.Lock()
+
+    def send(self, message, user_ids):
+        line = json.dumps({'message': message, 'user_ids': list(user_ids), 'sent_at': timezone.now().isoformat()})
+        with self.lock, open(self.path, 'a', encoding='utf-8') as log:
+            log.write(line + '\n')
+        return {}
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(name='default'):
+    """Configured transport instance, one per process"""
+    with _transports_lock:
+        if name not in _transports:
+            config = settings.DELIVERY_TRANSPORTS[name]
+            _transports[name] = import_string(config['BACKEND'])(
+                name,
+                rate_per_second=config.get('RATE_PER_SECOND', 0),
+                batch_size=config.get('BATCH_SIZE'),
+                **config.get('OPTIONS', {})
+            )
+        return _transports[name]
+
+
+def reset_transports():
+    with _transports_lock:
+        _transports.clear()
+
+
+# Creating deliveries
+
+def deliver_notification(notification, transport='default'):
+    """Queue a push of a notification to everyone who can see it (once)"""
+    kind = 'exam' if notification.notification_type == 'exam' else 'notification'
+    delivery, _ = Delivery.objects.get_or_create(
+        dedupe_key=f'notification:{notification.pk}:{transport}',
+        defaults={
+            'kind': kind, 'notification': notification, 'transport': transport,
+            'title': notification.title, 'message': notification.message,
+            'audience': {'type': 'notification'},
+        }
+    )
+    return delivery
+
+
+def reminder_window(now=None):
+    """(day, start, end) Nepal local times of the reminder window containing now"""
+    now = timezone.localtime(now or timezone.now(), local_tz())
+    minute = now.minute - now.minute % REMINDER_WINDOW_MINUTES
+    start = now.replace(minute=minute, second=0, microsecond=0)
+    return now.date(), start.time(), (start + timedelta(minutes=REMINDER_WINDOW_MINUTES)).time()
+
+
+def queue_due_reminders(now=None, transport='default'):
+    """
+    Queue the study reminder for users whose reminder_time falls in the
+    current window. Safe to call any number of times per window.
+    """
+    day, start, end = reminder_window(now)
+    _, created = Delivery.objects.get_or_create(
+        dedupe_key=f'reminder:{day.isoformat()}T{start.strftime("%H:%M")}:{transport}',
+        defaults={
+            'kind': 'reminder', 'transport': transport,
+            'title': 'Time to practice',
+            'message': "Keep your streak going - take today's quiz.",
+            'audience': {'type': 'reminder', 'day': day.isoformat(),
+                         'from': start.isoformat(), 'to': end.isoformat()},
+        }
+    )
+    return created
+
+
+def audience_users(delivery):
+    """Queryset of the users a delivery goes to"""
+    users = User.objects.filter(is_active=True).exclude(preferences__notifications_enabled=False)
+    audience = delivery.audience
+    if audience.get('type') == 'notification':
+        notification = delivery.notification
+        if notification is None or not notification.is_active:
+            return users.none()
+        if not notification.is_broadcast:
+            users = users.filter(notification=notification)
+    elif audience.get('type') == 'reminder':
+        start = datetime.strptime(audience['from'], '%H:%M:%S').time()
+        end = datetime.strptime(audience['to'], '%H:%M:%S').time()
+        in_window = Q(preferences__reminder_time__gte=start)
+        # The last window of the day ends at midnight
+        if end > start:
+            in_window &= Q(preferences__reminder_time__lt=end)
+        # Users who already studied that day need no reminder
+        users = users.filter(in_window).exclude(streak__last_active_date=audience['day'])
+    return users
+
+
+# Processing
+
+def expand(delivery, chunk=EXPAND_CHUNK):
+    """Add the next chunk of recipients; returns the number added"""
+    user_ids = list(
+        audience_users(delivery).filter(id__gt=delivery.expanded_until)
+        .order_by('id').values_list('id', flat=True)[:chunk]
+    )
+    done = len(user_ids) < chunk
+    with transaction.atomic():
+        # Only one worker may advance the cursor from this position
+        advanced = Delivery.objects.filter(
+            pk=delivery.pk, status='expanding', expanded_until=delivery.expanded_until
+        ).update(
+            expanded_until=user_ids[-1] if user_ids else delivery.expanded_until,
+            total_recipients=F('total_recipients') + len(user_ids),
+            status='sending' if done else 'expanding'
+        )
+        if not advanced:
+            return 0
+        DeliveryRecipient.objects.bulk_create(
+            [DeliveryRecipient(delivery=delivery, user_id=user_id) for user_id in user_ids],
+            batch_size=1000, ignore_conflicts=True
+        )
+    if done:
+        _finish_if_complete(delivery.pk)
+    return len(user_ids)
+
+
+def _claimable(now):
+    return (
+        Q(status='pending', available_at__lte=now) |
+        Q(status='sending', claimed_at__lt=now - LOCK_TIMEOUT)
+    )
+
+
+def claim_batch(transport):
+    """
+    Claim up to transport.batch_size due recipients of a single delivery.
+    Returns (delivery, recipients) or (None, []).
+    """
+    now = timezone.now()
+    due = DeliveryRecipient.objects.filter(_claimable(now), delivery__transport=transport.name)
+    delivery_id = due.order_by('available_at').values_list('delivery_id', flat=True).first()
+    if delivery_id is None:
+        return None, []
+    candidates = list(due.filter(delivery_id=delivery_id).values_list('id', flat=True)[:transport.batch_size])
+    token = uuid.uuid4().hex
+    # One conditional UPDATE; rows a concurrent worker got first no longer match
+    DeliveryRecipient.objects.filter(_claimable(now), pk__in=candidates).update(
+        status='sending', claim=token, claimed_at=now, attempts=F('attempts') + 1
+    )
+    recipients = list(DeliveryRecipient.objects.filter(claim=token))
+    delivery = Delivery.objects.get(pk=delivery_id) if recipients else None
+    return delivery, recipients
+
+
+def backoff(attempts):
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+def _finish_if_complete(delivery_id):
+    unfinished = DeliveryRecipient.objects.filter(delivery_id=delivery_id, status__in=['pending', 'sending'])
+    if not unfinished.exists():
+        Delivery.objects.filter(pk=delivery_id, status='sending').update(status='done')
+
+
+def send_batch(transport, delivery, recipients):
+    """Send one claimed batch and record the outcome of every recipient"""
+    message = {
+        'delivery': delivery.pk,
+        'kind': delivery.kind,
+        'notification': delivery.notification_id,
+        'title': delivery.title,
+        'message': delivery.message,
+    }
+    user_ids = [r.user_id for r in recipients]
+    transport.rate_limiter.acquire(len(user_ids))
+    try:
+        errors = transport.send(message, user_ids)
+    except Exception as exc:
+        logger.exception("Transport %s failed delivery %s", transport.name, delivery.pk)
+        errors = {user_id: repr(exc) for user_id in user_ids}
+
+    now = timezone.now()
+    sent = [r.pk for r in recipients if r.user_id not in errors]
+    retry, failed = {}, {}
+    for r in recipients:
+        if r.user_id in errors:
+            target = failed if r.attempts >= MAX_ATTEMPTS else retry
+            target.setdefault((r.attempts, str(errors[r.user_id])[:500]), []).append(r.pk)
+
+    with transaction.atomic():
+        DeliveryRecipient.objects.filter(pk__in=sent).update(status='sent', sent_at=now, claim='', last_error='')
+        for (attempts, error), pks in retry.items():
+            DeliveryRecipient.objects.filter(pk__in=pks).update(
+                status='pending', claim='', available_at=now + backoff(attempts), last_error=error
+            )
+        for (attempts, error), pks in failed.items():
+            DeliveryRecipient.objects.filter(pk__in=pks).update(status='failed', claim='', last_error=error)
+        Delivery.objects.filter(pk=delivery.pk).update(
+            sent_count=F('sent_count') + len(sent),
+            failed_count=F('failed_count') + sum(len(pks) for pks in failed.values())
+        )
+    _finish_if_complete(delivery.pk)
+    return len(sent)
+
+
+def process_deliveries(transport_names=None):
+    """
+    One round of work: expand one chunk of every expanding delivery and
+    send one batch per transport. Returns the number of rows handled.
+    """
+    handled = 0
+    for delivery in Delivery.objects.filter(status='expanding'):
+        handled += expand(delivery)
+    for name in transport_names or settings.DELIVERY_TRANSPORTS:
+        transport = get_transport(name)
+        delivery, recipients = claim_batch(transport)
+        if recipients:
+            send_batch(transport, delivery, recipients)
+            handled += len(recipients)
+    return handled
@@ -0,0 +1,116 @@
+"""
+Durable, database-backed event queue for work that should not run inside
+the request. Views enqueue events in the same transaction as the rows they
+describe; the run_workers management command claims and applies them.
+
+Handlers may run more than once for the same event (worker crash, retry),
+so they must be idempotent.
+"""
+import traceback
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .analytics import invalidate_user_analytics
+from .models import QueuedEvent, Result
+from .achievements import evaluate_achievements, record_result_counters
+from .gamification import update_user_streak
+from .local_time import local_date
+
+MAX_ATTEMPTS = 5
+# A claimed event whose worker died is retried after this long
+LOCK_TIMEOUT = timedelta(minutes=5)
+
+HANDLERS = {}
+
+
+def handler(event_type):
+    """Register a function as the handler of an event type"""
+    def register(func):
+        HANDLERS[event_type] = func
+        return func
+    return register
+
+
+def enqueue(event_type, user, payload=None):
+    return QueuedEvent.objects.create(event_type=event_type, user=user, payload=payload or {})
+
+
+def _claimable(now):
+    return (
+        Q(status='pending', available_at__lte=now) |
+        Q(status='processing', locked_at__lt=now - LOCK_TIMEOUT)
+    )
+
+
+def claim_events(limit=50):
+    """
+    Claim up to `limit` due events for this worker. Each claim is a
+    conditional UPDATE, so concurrent workers never get the same event.
+    """
+    now = timezone.now()
+    candidates = list(
+        QueuedEvent.objects.filter(_claimable(now))
+        .order_by('available_at')
+        .values_list('id', flat=True)[:limit]
+    )
+    claimed = [
+        pk for pk in candidates
+        if QueuedEvent.objects.filter(_claimable(now), pk=pk).update(
+            status='processing', locked_at=now, attempts=F('attempts') + 1
+        )
+    ]
+    return list(QueuedEvent.objects.filter(pk__in=claimed).select_related('user'))
+
+
+def process_event(event):
+    """Apply one claimed event. Returns True when it succeeded."""
+    try:
+        with transaction.atomic():
+            HANDLERS[event.event_type](event)
+            event.delete()
+        return True
+    except Exception:
+        event.last_error = traceback.format_exc()[-2000:]
+        if event.attempts >= MAX_ATTEMPTS:
+            event.status = 'failed'
+        else:
+            event.status = 'pending'
+            event.available_at = timezone.now() + timedelta(seconds=2 ** event.attempts)
+        event.locked_at = None
+        event.save(update_fields=['status', 'available_at', 'locked_at', 'last_error'])
+        return False
+
+
+def process_pending_events(limit=50):
+    """Claim and process one batch. Returns the number of events handled."""
+    events = claim_events(limit)
+    for event in events:
+        process_event(event)
+    return len(events)
+
+
+@handler('results_submitted')
+def apply_results_submitted(event):
+    """Achievement counters, streak, badges and achievements for newly submitted results"""
+    results = list(
+        Result.objects.filter(id__in=event.payload.get('result_ids', []))
+        .select_related('quiz')
+        .only('id', 'user_id', 'score', 'date_taken', 'quiz__category')
+    )
+    if not results:
+        return
+    # Counted in the same transaction as the event's deletion, so exactly once
+    record_result_counters(results)
+    update_user_streak(event.user, {local_date(result.date_taken) for result in results})
+    evaluate_achievements(event.user_id)
+    invalidate_user_analytics(event.user_id)
+
+
+@handler('counters_changed')
+def apply_counters_changed(event):
+    """Bookmark/report counters moved; award anything they unlocked"""
+    evaluate_achievements(event.user_id)
+    invalidate_user_analytics(event.user_id)
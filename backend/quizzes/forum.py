@@ -0,0 +1,161 @@
+"""
+Denormalized forum counters.
+
+ForumPost.comment_count and like_count and ForumComment.like_count are
+stored columns so listings never COUNT per row. Comment creation and
+deletion move comment_count by one (signals); the like endpoints toggle a
+single row of the likes table and move like_count by one in the same
+transaction. Likes changed any other way (admin, .add()/.remove()) are
+recounted for the affected rows. The reconcile_forum_counters command
+repairs any drift.
+
+Comment threads are stored as materialized paths (ForumComment.path, one
+zero-padded id segment per level), so a whole thread, or a page of
+top-level comments with their replies, is one range scan on the
+(post, path) index, already in display order; thread() returns it and
+build_tree() nests it in a single pass.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import ForumComment, ForumPost
+
+MAX_COMMENT_DEPTH = 20
+THREAD_PAGE_SIZE = 20
+MAX_THREAD_PAGE_SIZE = 100
+
+
+def _likes_table(model):
+    """(through model, name of its FK to `model`)"""
+    return model.likes.through, model.likes.field.m2m_field_name()
+
+
+def liked_by(model, user):
+    """Exists() expression for annotating whether `user` liked each row"""
+    through, source = _likes_table(model)
+    return Exists(through.objects.filter(**{source: OuterRef('pk')}, user_id=user.id))
+
+
+def toggle_like(obj, user):
+    """
+    Like or unlike a post or comment: one indexed delete or insert plus one
+    counter UPDATE. Returns (liked, like_count).
+    """
+    model = type(obj)
+    through, source = _likes_table(model)
+    with transaction.atomic():
+        if through.objects.filter(**{source: obj.pk}, user_id=user.id).delete()[0]:
+            liked, delta = False, -1
+        else:
+            try:
+                with transaction.atomic():
+                    through.objects.create(**{f'{source}_id': obj.pk}, user_id=user.id)
+                liked, delta = True, 1
+            except IntegrityError:
+                # A concurrent request liked it first
+                liked, delta = True, 0
+        if delta:
+            model.objects.filter(pk=obj.pk).update(like_count=F('like_count') + delta)
+    return liked, obj.like_count + delta
+
+
+def bump_comment_count(post_id, delta):
+    ForumPost.objects.filter(pk=post_id).update(comment_count=F('comment_count') + delta)
+
+
+def actual_like_count(model):
+    through, source = _likes_table(model)
+    likes = through.objects.filter(**{source: OuterRef('pk')}).order_by().values(source)
+    return Coalesce(Subquery(likes.annotate(n=Count('*')).values('n')), Value(0))
+
+
+def actual_comment_count():
+    comments = ForumComment.objects.filter(post=OuterRef('pk')).order_by().values('post')
+    return Coalesce(Subquery(comments.annotate(n=Count('*')).values('n')), Value(0))
+
+
+def actual_reply_count():
+    replies = ForumComment.objects.filter(parent_comment=OuterRef('pk')).order_by().values('parent_comment')
+    return Coalesce(Subquery(replies.annotate(n=Count('*')).values('n')), Value(0))
+
+
+def recount_likes(model, ids):
+    """Set like_count of the given posts or comments from the likes table"""
+    model.objects.filter(pk__in=ids).update(like_count=actual_like_count(model))
+
+
+def recount_comments(post_ids):
+    ForumPost.objects.filter(pk__in=post_ids).update(comment_count=actual_comment_count())
+
+
+# Comment threads
+
+def path_segment(comment_id):
+    return f'{comment_id:010d}/'
+
+
+def subtree_end(path):
+    """Exclusive upper bound of the paths under `path` ('/' sorts just before '0')"""
+    return path[:-1] + '0'
+
+
+def place_comment(comment):
+    """Set path and depth of a new comment and count it as a reply of its parent"""
+    parent = comment.parent_comment
+    comment.path = (parent.path if parent else '') + path_segment(comment.pk)
+    comment.depth = parent.depth + 1 if parent else 0
+    ForumComment.objects.filter(pk=comment.pk).update(path=comment.path, depth=comment.depth)
+    if parent:
+        ForumComment.objects.filter(pk=parent.pk).update(reply_count=F('reply_count') + 1)
+
+
+def thread(post_id, user, after=None, limit=THREAD_PAGE_SIZE, max_depth=MAX_COMMENT_DEPTH, root=None):
+    """
+    Return (comments, next_after): in one query, up to `limit` top-level
+    comments of a post after the top-level comment id `after`, each with
+    its replies up to `max_depth` levels below it, in path order. With
+    `root` (a comment) the thread is that comment and its replies instead.
+    """
+    comments = (
+        ForumComment.objects.filter(post_id=post_id)
+        .select_related('author')
+        .annotate(is_liked=liked_by(ForumComment, user))
+        .order_by('path')
+    )
+    if root is not None:
+        comments = comments.filter(
+            path__gte=root.path, path__lt=subtree_end(root.path), depth__lte=root.depth + max_depth
+        )
+        return list(comments), None
+
+    roots = ForumComment.objects.filter(post_id=post_id, depth=0).order_by('path')
+    if after is not None:
+        roots = roots.filter(path__gt=path_segment(after))
+    first = Subquery(roots.values('path')[:1])
+    # The first root of the next page ends the range; it is fetched as a sentinel
+    following = Subquery(roots.values('path')[limit:limit + 1])
+    comments = list(comments.filter(
+        depth__lte=max_depth, path__gte=first, path__lte=Coalesce(following, Value('~'))
+    ))
+
+    next_after = None
+    if sum(1 for comment in comments if comment.depth == 0) > limit:
+        comments.pop()
+        next_after = next(comment.id for comment in reversed(comments) if comment.depth == 0)
+    return comments, next_after
+
+
+def build_tree(nodes):
+    """
+    Nest serialized comments (in path order) under their parents in one
+    pass; nodes whose parent is not in the list become roots.
+    """
+    by_id = {}
+    roots = []
+    for node in nodes:
+        node['replies'] = []
+        by_id[node['id']] = node
+        parent = by_id.get(node['parent_comment'])
+        (parent['replies'] if parent else roots).append(node)
+    return roots
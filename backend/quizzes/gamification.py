@@ -0,0 +1,58 @@
+"""
+Streak side effects of quiz submissions. Badges and achievements are
+declared as rules in achievements.py.
+
+These run from the background event workers (see events.py), so each
+function must be safe to apply more than once for the same result.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .achievements import raise_longest_streak
+from .activity import mark_active, streak_summary
+from .local_time import local_date
+from .models import Streak
+
+# Cached list of user ids whose streak is at risk on a given local day
+AT_RISK_KEY = 'streaks:at_risk:{day}'
+
+
+def update_user_streak(user, activity_dates=None):
+    """
+    Record quiz activity on activity_dates (default today, Nepal time) in
+    the user's activity calendar and recompute the streak from its bits.
+    Offline results synced late fill their own day, so gaps can heal.
+
+    The user's Streak row is locked first, so concurrent workers for the
+    same user apply one after the other and longest_streak never goes down.
+    """
+    today = local_date()
+    with transaction.atomic():
+        Streak.objects.get_or_create(user=user)
+        streak = Streak.objects.select_for_update().get(user=user)
+        mark_active(user.id, activity_dates or [today])
+        current, longest, last_active = streak_summary(user.id, today)
+        Streak.objects.filter(pk=streak.pk).update(
+            current_streak=current,
+            longest_streak=Greatest(F('longest_streak'), longest),
+            last_active_date=last_active
+        )
+        raise_longest_streak(user.id, max(streak.longest_streak, longest))
+
+
+def expire_streaks(today=None):
+    """
+    Zero every current streak whose last activity is before yesterday
+    (Nepal time) in one UPDATE; returns the number of streaks expired.
+    """
+    yesterday = (today or local_date()) - timedelta(days=1)
+    return Streak.objects.filter(current_streak__gt=0, last_active_date__lt=yesterday).update(current_streak=0)
+
+
+def streaks_at_risk(today=None):
+    """User ids whose streak ends tonight unless they take a quiz today"""
+    yesterday = (today or local_date()) - timedelta(days=1)
+    return Streak.objects.filter(current_streak__gt=0, last_active_date=yesterday).values_list('user_id', flat=True)
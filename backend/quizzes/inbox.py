@@ -0,0 +1,181 @@
+"""
+Per-user notification inbox.
+
+Targeted notifications are fanned out on write: adding target users
+creates one InboxItem per user in bulk and bumps their unread counters.
+Broadcasts (no target users) are not copied; they stay one shared stream
+that listings merge with the user's inbox by notification id. Broadcast
+read state is a per-user watermark (everything up to an id is read) plus
+InboxItem read marks for broadcasts read individually above it.
+
+Listings page by notification id (?before=<id>), newest first. New
+notifications are also pushed to connected clients (quizzes/live.py).
+"""
+import heapq
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import live
+from .models import InboxItem, Notification, NotificationState
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+
+def ensure_states(user_ids):
+    NotificationState.objects.bulk_create(
+        [NotificationState(user_id=user_id) for user_id in user_ids], ignore_conflicts=True
+    )
+
+
+def live_payload(notification):
+    return {
+        'id': notification.id,
+        'title': notification.title,
+        'message': notification.message,
+        'notification_type': notification.notification_type,
+        'timestamp': notification.timestamp,
+    }
+
+
+def announce_broadcast(notification_id):
+    """Push a notification to every connected client if it is still a broadcast"""
+    notification = Notification.objects.filter(pk=notification_id, is_broadcast=True, is_active=True).first()
+    if notification is not None:
+        live.publish(live.BROADCAST_TOPIC, 'notification', live_payload(notification))
+
+
+def fan_out(notification, user_ids):
+    """Deliver a targeted notification to users' inboxes"""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    existing = set(
+        InboxItem.objects.filter(notification=notification, user_id__in=user_ids).values_list('user_id', flat=True)
+    )
+    new_ids = user_ids - existing
+    with transaction.atomic():
+        InboxItem.objects.bulk_create(
+            [InboxItem(user_id=user_id, notification=notification) for user_id in new_ids],
+            batch_size=1000, ignore_conflicts=True
+        )
+        if notification.is_broadcast:
+            Notification.objects.filter(pk=notification.pk).update(is_broadcast=False)
+            notification.is_broadcast = False
+            # Read marks left from its broadcast days would read as deliveries
+            targets = Notification.target_users.through.objects.filter(notification=notification).values('user_id')
+            InboxItem.objects.filter(notification=notification).exclude(user_id__in=targets).delete()
+        if notification.is_active and new_ids:
+            ensure_states(new_ids)
+            NotificationState.objects.filter(user_id__in=new_ids).update(unread_count=F('unread_count') + 1)
+            live.publish([live.user_topic(user_id) for user_id in new_ids], 'notification', live_payload(notification))
+
+
+def recount_unread(user_ids):
+    """Recompute unread counters of the given users in one UPDATE"""
+    ensure_states(user_ids)
+    unread = (
+        InboxItem.objects.filter(
+            user_id=OuterRef('user_id'), read_at__isnull=True,
+            notification__is_active=True, notification__is_broadcast=False
+        )
+        .values('user_id')
+        .annotate(n=Count('id'))
+        .values('n')
+    )
+    NotificationState.objects.filter(user_id__in=user_ids).update(
+        unread_count=Coalesce(Subquery(unread), Value(0))
+    )
+
+
+def sync_broadcast_flag(notification_ids):
+    """A notification is a broadcast exactly while it has no target users"""
+    targeted = set(
+        Notification.target_users.through.objects.filter(notification_id__in=notification_ids)
+        .values_list('notification_id', flat=True)
+    )
+    Notification.objects.filter(pk__in=set(notification_ids) - targeted).update(is_broadcast=True)
+
+
+def _state(user):
+    try:
+        return NotificationState.objects.get(user=user)
+    except NotificationState.DoesNotExist:
+        ensure_states([user.id])
+        return NotificationState.objects.get(user=user)
+
+
+def unread_count(user):
+    """Unread targeted notifications (from the counter) plus unread broadcasts"""
+    state = _state(user)
+    newer = Notification.objects.filter(is_broadcast=True, is_active=True, id__gt=state.broadcasts_read_until)
+    read = InboxItem.objects.filter(
+        user=user, read_at__isnull=False, notification__in=newer
+    )
+    return state.unread_count + newer.count() - read.count()
+
+
+def mark_read(user, notification_id):
+    """Mark one notification read; returns False if the user cannot see it"""
+    notification = Notification.objects.filter(pk=notification_id, is_active=True).first()
+    if notification is None:
+        return False
+    now = timezone.now()
+    if not notification.is_broadcast:
+        with transaction.atomic():
+            updated = InboxItem.objects.filter(user=user, notification=notification, read_at__isnull=True).update(read_at=now)
+            if updated:
+                NotificationState.objects.filter(user=user).update(unread_count=F('unread_count') - 1)
+        return updated or InboxItem.objects.filter(user=user, notification=notification).exists()
+    if notification.id > _state(user).broadcasts_read_until:
+        InboxItem.objects.update_or_create(user=user, notification=notification, defaults={'read_at': now})
+    return True
+
+
+def mark_all_read(user):
+    now = timezone.now()
+    latest = Notification.objects.filter(is_broadcast=True).order_by('-id').values_list('id', flat=True).first()
+    with transaction.atomic():
+        InboxItem.objects.filter(user=user, read_at__isnull=True).update(read_at=now)
+        ensure_states([user.id])
+        NotificationState.objects.filter(user=user).update(
+            unread_count=0, broadcasts_read_until=latest or 0
+        )
+
+
+def page(user, before=None, limit=PAGE_SIZE):
+    """
+    Return (entries, next_before): up to `limit` visible notifications
+    newest first as (notification, is_read) pairs. Anonymous users see
+    broadcasts only, all unread.
+    """
+    broadcasts = Notification.objects.filter(is_broadcast=True, is_active=True)
+    if before is not None:
+        broadcasts = broadcasts.filter(id__lt=before)
+    broadcasts = list(broadcasts.order_by('-id')[:limit])
+
+    if not user.is_authenticated:
+        entries = [(n, False) for n in broadcasts]
+    else:
+        items = InboxItem.objects.filter(
+            user=user, notification__is_active=True, notification__is_broadcast=False
+        ).select_related('notification')
+        if before is not None:
+            items = items.filter(notification_id__lt=before)
+        targeted = [(item.notification, item.read_at is not None) for item in items.order_by('-notification_id')[:limit]]
+
+        watermark = _state(user).broadcasts_read_until
+        marked = set(
+            InboxItem.objects.filter(
+                user=user, read_at__isnull=False,
+                notification_id__in=[n.id for n in broadcasts if n.id > watermark]
+            ).values_list('notification_id', flat=True)
+        )
+        shared = [(n, n.id <= watermark or n.id in marked) for n in broadcasts]
+        entries = list(heapq.merge(targeted, shared, key=lambda entry: -entry[0].id))[:limit]
+
+    next_before = entries[-1][0].id if len(entries) == limit else None
+    return entries, next_before
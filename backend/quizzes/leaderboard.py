@@ -0,0 +1,162 @@
+"""
+Materialized leaderboard totals.
+
+Every result adds its score to LeaderboardAggregate rows keyed by
+(user, scope, bucket): scope is 'global' plus the quiz category, bucket is
+all-time plus the Nepal-time day, week (Sunday to Saturday, as the week
+runs in Nepal) and month the result was taken in. Calendar periods read one bucket from a pre-sorted index; rolling
+windows (last 7/30 days) sum the per-day buckets. Top lists are cached
+until the end of their bucket, at most LEADERBOARD_CACHE_SECONDS.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .local_time import local_date, next_boundary, start_of_week
+from .models import LeaderboardAggregate
+
+GLOBAL_SCOPE = 'global'
+ALL_TIME = 'all'
+ROLLING_PERIODS = {'last_7_days': 7, 'last_30_days': 30}
+SNAPSHOT_KEY = 'leaderboard:{scope}:{bucket}:{limit}'
+
+
+def day_bucket(day):
+    return f'day:{day.isoformat()}'
+
+
+def week_bucket(day):
+    """Named after the week's Sunday"""
+    return f'week:{start_of_week(day).isoformat()}'
+
+
+def month_bucket(day):
+    return f'month:{day.year}-{day.month:02d}'
+
+
+def buckets_for_day(day):
+    """All buckets a result taken on `day` counts towards"""
+    return [ALL_TIME, day_bucket(day), week_bucket(day), month_bucket(day)]
+
+
+def buckets_for(moment):
+    return buckets_for_day(local_date(moment))
+
+
+def period_bucket(period, now=None):
+    """Bucket for a calendar ?period= value; unknown periods mean all-time"""
+    day = local_date(now)
+    if period == 'daily':
+        return day_bucket(day)
+    if period == 'weekly':
+        return week_bucket(day)
+    if period == 'monthly':
+        return month_bucket(day)
+    return ALL_TIME
+
+
+def record_results(results, sign=1):
+    """
+    Add (sign=1) or remove (sign=-1) results from the aggregates. Rows are
+    changed with single-statement F() updates so concurrent submissions of
+    the same user never lose an increment.
+    """
+    deltas = defaultdict(lambda: [0.0, 0])
+    for result in results:
+        for scope in (GLOBAL_SCOPE, result.quiz.category):
+            for bucket in buckets_for(result.date_taken):
+                delta = deltas[(result.user_id, scope, bucket)]
+                delta[0] += sign * result.score
+                delta[1] += sign
+
+    for (user_id, scope, bucket), (score, count) in deltas.items():
+        _apply_delta(user_id, scope, bucket, score, count)
+    if sign < 0:
+        LeaderboardAggregate.objects.filter(
+            user_id__in={user_id for user_id, _, _ in deltas}, quizzes_taken__lte=0
+        ).delete()
+
+
+def _apply_delta(user_id, scope, bucket, score, count):
+    rows = LeaderboardAggregate.objects.filter(user_id=user_id, scope=scope, bucket=bucket)
+    if rows.update(total_score=F('total_score') + score, quizzes_taken=F('quizzes_taken') + count):
+        return
+    if count <= 0:
+        return
+    try:
+        with transaction.atomic():
+            LeaderboardAggregate.objects.create(
+                user_id=user_id, scope=scope, bucket=bucket, total_score=score, quizzes_taken=count
+            )
+    except IntegrityError:
+        # A concurrent submission created the row first
+        rows.update(total_score=F('total_score') + score, quizzes_taken=F('quizzes_taken') + count)
+
+
+def board(scope, period, now=None):
+    """
+    Values queryset of {user_id, username, score, quizzes} for one
+    leaderboard. Calendar periods read a single bucket; rolling windows sum
+    the per-day buckets of the last N local days (today included).
+    """
+    rows = LeaderboardAggregate.objects.filter(scope=scope, quizzes_taken__gt=0)
+    if period in ROLLING_PERIODS:
+        today = local_date(now)
+        days = [day_bucket(today - timedelta(days=n)) for n in range(ROLLING_PERIODS[period])]
+        return (
+            rows.filter(bucket__in=days)
+            .values('user_id', username=F('user__username'))
+            .annotate(score=Sum('total_score'), quizzes=Sum('quizzes_taken'))
+        )
+    return rows.filter(bucket=period_bucket(period, now)).values(
+        'user_id', username=F('user__username'), score=F('total_score'), quizzes=F('quizzes_taken')
+    )
+
+
+def _snapshot_timeout(period, now):
+    """Seconds until the snapshot must go: bucket end or the staleness limit"""
+    timeout = getattr(settings, 'LEADERBOARD_CACHE_SECONDS', 60)
+    if period in ('daily', 'weekly', 'monthly') or period in ROLLING_PERIODS:
+        until_boundary = (next_boundary(period, local_date(now)) - now).total_seconds()
+        timeout = min(timeout, until_boundary)
+    return max(1, int(timeout))
+
+
+def top_entries(scope, period, limit=50, now=None):
+    """Cached top `limit` rows of a leaderboard, best first (ties by user id)"""
+    now = now or timezone.now()
+    bucket = period_bucket(period, now)
+    if period in ROLLING_PERIODS:
+        bucket = f'{period}:{local_date(now).isoformat()}'
+    key = SNAPSHOT_KEY.format(scope=scope, bucket=bucket, limit=limit)
+    entries = cache.get(key)
+    if entries is None:
+        entries = list(board(scope, period, now).order_by('-score', 'user_id')[:limit])
+        cache.set(key, entries, _snapshot_timeout(period, now))
+    return entries
+
+
+def rank_window(scope, period, user_id, window=5, now=None):
+    """
+    Return (first_rank, rows): the user's row with up to `window` neighbours
+    on each side and the exact rank of rows[0], or (None, []) if the user
+    has no entry. Uses the same order as top_entries; for calendar periods
+    every lookup is a range scan on the (scope, bucket, -total_score) index.
+    """
+    rows = board(scope, period, now)
+    mine = list(rows.filter(user_id=user_id)[:1])
+    if not mine:
+        return None, []
+    me = mine[0]
+
+    ahead = Q(score__gt=me['score']) | Q(score=me['score'], user_id__lt=user_id)
+    behind = Q(score__lt=me['score']) | Q(score=me['score'], user_id__gt=user_id)
+    rank = rows.filter(ahead).count() + 1
+    above = list(rows.filter(ahead).order_by('score', '-user_id')[:window])
+    below = list(rows.filter(behind).order_by('-score', 'user_id')[:window])
+    return rank - len(above), above[::-1] + [me] + below
@@ -0,0 +1,275 @@
+"""
+Live updates pushed to connected clients over server-sent events.
+
+Code that changes something clients poll for publishes an event on a
+topic once its transaction commits:
+
+    user:<id>          notifications delivered to one user's inbox
+    broadcast          notifications for everyone
+    challenge:<id>     leaderboard rows of a challenge that changed
+
+/api/live/ (an async view, served by the ASGI app) subscribes to the
+user's topics plus any ?challenge=<id> and streams the events. Topics
+go through a broker chosen by settings.LIVE_BROKER:
+
+- DatabaseBroker (default) writes each event to the LiveEvent table; every
+  web process with connected clients polls it and relays new rows to its
+  own streams, so events reach clients on any worker.
+- LocalBroker keeps everything in process memory. It only works with a
+  single web process: each process sees just what it published itself.
+
+A shared pub/sub service (e.g. Redis) can implement the same Broker methods.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import LiveEvent
+
+logger = logging.getLogger(__name__)
+
+# Events a slow client may fall behind by before it is told to resync
+QUEUE_SIZE = 100
+HEARTBEAT_SECONDS = 15
+RETRY_MS = 3000
+# DatabaseBroker: rows relayed per poll, and how long rows are kept
+RELAY_BATCH = 500
+EVENT_RETENTION = timedelta(minutes=5)
+PRUNE_SECONDS = 60
+
+
+def user_topic(user_id):
+    return f'user:{user_id}'
+
+
+def challenge_topic(challenge_id):
+    return f'challenge:{challenge_id}'
+
+
+BROADCAST_TOPIC = 'broadcast'
+
+
+class Subscription:
+    """Events of some topics, read from the event loop that subscribed"""
+
+    def __init__(self, broker, topics):
+        self.broker = broker
+        self.topics = set(topics)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.overflowed = False
+
+    def deliver(self, event):
+        """Thread-safe; called by the broker for every matching event"""
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        """Next event, or None after `timeout` seconds without one"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    """Pub/sub interface used by publish() and the stream view"""
+
+    def subscribe(self, topics):
+        """Return a Subscription; must be called from the event loop"""
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+    def publish(self, topic, event):
+        raise NotImplementedError
+
+    def publish_many(self, topics, event):
+        """The same event on several topics; brokers with a cheaper batch override this"""
+        for topic in topics:
+            self.publish(topic, event)
+
+
+class LocalBroker(Broker):
+    """Subscribers of this process only"""
+
+    def __init__(self):
+        self.subscriptions = {}
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+
+    def subscribe(self, topics):
+        subscription = Subscription(self, topics)
+        with self.lock:
+            for topic in subscription.topics:
+                self.subscriptions.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for topic in subscription.topics:
+                subscribers = self.subscriptions.get(topic, set())
+                subscribers.discard(subscription)
+                if not subscribers:
+                    self.subscriptions.pop(topic, None)
+
+    def publish(self, topic, event):
+        self.dispatch(topic, dict(event, id=next(self.ids)))
+
+    def dispatch(self, topic, event):
+        """Hand an event to this process's subscribers of the topic"""
+        with self.lock:
+            subscribers = list(self.subscriptions.get(topic, ()))
+        for subscription in subscribers:
+            try:
+                subscription.deliver(event)
+            except RuntimeError:
+                # Its event loop has shut down
+                self.unsubscribe(subscription)
+
+
+class DatabaseBroker(LocalBroker):
+    """
+    Relays events between processes through the LiveEvent table. publish()
+    inserts a row; while a process has subscribers, a background thread
+    polls for new rows every settings.LIVE_POLL_SECONDS and dispatches them.
+    """
+
+    def __init__(self, poll=True):
+        super().__init__()
+        self.poll = poll
+        self.poller = None
+        self.last_id = None
+        self.last_prune = 0
+
+    def subscribe(self, topics):
+        subscription = super().subscribe(topics)
+        if self.poll:
+            with self.lock:
+                if self.poller is None:
+                    self.poller = threading.Thread(target=self._run, name='live-broker', daemon=True)
+                    self.poller.start()
+        return subscription
+
+    def publish(self, topic, event):
+        self.publish_many([topic], event)
+
+    def publish_many(self, topics, event):
+        # One INSERT for a notification sent to a whole group
+        LiveEvent.objects.bulk_create(
+            [LiveEvent(topic=topic, event_type=event['type'], data=event['data']) for topic in topics],
+            batch_size=1000
+        )
+
+    def _run(self):
+        while True:
+            try:
+                close_old_connections()
+                self.relay()
+            except Exception:
+                logger.exception("Relaying live events failed")
+            time.sleep(getattr(settings, 'LIVE_POLL_SECONDS', 0.5))
+
+    def relay(self):
+        """Dispatch the rows published since the last call; returns how many"""
+        with self.lock:
+            listening = bool(self.subscriptions)
+        if not listening:
+            # Nobody to tell; start from the newest row once someone connects
+            self.last_id = None
+            return 0
+        if self.last_id is None:
+            self.last_id = LiveEvent.objects.aggregate(last=Max('id'))['last'] or 0
+
+        rows = list(LiveEvent.objects.filter(id__gt=self.last_id).order_by('id')[:RELAY_BATCH])
+        for row in rows:
+            self.dispatch(row.topic, {'id': row.id, 'type': row.event_type, 'data': row.data})
+        if rows:
+            self.last_id = rows[-1].id
+
+        if time.monotonic() - self.last_prune > PRUNE_SECONDS:
+            self.last_prune = time.monotonic()
+            LiveEvent.objects.filter(created_at__lt=timezone.now() - EVENT_RETENTION).delete()
+        return len(rows)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'LIVE_BROKER', 'quizzes.live.DatabaseBroker'))()
+        return _broker
+
+
+def reset_broker():
+    global _broker
+    with _broker_lock:
+        _broker = None
+
+
+def publish(topics, event_type, data):
+    """Publish an event on one topic or a list of topics once the current transaction commits"""
+    if isinstance(topics, str):
+        topics = [topics]
+    event = {'type': event_type, 'data': data}
+
+    def send():
+        try:
+            get_broker().publish_many(topics, event)
+        except Exception:
+            logger.exception("Publishing %s on %d topic(s) failed", event_type, len(topics))
+
+    transaction.on_commit(send)
+
+
+def format_event(event):
+    """One server-sent event frame"""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+
+async def stream(topics):
+    """
+    Server-sent event frames for the topics. Starts with a `ready` event
+    (clients refetch their state on it, which covers any gap since a
+    previous connection), sends a comment every HEARTBEAT_SECONDS to keep
+    proxies from closing the connection and ends after
+    settings.LIVE_STREAM_SECONDS;
+    EventSource reconnects on its own after `retry`.
+    """
+    loop = asyncio.get_running_loop()
+    subscription = get_broker().subscribe(topics)
+    try:
+        yield f"retry: {RETRY_MS}\nevent: ready\ndata: {{}}\n\n"
+        deadline = loop.time() + getattr(settings, 'LIVE_STREAM_SECONDS', 300)
+        while (remaining := deadline - loop.time()) > 0:
+            event = await subscription.get(min(HEARTBEAT_SECONDS, remaining))
+            if subscription.overflowed:
+                # Dropped events; the client refetches and reconnects
+                yield "event: resync\ndata: {}\n\n"
+                return
+            yield format_event(event) if event else ": keep-alive\n\n"
+    finally:
+        subscription.close()
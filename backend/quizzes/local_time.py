@@ -0,0 +1,39 @@
+"""
+Calendar helpers in the candidates' local time (settings.LOCAL_TIME_ZONE,
+Asia/Kathmandu). Storage stays in UTC; only "which day is it" questions
+such as leaderboard buckets and streaks go through here.
+"""
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.utils import timezone
+
+
+def local_tz():
+    return ZoneInfo(getattr(settings, 'LOCAL_TIME_ZONE', 'Asia/Kathmandu'))
+
+
+def local_date(moment=None):
+    """Local calendar date of an aware datetime (default now)"""
+    return timezone.localtime(moment or timezone.now(), local_tz()).date()
+
+
+def start_of_day(day):
+    """Aware datetime of local midnight at the start of `day`"""
+    return datetime.combine(day, time.min, tzinfo=local_tz())
+
+
+def start_of_week(day):
+    """Sunday of the week containing `day`: the Nepali week runs Sunday to Saturday"""
+    return day - timedelta(days=(day.weekday() + 1) % 7)
+
+
+def next_boundary(period, day):
+    """Local midnight at which the `period` bucket containing `day` ends"""
+    if period == 'weekly':
+        return start_of_day(start_of_week(day) + timedelta(days=7))
+    if period == 'monthly':
+        first = day.replace(day=1)
+        return start_of_day((first + timedelta(days=32)).replace(day=1))
+    return start_of_day(day + timedelta(days=1))
@@ -0,0 +1,66 @@
+"""
+Management command to fill the UserAnswer table from existing results
+
+Results are graded against the current answer key of their quiz; results
+that already have UserAnswer rows are skipped, so it is safe to re-run.
+
+Usage:
+    python manage.py backfill_user_answers
+    python manage.py backfill_user_answers --chunk-size 1000
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from quizzes.models import Result, UserAnswer
+from quizzes.content_cache import get_answer_key, grade_answers, build_user_answers
+
+
+class Command(BaseCommand):
+    help = 'Backfill per-question UserAnswer rows from Result.answers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Results processed per transaction')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_id = 0
+        results_done = 0
+        rows_written = 0
+        skipped = 0
+
+        while True:
+            chunk = list(
+                Result.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .only('id', 'user_id', 'quiz_id', 'answers')[:chunk_size]
+            )
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+
+            already_done = set(
+                UserAnswer.objects.filter(result_id__in=[r.id for r in chunk])
+                .values_list('result_id', flat=True)
+                .distinct()
+            )
+            rows = []
+            for result in chunk:
+                if result.id in already_done:
+                    continue
+                try:
+                    graded = grade_answers(get_answer_key(result.quiz_id), result.answers or {})[3]
+                except (TypeError, ValueError, AttributeError):
+                    skipped += 1
+                    continue
+                rows.extend(build_user_answers(result, graded))
+                results_done += 1
+
+            with transaction.atomic():
+                UserAnswer.objects.bulk_create(rows, batch_size=1000)
+            rows_written += len(rows)
+            self.stdout.write(f"  up to result {last_id}: {rows_written} answer rows")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Backfilled {results_done} result(s), {rows_written} answer row(s)"
+        ))
+        if skipped:
+            self.stdout.write(self.style.WARNING(f"Skipped {skipped} result(s) with unreadable answers"))
@@ -0,0 +1,161 @@
+"""
+Management command to compute classical item statistics for every question
+
+Streams UserAnswer rows in id-ordered chunks into NumPy arrays and folds
+each chunk into per-question accumulators, so memory stays bounded by
+--chunk-size plus a few arrays sized by the number of questions, however
+many answers there are. For each answered question it stores in
+QuestionStats:
+
+    p_value              share of responses that were correct
+    discrimination       point-biserial correlation between being correct
+                         and the score of the result the answer belongs to
+    option_distribution  share of responses choosing each option
+    unanswered_rate      share of responses left blank
+    avg_time             mean reported seconds (answers with time_spent only)
+
+Usage:
+    python manage.py compute_question_stats
+    python manage.py compute_question_stats --chunk-size 200000
+"""
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from quizzes.models import Question, QuestionStats, UserAnswer
+
+STATS_FIELDS = [
+    'responses', 'p_value', 'discrimination', 'option_distribution',
+    'unanswered_rate', 'avg_time', 'computed_at'
+]
+
+
+class Accumulators:
+    """Running per-question sums, indexed by position in question_ids"""
+
+    def __init__(self, question_ids, width):
+        size = len(question_ids)
+        self.question_ids = question_ids
+        self.width = width
+        self.responses = np.zeros(size, dtype=np.int64)
+        self.correct = np.zeros(size, dtype=np.int64)
+        self.total_sum = np.zeros(size)
+        self.total_sq_sum = np.zeros(size)
+        self.correct_total_sum = np.zeros(size)
+        self.unanswered = np.zeros(size, dtype=np.int64)
+        self.options = np.zeros(size * width, dtype=np.int64)
+        self.timed = np.zeros(size, dtype=np.int64)
+        self.time_sum = np.zeros(size)
+
+    def add_chunk(self, question, chosen, correct, total, seconds):
+        size = len(self.question_ids)
+        index = np.searchsorted(self.question_ids, question)
+        known = (index < size) & (self.question_ids[np.minimum(index, size - 1)] == question)
+        index, chosen, correct, total, seconds = (
+            index[known], chosen[known], correct[known], total[known], seconds[known]
+        )
+
+        self.responses += np.bincount(index, minlength=size)
+        self.correct += np.bincount(index, weights=correct, minlength=size).astype(np.int64)
+        self.total_sum += np.bincount(index, weights=total, minlength=size)
+        self.total_sq_sum += np.bincount(index, weights=total * total, minlength=size)
+        self.correct_total_sum += np.bincount(index, weights=total * correct, minlength=size)
+
+        blank = chosen < 0
+        self.unanswered += np.bincount(index[blank], minlength=size)
+        valid = (chosen >= 0) & (chosen < self.width)
+        self.options += np.bincount(
+            index[valid] * self.width + chosen[valid], minlength=size * self.width
+        )
+
+        has_time = seconds >= 0
+        self.timed += np.bincount(index[has_time], minlength=size)
+        self.time_sum += np.bincount(index[has_time], weights=seconds[has_time], minlength=size)
+
+    def results(self):
+        """Per-question arrays of the final statistics (NaN where undefined)"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            n = self.responses.astype(float)
+            n1 = self.correct.astype(float)
+            n0 = n - n1
+            p_value = n1 / n
+            mean = self.total_sum / n
+            std = np.sqrt(np.maximum(self.total_sq_sum / n - mean * mean, 0))
+            mean_correct = self.correct_total_sum / n1
+            mean_wrong = (self.total_sum - self.correct_total_sum) / n0
+            discrimination = (mean_correct - mean_wrong) / std * np.sqrt(p_value * (1 - p_value))
+            discrimination[(n1 == 0) | (n0 == 0) | (std == 0)] = np.nan
+            distribution = self.options.reshape(-1, self.width) / n[:, None]
+            unanswered_rate = self.unanswered / n
+            avg_time = self.time_sum / self.timed
+        return p_value, discrimination, distribution, unanswered_rate, avg_time
+
+
+def _optional(value, digits=4):
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+class Command(BaseCommand):
+    help = 'Compute p-value, discrimination, option distribution and timing per question'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=100000, help='Answers loaded per round')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        questions = list(Question.objects.order_by('id').values_list('id', 'options'))
+        if not questions:
+            self.stdout.write("No questions found")
+            return
+        question_ids = np.array([pk for pk, _ in questions], dtype=np.int64)
+        option_counts = [len(opts) if isinstance(opts, list) else 0 for _, opts in questions]
+        acc = Accumulators(question_ids, max(max(option_counts), 1))
+
+        last_id = 0
+        answers_read = 0
+        while True:
+            rows = list(
+                UserAnswer.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'question_id', 'chosen_option', 'is_correct', 'result__score', 'time_spent')
+                [:chunk_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            answers_read += len(rows)
+
+            _, question, chosen, correct, total, seconds = zip(*rows)
+            acc.add_chunk(
+                np.array(question, dtype=np.int64),
+                np.array([-1 if c is None else c for c in chosen], dtype=np.int64),
+                np.array(correct, dtype=float),
+                np.array(total, dtype=float),
+                np.array([-1 if t is None else t for t in seconds], dtype=float),
+            )
+            self.stdout.write(f"  up to answer {last_id}: {answers_read} answers")
+
+        p_value, discrimination, distribution, unanswered_rate, avg_time = acc.results()
+        now = timezone.now()
+        stats = [
+            QuestionStats(
+                question_id=int(question_ids[i]),
+                responses=int(acc.responses[i]),
+                p_value=_optional(p_value[i]),
+                discrimination=_optional(discrimination[i]),
+                option_distribution=[round(float(x), 4) for x in distribution[i][:option_counts[i]]],
+                unanswered_rate=round(float(unanswered_rate[i]), 4),
+                avg_time=_optional(avg_time[i], 2),
+                computed_at=now
+            )
+            for i in np.flatnonzero(acc.responses)
+        ]
+        with transaction.atomic():
+            QuestionStats.objects.bulk_create(
+                stats, batch_size=1000,
+                update_conflicts=True, unique_fields=['question'], update_fields=STATS_FIELDS
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Computed stats for {len(stats)} question(s) from {answers_read} answer(s)"
+        ))
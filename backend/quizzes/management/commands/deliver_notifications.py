@@ -0,0 +1,64 @@
+"""
+Management command to send queued push deliveries and study reminders
+
+Usage:
+    python manage.py deliver_notifications
+    python manage.py deliver_notifications --concurrency 4
+    python manage.py deliver_notifications --once  (send everything due and exit)
+    python manage.py deliver_notifications --no-reminders
+"""
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from quizzes.delivery import process_deliveries, queue_due_reminders
+
+
+class Command(BaseCommand):
+    help = 'Send queued notification pushes, exam alerts and study reminders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help='Number of worker threads')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when idle')
+        parser.add_argument('--once', action='store_true', help='Exit once nothing is due')
+        parser.add_argument('--no-reminders', action='store_true', help='Do not queue study reminders')
+
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        self.handled = 0
+        self.lock = threading.Lock()
+
+        threads = [
+            threading.Thread(target=self.work, args=(options,), name=f'delivery-{i}', daemon=True)
+            for i in range(max(1, options['concurrency']))
+        ]
+        self.stdout.write(f"Starting {len(threads)} delivery worker(s)")
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+
+        self.stdout.write(self.style.SUCCESS(f"✓ Handled {self.handled} recipient(s)"))
+
+    def work(self, options):
+        try:
+            while not self.stop.is_set():
+                close_old_connections()
+                if not options['no_reminders']:
+                    queue_due_reminders()
+                handled = process_deliveries()
+                with self.lock:
+                    self.handled += handled
+                if not handled:
+                    if options['once']:
+                        return
+                    self.stop.wait(options['poll_interval'])
+        finally:
+            connection.close()
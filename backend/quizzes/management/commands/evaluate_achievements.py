@@ -0,0 +1,102 @@
+"""
+Management command to rebuild achievement counters and evaluate every rule
+
+Recomputes each user's UserCounters from Result, Bookmark, QuestionReport
+and Streak with grouped queries per chunk of users, then awards every
+badge/achievement whose rule is satisfied and not yet earned. Use it after
+adding a rule or to repair drifted counters; it is safe to re-run.
+
+Usage:
+    python manage.py evaluate_achievements
+    python manage.py evaluate_achievements --chunk-size 1000
+"""
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.db.models.functions import TruncDate
+from quizzes.achievements import RECENT_DAYS, evaluate_many
+from quizzes.local_time import local_date, local_tz, start_of_day
+from quizzes.models import Bookmark, QuestionReport, Result, Streak, UserCounters
+
+COUNTER_FIELDS = [
+    'total_quizzes', 'perfect_scores', 'best_score', 'category_quizzes',
+    'daily_quizzes', 'bookmarks', 'reports', 'longest_streak'
+]
+
+
+def _counts(model, user_ids):
+    return dict(
+        model.objects.filter(user_id__in=user_ids)
+        .values('user_id').annotate(n=Count('id')).values_list('user_id', 'n')
+    )
+
+
+def build_counters(user_ids, today):
+    """Unsaved UserCounters for the given users, computed from scratch"""
+    counters = {user_id: UserCounters(user_id=user_id) for user_id in user_ids}
+
+    per_category = (
+        Result.objects.filter(user_id__in=user_ids)
+        .values('user_id', 'quiz__category')
+        .annotate(n=Count('id'), perfect=Count('id', filter=Q(score__gte=100)), best=Max('score'))
+    )
+    for row in per_category:
+        c = counters[row['user_id']]
+        c.total_quizzes += row['n']
+        c.perfect_scores += row['perfect']
+        c.best_score = max(c.best_score, row['best'] or 0)
+        c.category_quizzes[row['quiz__category']] = row['n']
+
+    first_day = today - timedelta(days=RECENT_DAYS - 1)
+    per_day = (
+        Result.objects.filter(user_id__in=user_ids, date_taken__gte=start_of_day(first_day))
+        .annotate(day=TruncDate('date_taken', tzinfo=local_tz()))
+        .values('user_id', 'day')
+        .annotate(n=Count('id'))
+    )
+    for row in per_day:
+        counters[row['user_id']].daily_quizzes[row['day'].isoformat()] = row['n']
+
+    for user_id, n in _counts(Bookmark, user_ids).items():
+        counters[user_id].bookmarks = n
+    for user_id, n in _counts(QuestionReport, user_ids).items():
+        counters[user_id].reports = n
+    for user_id, longest in Streak.objects.filter(user_id__in=user_ids).values_list('user_id', 'longest_streak'):
+        counters[user_id].longest_streak = longest
+    return list(counters.values())
+
+
+class Command(BaseCommand):
+    help = 'Rebuild achievement counters and award every satisfied badge/achievement'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Users processed per round')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        today = local_date()
+        last_id = 0
+        users_done = 0
+        awarded = 0
+
+        while True:
+            user_ids = list(
+                User.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size]
+            )
+            if not user_ids:
+                break
+            last_id = user_ids[-1]
+
+            counters = build_counters(user_ids, today)
+            with transaction.atomic():
+                UserCounters.objects.bulk_create(
+                    counters, update_conflicts=True, unique_fields=['user'], update_fields=COUNTER_FIELDS
+                )
+                awarded += evaluate_many(counters, today)
+            users_done += len(user_ids)
+            self.stdout.write(f"  up to user {last_id}: {awarded} award(s)")
+
+        self.stdout.write(self.style.SUCCESS(f"✓ Evaluated {users_done} user(s), {awarded} new award(s)"))
@@ -0,0 +1,58 @@
+"""
+Management command for the nightly streak maintenance (Nepal time)
+
+Expires every broken streak with a single UPDATE on the indexed
+last_active_date column, then lists the users whose streak is at risk
+today (last active yesterday). The at-risk user ids are cached under
+AT_RISK_KEY for the day, and can also be written to a file or sent as one
+targeted reminder notification. Run it shortly after local midnight.
+
+Usage:
+    python manage.py expire_streaks
+    python manage.py expire_streaks --notify
+    python manage.py expire_streaks --output at_risk.txt
+"""
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from quizzes.analytics import invalidate_all_analytics
+from quizzes.gamification import AT_RISK_KEY, expire_streaks, streaks_at_risk
+from quizzes.local_time import local_date
+from quizzes.models import Notification
+
+NOTIFY_CHUNK = 1000
+
+
+class Command(BaseCommand):
+    help = 'Expire broken streaks and list streaks at risk today'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--notify', action='store_true', help='Send a reminder notification to at-risk users')
+        parser.add_argument('--output', help='Write at-risk user ids to this file, one per line')
+
+    def handle(self, *args, **options):
+        today = local_date()
+        expired = expire_streaks(today)
+        if expired:
+            # Cached analytics payloads show the current streak
+            invalidate_all_analytics()
+
+        at_risk = list(streaks_at_risk(today).order_by('user_id').iterator(chunk_size=10000))
+        cache.set(AT_RISK_KEY.format(day=today.isoformat()), at_risk, 60 * 60 * 24)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.writelines(f"{user_id}\n" for user_id in at_risk)
+        if options['notify'] and at_risk:
+            with transaction.atomic():
+                notification = Notification.objects.create(
+                    title='Keep your streak alive!',
+                    message='Take a quiz today so your study streak does not reset.',
+                    notification_type='reminder'
+                )
+                for start in range(0, len(at_risk), NOTIFY_CHUNK):
+                    notification.target_users.add(*at_risk[start:start + NOTIFY_CHUNK])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Expired {expired} streak(s), {len(at_risk)} at risk on {today.isoformat()}"
+        ))
@@ -7,7 +7,8 @@ Usage:
 """
 import json
 from django.core.management.base import BaseCommand, CommandError
-from quizzes.models import Quiz, Question, Subject
+from quizzes.models import Quiz, Subject
+from quizzes.question_upload import replace_questions
 
 
 class Command(BaseCommand):
@@ -113,8 +114,6 @@ class Command(BaseCommand):
         if update:
             try:
                 quiz = Quiz.objects.get(title=data['title'])
-                # Delete old questions if updating
-                quiz.questions.all().delete()
                 self.stdout.write(f"  Updating existing quiz: {quiz.title}")
             except Quiz.DoesNotExist:
                 pass
@@ -137,16 +136,11 @@ class Command(BaseCommand):
                 subject=subject
             )
         
-        # Create questions
-        for q_data in data['questions']:
-            Question.objects.create(
-                quiz=quiz,
-                question_text=q_data['question_text'],
-                options=q_data['options'],
-                correct_option=q_data['correct_option'],
-                explanation=q_data.get('explanation', ''),
-                difficulty=q_data.get('difficulty', 'medium'),
-                subject=subject
-            )
+        # Questions already in the quiz are updated in place (matched by text)
+        _, _, removed, answers_removed = replace_questions(quiz, data['questions'], subject)
+        if removed:
+            self.stdout.write(self.style.WARNING(
+                f"  Deleted {removed} question(s) missing from the file, with {answers_removed} recorded answer(s)"
+            ))
         
         return quiz
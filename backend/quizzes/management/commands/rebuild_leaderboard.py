@@ -0,0 +1,65 @@
+"""
+Management command to rebuild the materialized leaderboard from results
+
+Usage:
+    python manage.py rebuild_leaderboard
+    python manage.py rebuild_leaderboard --chunk-size 200  (users per transaction)
+"""
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from quizzes.models import Result, LeaderboardAggregate
+from quizzes.leaderboard import GLOBAL_SCOPE, buckets_for_day
+from quizzes.local_time import local_tz
+
+
+class Command(BaseCommand):
+    help = 'Recompute LeaderboardAggregate rows from the Result table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200, help='Users rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        stale, _ = LeaderboardAggregate.objects.exclude(
+            user_id__in=Result.objects.values('user_id')
+        ).delete()
+
+        user_ids = list(Result.objects.order_by('user_id').values_list('user_id', flat=True).distinct())
+        written = 0
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+            # One row per (user, category, Nepal-time day), rolled up into buckets here
+            daily = (
+                Result.objects.filter(user_id__in=chunk)
+                .annotate(day=TruncDate('date_taken', tzinfo=local_tz()))
+                .values('user_id', 'quiz__category', 'day')
+                .annotate(total=Sum('score'), count=Count('id'))
+                .order_by()
+            )
+            totals = defaultdict(lambda: [0.0, 0])
+            for row in daily:
+                for scope in (GLOBAL_SCOPE, row['quiz__category']):
+                    for bucket in buckets_for_day(row['day']):
+                        entry = totals[(row['user_id'], scope, bucket)]
+                        entry[0] += row['total']
+                        entry[1] += row['count']
+
+            with transaction.atomic():
+                LeaderboardAggregate.objects.filter(user_id__in=chunk).delete()
+                LeaderboardAggregate.objects.bulk_create([
+                    LeaderboardAggregate(
+                        user_id=user_id, scope=scope, bucket=bucket,
+                        total_score=total, quizzes_taken=count
+                    )
+                    for (user_id, scope, bucket), (total, count) in totals.items()
+                ], batch_size=1000)
+            written += len(totals)
+            self.stdout.write(f"  {min(start + chunk_size, len(user_ids))}/{len(user_ids)} users")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Rebuilt {written} leaderboard row(s) for {len(user_ids)} user(s), removed {stale} stale row(s)"
+        ))
@@ -0,0 +1,50 @@
+"""
+Management command to reassign global UserAnalytics ranks
+
+Ranks follow average_score (highest first, ties by id) and are computed by
+the database with a window function; only rows whose rank changed are
+written, with bulk_update in chunks. Schedule it (e.g. every few minutes).
+
+Usage:
+    python manage.py recompute_ranks
+    python manage.py recompute_ranks --chunk-size 5000
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from quizzes.models import UserAnalytics
+
+
+class Command(BaseCommand):
+    help = 'Recompute global ranks of all UserAnalytics rows in one pass'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows per bulk_update')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        ranked = UserAnalytics.objects.annotate(
+            new_rank=Window(RowNumber(), order_by=[F('average_score').desc(), F('id').asc()])
+        ).values_list('id', 'rank', 'new_rank')
+
+        changed = []
+        updated = 0
+        total = 0
+        for pk, rank, new_rank in ranked.iterator(chunk_size=chunk_size):
+            total += 1
+            if rank != new_rank:
+                changed.append(UserAnalytics(id=pk, rank=new_rank))
+            if len(changed) >= chunk_size:
+                updated += self.flush(changed)
+        updated += self.flush(changed)
+
+        self.stdout.write(self.style.SUCCESS(f"✓ Ranked {total} user(s), {updated} rank(s) changed"))
+
+    def flush(self, rows):
+        count = len(rows)
+        if rows:
+            with transaction.atomic():
+                UserAnalytics.objects.bulk_update(rows, ['rank'], batch_size=500)
+            rows.clear()
+        return count
@@ -0,0 +1,84 @@
+"""
+Management command to detect and repair drift in UserAnalytics
+
+UserAnalytics rows are maintained incrementally on every submission. This
+recomputes the per-category sums from Result for every user with results
+(or an analytics row) and rewrites only the rows that disagree.
+
+Usage:
+    python manage.py reconcile_analytics
+    python manage.py reconcile_analytics --chunk-size 1000
+    python manage.py reconcile_analytics --dry-run
+"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from quizzes.analytics import apply_category_stats, expected_category_stats, invalidate_user_analytics
+from quizzes.models import UserAnalytics
+
+COMPARED_FIELDS = ('quizzes', 'questions', 'best_score', 'weak_quizzes')
+
+
+def _drifted(stored, expected):
+    if set(stored) != set(expected):
+        return True
+    for category, stats in expected.items():
+        current = stored[category]
+        if any(current.get(field) != stats[field] for field in COMPARED_FIELDS):
+            return True
+        for field in ('score_sum', 'weak_score_sum'):
+            if round(current.get(field, -1), 4) != round(stats[field], 4):
+                return True
+    return False
+
+
+class Command(BaseCommand):
+    help = 'Rebuild UserAnalytics rows whose running sums drifted from Result'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Users checked per round')
+        parser.add_argument('--dry-run', action='store_true', help='Only report drifted users')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        users = (
+            User.objects.filter(Q(result__isnull=False) | Q(analytics__isnull=False))
+            .distinct()
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+        last_id = 0
+        checked = 0
+        fixed = 0
+
+        while True:
+            user_ids = list(users.filter(id__gt=last_id)[:chunk_size])
+            if not user_ids:
+                break
+            last_id = user_ids[-1]
+            checked += len(user_ids)
+
+            expected = expected_category_stats(user_ids)
+            stored = {a.user_id: a for a in UserAnalytics.objects.filter(user_id__in=user_ids)}
+            drifted = []
+            for user_id in user_ids:
+                analytics = stored.get(user_id) or UserAnalytics(user_id=user_id)
+                stats = expected.get(user_id, {})
+                if analytics.pk and not _drifted(analytics.category_stats or {}, stats):
+                    continue
+                drifted.append(apply_category_stats(analytics, stats))
+
+            fixed += len(drifted)
+            if drifted and not options['dry_run']:
+                with transaction.atomic():
+                    UserAnalytics.objects.bulk_create([a for a in drifted if not a.pk])
+                    UserAnalytics.objects.bulk_update([a for a in drifted if a.pk], [
+                        'total_quizzes', 'total_questions_answered', 'average_score',
+                        'best_category', 'worst_category', 'category_stats'
+                    ])
+                    for analytics in drifted:
+                        invalidate_user_analytics(analytics.user_id)
+
+        action = 'found' if options['dry_run'] else 'fixed'
+        self.stdout.write(self.style.SUCCESS(f"✓ Checked {checked} user(s), {action} {fixed} drifted"))
@@ -0,0 +1,40 @@
+"""
+Management command to detect and repair drift in the forum counters
+
+ForumPost.comment_count/like_count and ForumComment.like_count/reply_count
+are kept up to date incrementally. This recounts them from the comments and
+likes tables and rewrites only the rows that disagree.
+
+Usage:
+    python manage.py reconcile_forum_counters
+    python manage.py reconcile_forum_counters --dry-run
+"""
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from quizzes.forum import actual_comment_count, actual_like_count, actual_reply_count
+from quizzes.models import ForumComment, ForumPost
+
+
+class Command(BaseCommand):
+    help = 'Recount forum comment and like counters that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report drifted rows')
+
+    def handle(self, *args, **options):
+        checks = [
+            (ForumPost, {'comment_count': actual_comment_count(), 'like_count': actual_like_count(ForumPost)}),
+            (ForumComment, {'like_count': actual_like_count(ForumComment), 'reply_count': actual_reply_count()}),
+        ]
+        action = 'found' if options['dry_run'] else 'fixed'
+        for model, counts in checks:
+            actual = {f'actual_{field}': expression for field, expression in counts.items()}
+            drift = Q()
+            for field in counts:
+                drift |= ~Q(**{field: F(f'actual_{field}')})
+            drifted = list(model.objects.annotate(**actual).filter(drift).values_list('pk', flat=True))
+            if drifted and not options['dry_run']:
+                model.objects.filter(pk__in=drifted).update(**counts)
+            self.stdout.write(self.style.SUCCESS(
+                f"✓ {model._meta.verbose_name_plural.capitalize()}: {action} {len(drifted)} drifted"
+            ))
@@ -0,0 +1,61 @@
+"""
+Management command to process queued background events
+
+Usage:
+    python manage.py run_workers
+    python manage.py run_workers --concurrency 4 --batch-size 100
+    python manage.py run_workers --once  (drain the queue and exit)
+"""
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from quizzes.events import process_pending_events
+
+
+class Command(BaseCommand):
+    help = 'Process queued streak/badge/achievement events'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help='Number of worker threads')
+        parser.add_argument('--batch-size', type=int, default=50, help='Events claimed per round')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when idle')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        self.processed = 0
+        self.lock = threading.Lock()
+
+        threads = [
+            threading.Thread(target=self.work, args=(options,), name=f'worker-{i}', daemon=True)
+            for i in range(max(1, options['concurrency']))
+        ]
+        self.stdout.write(f"Starting {len(threads)} worker(s)")
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+
+        self.stdout.write(self.style.SUCCESS(f"✓ Processed {self.processed} event(s)"))
+
+    def work(self, options):
+        try:
+            while not self.stop.is_set():
+                close_old_connections()
+                handled = process_pending_events(options['batch_size'])
+                with self.lock:
+                    self.processed += handled
+                if not handled:
+                    if options['once']:
+                        return
+                    self.stop.wait(options['poll_interval'])
+        finally:
+            connection.close()
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0007_challengeparticipation_dailychallenge_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='result',
+            name='date_taken',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0009_queuedevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='result',
+            name='idempotency_key',
+            field=models.CharField(blank=True, help_text='Client key that makes retried submissions replay instead of duplicating', max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='result',
+            constraint=models.UniqueConstraint(fields=('user', 'idempotency_key'), name='unique_result_idempotency_key'),
+        ),
+    ]
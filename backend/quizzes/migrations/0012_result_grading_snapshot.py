@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0011_useranswer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='result',
+            name='answer_key_version',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='result',
+            name='graded_answers',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
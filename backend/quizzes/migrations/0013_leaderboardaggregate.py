@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0012_result_grading_snapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(help_text="'global' or a quiz category", max_length=20)),
+                ('bucket', models.CharField(help_text="'all', 'day:YYYY-MM-DD', 'week:YYYY-Www' or 'month:YYYY-MM'", max_length=20)),
+                ('total_score', models.FloatField(default=0)),
+                ('quizzes_taken', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_aggregates', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['scope', 'bucket', '-total_score'], name='leaderboard_top_idx')],
+                'constraints': [models.UniqueConstraint(fields=('scope', 'bucket', 'user'), name='unique_leaderboard_aggregate')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0013_leaderboardaggregate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='useranswer',
+            name='time_spent',
+            field=models.PositiveIntegerField(blank=True, help_text='Seconds, when the client reports it', null=True),
+        ),
+        migrations.CreateModel(
+            name='QuestionStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('responses', models.IntegerField(default=0)),
+                ('p_value', models.FloatField(blank=True, help_text='Share of responses that were correct', null=True)),
+                ('discrimination', models.FloatField(blank=True, help_text='Point-biserial correlation with the result score', null=True)),
+                ('option_distribution', models.JSONField(blank=True, default=list)),
+                ('unanswered_rate', models.FloatField(default=0)),
+                ('avg_time', models.FloatField(blank=True, help_text='Average seconds spent, when reported', null=True)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='quizzes.question')),
+            ],
+            options={
+                'verbose_name_plural': 'Question stats',
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0014_question_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='queuedevent',
+            name='event_type',
+            field=models.CharField(choices=[('results_submitted', 'Results Submitted'), ('counters_changed', 'Counters Changed')], max_length=50),
+        ),
+        migrations.CreateModel(
+            name='UserCounters',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_quizzes', models.IntegerField(default=0)),
+                ('perfect_scores', models.IntegerField(default=0)),
+                ('best_score', models.FloatField(default=0)),
+                ('category_quizzes', models.JSONField(blank=True, default=dict)),
+                ('daily_quizzes', models.JSONField(blank=True, default=dict)),
+                ('bookmarks', models.IntegerField(default=0)),
+                ('reports', models.IntegerField(default=0)),
+                ('longest_streak', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='counters', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
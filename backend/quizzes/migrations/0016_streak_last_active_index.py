@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0015_user_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='streak',
+            name='last_active_date',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+    ]
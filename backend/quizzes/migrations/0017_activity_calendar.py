@@ -0,0 +1,64 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:31
+
+from datetime import date
+from zoneinfo import ZoneInfo
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def fill_calendars(apps, schema_editor):
+    """Build calendars from the (user, local day) pairs of existing results"""
+    Result = apps.get_model('quizzes', 'Result')
+    ActivityCalendar = apps.get_model('quizzes', 'ActivityCalendar')
+    tz = ZoneInfo(getattr(settings, 'LOCAL_TIME_ZONE', 'Asia/Kathmandu'))
+    days = (
+        Result.objects.annotate(day=TruncDate('date_taken', tzinfo=tz))
+        .values_list('user_id', 'day')
+        .distinct()
+        .order_by('user_id')
+    )
+    masks = {}
+    current_user = None
+    for user_id, day in days.iterator(chunk_size=10000):
+        # Flush only between users so no (user, year) row is written twice
+        if user_id != current_user and len(masks) >= 5000:
+            flush(ActivityCalendar, masks)
+        current_user = user_id
+        key = (user_id, day.year)
+        masks[key] = masks.get(key, 0) | 1 << (day - date(day.year, 1, 1)).days
+    flush(ActivityCalendar, masks)
+
+
+def flush(ActivityCalendar, masks):
+    ActivityCalendar.objects.bulk_create([
+        ActivityCalendar(user_id=user_id, year=year, days=bits.to_bytes((bits.bit_length() + 7) // 8, 'little'))
+        for (user_id, year), bits in masks.items()
+    ], update_conflicts=True, unique_fields=['user', 'year'], update_fields=['days'])
+    masks.clear()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0016_streak_last_active_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityCalendar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.SmallIntegerField()),
+                ('days', models.BinaryField(default=bytes)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_calendars', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'year'), name='unique_activity_calendar_year')],
+            },
+        ),
+        migrations.RunPython(fill_calendars, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def fan_out_existing(apps, schema_editor):
+    """Move existing targeted notifications into inboxes; all start unread"""
+    Notification = apps.get_model('quizzes', 'Notification')
+    InboxItem = apps.get_model('quizzes', 'InboxItem')
+    NotificationState = apps.get_model('quizzes', 'NotificationState')
+    Targets = Notification.target_users.through
+
+    Notification.objects.filter(target_users__isnull=False).update(is_broadcast=False)
+    pairs = Targets.objects.values_list('user_id', 'notification_id').order_by('id')
+    batch = []
+    for user_id, notification_id in pairs.iterator(chunk_size=5000):
+        batch.append(InboxItem(user_id=user_id, notification_id=notification_id))
+        if len(batch) >= 5000:
+            InboxItem.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    InboxItem.objects.bulk_create(batch, ignore_conflicts=True)
+
+    unread = (
+        InboxItem.objects.values('user_id')
+        .annotate(n=Count('id', filter=Q(notification__is_active=True)))
+        .values_list('user_id', 'n')
+    )
+    NotificationState.objects.bulk_create(
+        [NotificationState(user_id=user_id, unread_count=n) for user_id, n in unread.iterator(chunk_size=5000)],
+        batch_size=5000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0017_activity_calendar'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='is_broadcast',
+            field=models.BooleanField(db_index=True, default=True, editable=False, help_text='True while there are no target users'),
+        ),
+        migrations.CreateModel(
+            name='NotificationState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread_count', models.IntegerField(default=0)),
+                ('broadcasts_read_until', models.IntegerField(default=0, help_text='Broadcasts with id up to this are read')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='notification_state', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='InboxItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('read_at', models.DateTimeField(blank=True, null=True)),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_items', to='quizzes.notification')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_items', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-notification'], name='inbox_user_recent_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'notification'), name='unique_inbox_item')],
+            },
+        ),
+        migrations.RunPython(fan_out_existing, migrations.RunPython.noop),
+    ]
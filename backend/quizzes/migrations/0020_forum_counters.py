@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:44
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _count(queryset, field):
+    rows = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field)
+    return Coalesce(Subquery(rows.annotate(n=Count('*')).values('n')), Value(0))
+
+
+def backfill_counts(apps, schema_editor):
+    ForumPost = apps.get_model('quizzes', 'ForumPost')
+    ForumComment = apps.get_model('quizzes', 'ForumComment')
+    ForumPost.objects.update(
+        comment_count=_count(ForumComment.objects.all(), 'post'),
+        like_count=_count(ForumPost.likes.through.objects.all(), 'forumpost'),
+    )
+    ForumComment.objects.update(like_count=_count(ForumComment.likes.through.objects.all(), 'forumcomment'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0019_delivery_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forumcomment',
+            name='like_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='forumpost',
+            name='comment_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='forumpost',
+            name='like_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
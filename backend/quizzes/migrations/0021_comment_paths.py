@@ -0,0 +1,63 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:47
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_paths(apps, schema_editor):
+    """Walk existing threads level by level, setting path, depth and reply_count"""
+    ForumComment = apps.get_model('quizzes', 'ForumComment')
+    level = ForumComment.objects.filter(parent_comment__isnull=True)
+    paths = {}
+    depth = 0
+    while True:
+        batch = []
+        for comment in level.only('id', 'parent_comment_id').iterator(chunk_size=2000):
+            comment.path = paths.get(comment.parent_comment_id, '') + f'{comment.id:010d}/'
+            comment.depth = depth
+            batch.append(comment)
+        if not batch:
+            break
+        ForumComment.objects.bulk_update(batch, ['path', 'depth'], batch_size=1000)
+        paths = {comment.id: comment.path for comment in batch}
+        level = ForumComment.objects.filter(parent_comment_id__in=list(paths))
+        depth += 1
+
+    replies = (
+        ForumComment.objects.filter(parent_comment__isnull=False)
+        .values('parent_comment_id').annotate(n=Count('id')).values_list('parent_comment_id', 'n')
+    )
+    batch = [ForumComment(id=parent_id, reply_count=n) for parent_id, n in replies.iterator(chunk_size=2000)]
+    ForumComment.objects.bulk_update(batch, ['reply_count'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0020_forum_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forumcomment',
+            name='depth',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='forumcomment',
+            name='path',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='forumcomment',
+            name='reply_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='forumcomment',
+            index=models.Index(fields=['post', 'path'], name='forum_comment_thread_idx'),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+    ]
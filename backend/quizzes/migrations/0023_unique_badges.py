@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def drop_duplicate_badges(apps, schema_editor):
+    """Keep the first award of each badge per user"""
+    Badge = apps.get_model('quizzes', 'Badge')
+    duplicated = (
+        Badge.objects.order_by().values('user_id', 'type')
+        .annotate(n=Count('id'), first=Min('id'))
+        .filter(n__gt=1)
+    )
+    for row in list(duplicated):
+        Badge.objects.filter(user_id=row['user_id'], type=row['type']).exclude(id=row['first']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0022_live_events'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_badges, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='badge',
+            constraint=models.UniqueConstraint(fields=('user', 'type'), name='unique_badge_type'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:36
+
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.db import migrations, models
+
+
+def regroup_weeks(apps, schema_editor):
+    """Replace ISO-week rows with Sunday-to-Saturday weeks summed from the day rows"""
+    LeaderboardAggregate = apps.get_model('quizzes', 'LeaderboardAggregate')
+    LeaderboardAggregate.objects.filter(bucket__startswith='week:').delete()
+    days = (
+        LeaderboardAggregate.objects.filter(bucket__startswith='day:')
+        .order_by('user_id')
+        .values_list('user_id', 'scope', 'bucket', 'total_score', 'quizzes_taken')
+    )
+
+    def flush(totals):
+        LeaderboardAggregate.objects.bulk_create([
+            LeaderboardAggregate(user_id=user_id, scope=scope, bucket=bucket, total_score=total, quizzes_taken=count)
+            for (user_id, scope, bucket), (total, count) in totals.items()
+        ], batch_size=1000)
+
+    totals = defaultdict(lambda: [0.0, 0])
+    current_user = None
+    for user_id, scope, bucket, total, count in days.iterator(chunk_size=5000):
+        if user_id != current_user and len(totals) >= 5000:
+            flush(totals)
+            totals.clear()
+        current_user = user_id
+        day = date.fromisoformat(bucket[len('day:'):])
+        sunday = day - timedelta(days=(day.weekday() + 1) % 7)
+        entry = totals[(user_id, scope, f'week:{sunday.isoformat()}')]
+        entry[0] += total
+        entry[1] += count
+    flush(totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quizzes', '0023_unique_badges'),
+    ]
+
+    operations = [
+        migrations.RunPython(regroup_weeks, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='leaderboardaggregate',
+            name='bucket',
+            field=models.CharField(help_text="'all', 'day:YYYY-MM-DD', 'week:<Sunday YYYY-MM-DD>' or 'month:YYYY-MM'", max_length=20),
+        ),
+    ]
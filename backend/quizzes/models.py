@@ -1,5 +1,7 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class Subject(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -48,12 +50,75 @@ class Result(models.Model):
     score = models.FloatField()
     correct_count = models.IntegerField()
     wrong_count = models.IntegerField()
-    date_taken = models.DateTimeField(auto_now_add=True)
+    date_taken = models.DateTimeField(default=timezone.now)  # Client time for offline-synced results
     answers = models.JSONField(default=dict, blank=True)  # Stores {question_id: user_answer}
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, help_text="Client key that makes retried submissions replay instead of duplicating")
+    # Grading snapshot: [[question_id, user_answer, correct_option], ...] and the answer key version used
+    graded_answers = models.JSONField(default=list, blank=True)
+    answer_key_version = models.CharField(max_length=32, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='unique_result_idempotency_key'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.quiz.title} - {self.score}"
 
+class UserAnswer(models.Model):
+    """One row per question of a submitted result, for indexed per-question analytics"""
+    result = models.ForeignKey(Result, on_delete=models.CASCADE, related_name='user_answers')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='user_answers')
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='user_answers')
+    chosen_option = models.SmallIntegerField(null=True, blank=True)  # None when left unanswered
+    is_correct = models.BooleanField(default=False)
+    time_spent = models.PositiveIntegerField(null=True, blank=True, help_text="Seconds, when the client reports it")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_correct']),
+            models.Index(fields=['question', 'chosen_option']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - Q-{self.question_id} - {self.chosen_option}"
+
+class QuestionStats(models.Model):
+    """Classical item statistics of a question, written by compute_question_stats"""
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, related_name='stats')
+    responses = models.IntegerField(default=0)
+    p_value = models.FloatField(null=True, blank=True, help_text="Share of responses that were correct")
+    discrimination = models.FloatField(null=True, blank=True, help_text="Point-biserial correlation with the result score")
+    option_distribution = models.JSONField(default=list, blank=True)  # Share choosing each option
+    unanswered_rate = models.FloatField(default=0)
+    avg_time = models.FloatField(null=True, blank=True, help_text="Average seconds spent, when reported")
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'Question stats'
+
+    def __str__(self):
+        return f"Q-{self.question_id} stats ({self.responses} responses)"
+
+class LeaderboardAggregate(models.Model):
+    """Running score totals of a user for one leaderboard scope and time bucket"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='leaderboard_aggregates')
+    scope = models.CharField(max_length=20, help_text="'global' or a quiz category")
+    bucket = models.CharField(max_length=20, help_text="'all', 'day:YYYY-MM-DD', 'week:<Sunday YYYY-MM-DD>' or 'month:YYYY-MM'")
+    total_score = models.FloatField(default=0)
+    quizzes_taken = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'bucket', 'user'], name='unique_leaderboard_aggregate'),
+        ]
+        indexes = [
+            models.Index(fields=['scope', 'bucket', '-total_score'], name='leaderboard_top_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.scope}/{self.bucket} - {self.total_score}"
+
 class StudyMaterial(models.Model):
     CATEGORY_CHOICES = [
         ('GK', 'General Knowledge'),
@@ -102,6 +167,7 @@ class Notification(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
     target_users = models.ManyToManyField(User, blank=True, help_text="Leave empty for all users")
+    is_broadcast = models.BooleanField(default=True, db_index=True, editable=False, help_text="True while there are no target users")
     
     class Meta:
         ordering = ['-timestamp']
@@ -109,6 +175,106 @@ class Notification(models.Model):
     def __str__(self):
         return self.title
 
+class InboxItem(models.Model):
+    """A targeted notification fanned out to one user, or a read mark on a broadcast"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='inbox_items')
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='inbox_items')
+    read_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'notification'], name='unique_inbox_item'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-notification'], name='inbox_user_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.notification_id}"
+
+class NotificationState(models.Model):
+    """Per-user read state: unread targeted notifications and the broadcast read watermark"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='notification_state')
+    unread_count = models.IntegerField(default=0)
+    broadcasts_read_until = models.IntegerField(default=0, help_text="Broadcasts with id up to this are read")
+
+    def __str__(self):
+        return f"{self.user_id} - {self.unread_count} unread"
+
+class LiveEvent(models.Model):
+    """Live update relayed between web processes by quizzes.live.DatabaseBroker; pruned after a few minutes"""
+    topic = models.CharField(max_length=100)
+    event_type = models.CharField(max_length=50)
+    data = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.topic}: {self.event_type}"
+
+class Delivery(models.Model):
+    """One push send (a notification, exam alert or reminder) to an audience, processed by deliver_notifications"""
+    KIND_CHOICES = [
+        ('notification', 'Notification'),
+        ('exam', 'Exam Alert'),
+        ('reminder', 'Study Reminder'),
+    ]
+    STATUS_CHOICES = [
+        ('expanding', 'Adding Recipients'),
+        ('sending', 'Sending'),
+        ('done', 'Done'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='notification')
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, null=True, blank=True, related_name='deliveries')
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    audience = models.JSONField(default=dict, help_text='{"type": "all"}, {"type": "notification"} or {"type": "reminder", ...}')
+    transport = models.CharField(max_length=50, default='default', help_text="Key in settings.DELIVERY_TRANSPORTS")
+    dedupe_key = models.CharField(max_length=100, null=True, blank=True, unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='expanding')
+    expanded_until = models.IntegerField(default=0, help_text="Recipients added for user ids up to this")
+    total_recipients = models.IntegerField(default=0)
+    sent_count = models.IntegerField(default=0)
+    failed_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.kind}: {self.title} ({self.status})"
+
+class DeliveryRecipient(models.Model):
+    """Per-recipient status of a delivery"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    delivery = models.ForeignKey(Delivery, on_delete=models.CASCADE, related_name='recipients')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='deliveries')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    claim = models.CharField(max_length=32, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['delivery', 'user'], name='unique_delivery_recipient'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+            models.Index(fields=['claim']),
+        ]
+
+    def __str__(self):
+        return f"{self.delivery_id} -> {self.user_id}: {self.status}"
+
 class UserProfile(models.Model):
     ROLE_CHOICES = [
         ('student', 'Student'),
@@ -139,6 +305,9 @@ class Badge(models.Model):
 
     class Meta:
         ordering = ['-date_awarded']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'type'], name='unique_badge_type'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.type}"
@@ -147,11 +316,25 @@ class Streak(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='streak')
     current_streak = models.IntegerField(default=0)
     longest_streak = models.IntegerField(default=0)
-    last_active_date = models.DateField(null=True, blank=True)
+    last_active_date = models.DateField(null=True, blank=True, db_index=True)  # Nepal-time date
 
     def __str__(self):
         return f"{self.user.username} - {self.current_streak}"
 
+class ActivityCalendar(models.Model):
+    """One bit per Nepal-time day of a year on which the user took a quiz (bit 0 = Jan 1)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activity_calendars')
+    year = models.SmallIntegerField()
+    days = models.BinaryField(default=bytes)  # Little-endian bitset, at most 46 bytes
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'year'], name='unique_activity_calendar_year'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.year}"
+
 class Bookmark(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bookmarks')
     question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='bookmarks')
@@ -245,6 +428,22 @@ class UserAnalytics(models.Model):
     def __str__(self):
         return f"{self.user.username} Analytics"
 
+class UserCounters(models.Model):
+    """Per-user event counters that achievement and badge rules are evaluated against"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='counters')
+    total_quizzes = models.IntegerField(default=0)
+    perfect_scores = models.IntegerField(default=0)
+    best_score = models.FloatField(default=0)
+    category_quizzes = models.JSONField(default=dict, blank=True)  # {"GK": 12, ...}
+    daily_quizzes = models.JSONField(default=dict, blank=True)  # {"2025-01-31": 3, ...} for recent Nepal-time days only
+    bookmarks = models.IntegerField(default=0)
+    reports = models.IntegerField(default=0)
+    longest_streak = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id} counters"
+
 class QuestionFeedback(models.Model):
     """User feedback on questions for quality improvement"""
     DIFFICULTY_RATING = [
@@ -305,6 +504,9 @@ class ForumPost(models.Model):
     study_group = models.ForeignKey(StudyGroup, on_delete=models.CASCADE, null=True, blank=True, related_name='posts')
     views = models.IntegerField(default=0)
     likes = models.ManyToManyField(User, related_name='liked_posts', blank=True)
+    # Denormalized counts, kept in sync by quizzes/forum.py and signals
+    comment_count = models.IntegerField(default=0, editable=False)
+    like_count = models.IntegerField(default=0, editable=False)
     is_pinned = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -321,12 +523,21 @@ class ForumComment(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='forum_comments')
     content = models.TextField()
     parent_comment = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
+    # Materialized path: zero-padded ids of the ancestors and the comment
+    # itself ("0000000012/0000000031/"), so a thread sorts in display order
+    path = models.CharField(max_length=255, blank=True, editable=False)
+    depth = models.IntegerField(default=0, editable=False)
+    reply_count = models.IntegerField(default=0, editable=False)
     likes = models.ManyToManyField(User, related_name='liked_comments', blank=True)
+    like_count = models.IntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['post', 'path'], name='forum_comment_thread_idx'),
+        ]
     
     def __str__(self):
         return f"Comment by {self.author.username} on {self.post.title[:30]}"
@@ -399,4 +610,35 @@ class UserPreference(models.Model):
     theme = models.CharField(max_length=10, default='light', choices=[('light', 'Light'), ('dark', 'Dark')])
     
     def __str__(self):
-        return f"{self.user.username} Preferences"
\ No newline at end of file
+        return f"{self.user.username} Preferences"
+
+class QueuedEvent(models.Model):
+    """Durable queue of side effects processed by the run_workers command"""
+    EVENT_TYPES = [
+        ('results_submitted', 'Results Submitted'),
+        ('counters_changed', 'Counters Changed'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('failed', 'Failed'),
+    ]
+
+    event_type = models.CharField(max_length=50, choices=EVENT_TYPES)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='queued_events')
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now, help_text="Not processed before this time (retry backoff)")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['available_at']
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} for {self.user.username} ({self.status})"
@@ -0,0 +1,53 @@
+"""
+Per-action query budgets for viewsets.
+
+A viewset declares how many SQL queries each action may issue, e.g.
+
+    class BookmarkViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
+        query_budgets = {'list': 2}
+
+Budgets are constants: an endpoint that needs more queries as rows grow is
+an N+1 bug. Going over budget logs a warning, or raises QueryBudgetExceeded
+when settings.QUERY_BUDGET_STRICT is on (the test suite turns it on).
+"""
+import logging
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    """connection.execute_wrapper that counts executed queries"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMixin:
+    query_budgets = {}
+
+    def dispatch(self, request, *args, **kwargs):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = super().dispatch(request, *args, **kwargs)
+
+        budget = self.query_budgets.get(getattr(self, 'action', None))
+        if budget is not None and counter.count > budget:
+            message = (
+                f"{type(self).__name__}.{self.action} ran {counter.count} queries "
+                f"(budget {budget}) for {request.method} {request.path}"
+            )
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
@@ -0,0 +1,48 @@
+"""
+Loading a quiz's questions from uploaded JSON (admin upload and import_quiz).
+
+A re-upload updates the questions already in the quiz in place, matched by
+question text, so their UserAnswer history, QuestionStats and the ids in
+result grading snapshots stay valid. Only questions missing from the upload
+are deleted, and their history with them.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+
+from .content_cache import invalidate_quiz
+from .models import Question, UserAnswer
+
+UPLOADED_FIELDS = ['question_text', 'options', 'correct_option', 'explanation', 'difficulty', 'subject']
+
+
+def replace_questions(quiz, questions_data, subject=None):
+    """
+    Make the quiz's questions match `questions_data` (validated upload
+    dicts). Returns (updated, created, removed, answers_removed) counts.
+    """
+    existing = defaultdict(list)
+    for question in quiz.questions.order_by('id'):
+        existing[question.question_text].append(question)
+
+    updated, created = [], []
+    for q_data in questions_data:
+        matches = existing.get(q_data['question_text'])
+        question = matches.pop(0) if matches else Question(quiz=quiz)
+        question.question_text = q_data['question_text']
+        question.options = q_data['options']
+        question.correct_option = q_data['correct_option']
+        question.explanation = q_data.get('explanation', '')
+        question.difficulty = q_data.get('difficulty', 'medium')
+        question.subject = subject
+        (updated if question.pk else created).append(question)
+    removed = [question.pk for questions in existing.values() for question in questions]
+
+    with transaction.atomic():
+        answers_removed = UserAnswer.objects.filter(question_id__in=removed).count() if removed else 0
+        Question.objects.filter(pk__in=removed).delete()
+        Question.objects.bulk_update(updated, UPLOADED_FIELDS, batch_size=500)
+        Question.objects.bulk_create(created)
+        # Bulk writes skip the question signals
+        invalidate_quiz(quiz.id)
+    return len(updated), len(created), len(removed), answers_removed
@@ -4,8 +4,9 @@ from .models import (
     Quiz, Question, Result, StudyMaterial, Notification,
     UserProfile, Subject, Badge, Streak, Bookmark, QuestionReport,
     Achievement, UserAnalytics, DailyChallenge, ChallengeParticipation,
-    QuestionFeedback, ForumPost, ForumComment
+    QuestionFeedback, ForumPost, ForumComment, QuestionStats
 )
+from .forum import MAX_COMMENT_DEPTH
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -36,6 +37,11 @@ class QuestionSerializer(serializers.ModelSerializer):
         model = Question
         fields = '__all__'
 
+class QuestionStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = QuestionStats
+        exclude = ['id']
+
 class ResultSerializer(serializers.ModelSerializer):
     quiz_title = serializers.CharField(source='quiz.title', read_only=True)
     quiz_category = serializers.CharField(source='quiz.category', read_only=True)
@@ -44,6 +50,7 @@ class ResultSerializer(serializers.ModelSerializer):
     class Meta:
         model = Result
         fields = '__all__'
+        read_only_fields = ['date_taken']
 
 class StudyMaterialSerializer(serializers.ModelSerializer):
     class Meta:
@@ -55,6 +62,21 @@ class NotificationSerializer(serializers.ModelSerializer):
         model = Notification
         fields = '__all__'
 
+class InboxEntrySerializer(serializers.ModelSerializer):
+    """A notification as listed to one user; pass (notification, is_read) pairs"""
+    is_read = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Notification
+        fields = ['id', 'title', 'message', 'notification_type', 'timestamp', 'is_active', 'is_broadcast', 'is_read']
+
+    def to_representation(self, entry):
+        notification, self._is_read = entry
+        return super().to_representation(notification)
+
+    def get_is_read(self, obj):
+        return self._is_read
+
 class BadgeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Badge
@@ -130,16 +152,41 @@ class QuestionFeedbackSerializer(serializers.ModelSerializer):
 
 class ForumCommentSerializer(serializers.ModelSerializer):
     author_username = serializers.CharField(source='author.username', read_only=True)
+    is_liked = serializers.SerializerMethodField()
     class Meta:
         model = ForumComment
-        fields = '__all__'
-        read_only_fields = ['author', 'created_at', 'updated_at', 'likes']
+        # Liker lists can be huge; clients get like_count and is_liked instead
+        exclude = ['likes']
+        read_only_fields = ['author', 'created_at', 'updated_at']
+
+    def get_is_liked(self, obj):
+        return getattr(obj, 'is_liked', False)
+
+    def validate(self, attrs):
+        # The stored path (quizzes/forum.py) fixes a comment's place in its thread
+        if self.instance is not None:
+            for field in ('post', 'parent_comment'):
+                if field in attrs and attrs[field] != getattr(self.instance, field):
+                    raise serializers.ValidationError({field: 'Comments cannot be moved.'})
+            return attrs
+        parent = attrs.get('parent_comment')
+        if parent is not None:
+            if parent.post_id != attrs['post'].id:
+                raise serializers.ValidationError({'parent_comment': 'Reply to a comment on the same post.'})
+            if parent.depth >= MAX_COMMENT_DEPTH:
+                raise serializers.ValidationError({'parent_comment': 'This thread is too deep to reply to.'})
+        return attrs
 
 class ForumPostSerializer(serializers.ModelSerializer):
     author_username = serializers.CharField(source='author.username', read_only=True)
-    comments_count = serializers.IntegerField(source='comments.count', read_only=True)
-    likes_count = serializers.IntegerField(source='likes.count', read_only=True)
+    # Older names of the counts, kept for existing clients
+    comments_count = serializers.IntegerField(source='comment_count', read_only=True)
+    likes_count = serializers.IntegerField(source='like_count', read_only=True)
+    is_liked = serializers.SerializerMethodField()
     class Meta:
         model = ForumPost
-        fields = '__all__'
-        read_only_fields = ['author', 'created_at', 'updated_at', 'views', 'likes']
+        exclude = ['likes']
+        read_only_fields = ['author', 'created_at', 'updated_at', 'views']
+
+    def get_is_liked(self, obj):
+        return getattr(obj, 'is_liked', False)
@@ -0,0 +1,216 @@
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.dispatch import receiver
+
+from .achievements import bump_counter, raise_longest_streak, record_result_counters
+from .analytics import record_analytics
+from .content_cache import invalidate_quiz
+from .delivery import deliver_notification
+from .forum import bump_comment_count, place_comment, recount_likes
+from .events import enqueue
+from . import live
+from .inbox import announce_broadcast, fan_out, recount_unread, sync_broadcast_flag
+from .leaderboard import record_results
+from .models import (
+    Quiz, Question, Subject, Result, Bookmark, QuestionReport, Streak, Notification, InboxItem,
+    ChallengeParticipation, ForumPost, ForumComment
+)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def question_changed(sender, instance, **kwargs):
+    """Drop cached answer keys whenever a question is edited or removed"""
+    invalidate_quiz(instance.quiz_id)
+
+
+@receiver(post_delete, sender=Quiz)
+def quiz_deleted(sender, instance, **kwargs):
+    invalidate_quiz(instance.id)
+
+
+@receiver(post_save, sender=Subject)
+def subject_changed(sender, instance, created, **kwargs):
+    """Rendered questions include the subject name"""
+    if created:
+        return
+    for quiz_id in Question.objects.filter(subject=instance).values_list('quiz_id', flat=True).distinct():
+        invalidate_quiz(quiz_id)
+
+
+@receiver(post_save, sender=Result)
+def result_saved(sender, instance, created, **kwargs):
+    """
+    Keep leaderboard totals and analytics in step (bulk_create callers record
+    results themselves); achievement counters are added by the
+    results_submitted event
+    """
+    if created:
+        record_results([instance])
+        record_analytics([instance])
+
+
+@receiver(post_delete, sender=Result)
+def result_deleted(sender, instance, **kwargs):
+    record_results([instance], sign=-1)
+    record_analytics([instance], sign=-1)
+    record_result_counters([instance], sign=-1)
+
+
+@receiver(post_save, sender=Bookmark)
+@receiver(post_save, sender=QuestionReport)
+def counted_item_created(sender, instance, created, **kwargs):
+    """Bookmarks and reports feed the bookworm/helpful achievement counters"""
+    if created:
+        bump_counter(instance.user_id, 'bookmarks' if sender is Bookmark else 'reports')
+        enqueue('counters_changed', instance.user)
+
+
+@receiver(post_delete, sender=Bookmark)
+@receiver(post_delete, sender=QuestionReport)
+def counted_item_deleted(sender, instance, **kwargs):
+    bump_counter(instance.user_id, 'bookmarks' if sender is Bookmark else 'reports', -1)
+
+
+@receiver(post_save, sender=Streak)
+def streak_saved(sender, instance, **kwargs):
+    raise_longest_streak(instance.user_id, instance.longest_streak)
+
+
+@receiver(m2m_changed, sender=Notification.target_users.through)
+def notification_targets_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Fan targeted notifications out to inboxes and keep unread counters exact"""
+    if action == 'pre_clear':
+        # pk_set is not given for clears; remember who was affected
+        if reverse:
+            instance._cleared_inbox = list(
+                sender.objects.filter(user_id=instance.pk).values_list('notification_id', flat=True)
+            )
+        else:
+            instance._cleared_inbox = list(
+                sender.objects.filter(notification_id=instance.pk).values_list('user_id', flat=True)
+            )
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_inbox', [])
+    if reverse:
+        pairs = [(instance.pk, notification_id) for notification_id in pk_set]
+    else:
+        pairs = [(user_id, instance.pk) for user_id in pk_set]
+
+    if action == 'post_add':
+        if reverse:
+            for notification in Notification.objects.filter(pk__in=pk_set):
+                fan_out(notification, [instance.pk])
+        else:
+            fan_out(instance, pk_set)
+        return
+
+    user_ids = {user_id for user_id, _ in pairs}
+    notification_ids = {notification_id for _, notification_id in pairs}
+    InboxItem.objects.filter(user_id__in=user_ids, notification_id__in=notification_ids).delete()
+    sync_broadcast_flag(notification_ids)
+    recount_unread(user_ids)
+
+
+@receiver(post_save, sender=Notification)
+def notification_saved(sender, instance, created, **kwargs):
+    """
+    Active notifications are queued for push delivery (once); activating
+    or deactivating a targeted notification changes unread counts
+    """
+    if instance.is_active:
+        # Recipients are resolved by the delivery worker, after target users are set
+        deliver_notification(instance)
+    if created and instance.is_active:
+        # Checked at commit: target users are usually added after the insert
+        transaction.on_commit(lambda: announce_broadcast(instance.pk))
+    if not created and not instance.is_broadcast:
+        recount_unread(list(InboxItem.objects.filter(notification=instance).values_list('user_id', flat=True)))
+
+
+@receiver(pre_delete, sender=Notification)
+def notification_deleting(sender, instance, **kwargs):
+    instance._inbox_users = list(InboxItem.objects.filter(notification=instance).values_list('user_id', flat=True))
+
+
+@receiver(post_delete, sender=Notification)
+def notification_deleted(sender, instance, **kwargs):
+    if getattr(instance, '_inbox_users', None):
+        recount_unread(instance._inbox_users)
+
+
+@receiver(post_save, sender=ChallengeParticipation)
+def participation_saved(sender, instance, **kwargs):
+    """Push the changed leaderboard row to clients watching the challenge"""
+    live.publish(live.challenge_topic(instance.challenge_id), 'leaderboard', {
+        'challenge': instance.challenge_id,
+        'user_id': instance.user_id,
+        'username': instance.user.username,
+        'completed': instance.completed,
+        'points_earned': instance.points_earned,
+        'rank': instance.rank,
+        'completed_at': instance.completed_at,
+    })
+
+
+@receiver(post_save, sender=ForumComment)
+def forum_comment_saved(sender, instance, created, **kwargs):
+    if created:
+        place_comment(instance)
+        bump_comment_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=ForumComment)
+def forum_comment_deleted(sender, instance, **kwargs):
+    bump_comment_count(instance.post_id, -1)
+    if instance.parent_comment_id:
+        ForumComment.objects.filter(pk=instance.parent_comment_id).update(reply_count=F('reply_count') - 1)
+
+
+@receiver(m2m_changed, sender=ForumPost.likes.through)
+@receiver(m2m_changed, sender=ForumComment.likes.through)
+def forum_likes_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """
+    Likes changed outside the like endpoints (admin, .add()/.remove()):
+    recount the affected rows. The endpoints update the counter themselves.
+    """
+    liked_model = model if reverse else type(instance)
+    if action == 'pre_clear':
+        if reverse:
+            source = liked_model.likes.field.m2m_field_name()
+            instance._cleared_likes = list(
+                sender.objects.filter(user_id=instance.pk).values_list(f'{source}_id', flat=True)
+            )
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        ids = [instance.pk]
+    elif action == 'post_clear':
+        ids = getattr(instance, '_cleared_likes', [])
+    else:
+        ids = pk_set
+    recount_likes(liked_model, ids)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    # Cascade deletes of the likes tables send no m2m_changed
+    instance._liked_posts = list(
+        ForumPost.likes.through.objects.filter(user_id=instance.pk).values_list('forumpost_id', flat=True)
+    )
+    instance._liked_comments = list(
+        ForumComment.likes.through.objects.filter(user_id=instance.pk).values_list('forumcomment_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    recount_likes(ForumPost, getattr(instance, '_liked_posts', []))
+    recount_likes(ForumComment, getattr(instance, '_liked_comments', []))
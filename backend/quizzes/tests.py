@@ -1,12 +1,41 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.db import connection
+import threading
+from django.core.cache import cache
+import asyncio
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from io import StringIO
+import gzip
+import os
+import tempfile
+import json
+from unittest import mock, skipIf
 from django.contrib.auth.models import User
 from rest_framework.test import APIClient
 from django.utils import timezone
-from datetime import timedelta
-from .models import Quiz, Question, Result, Achievement, DailyChallenge, UserAnalytics, ForumPost, ForumComment, QuestionFeedback
+from datetime import timedelta, datetime, date, timezone as dt_timezone
+from rest_framework.authtoken.models import Token
+from .models import (
+	Quiz, Question, Result, Achievement, DailyChallenge, UserAnalytics, ForumPost, ForumComment, QuestionFeedback,
+	QueuedEvent, Badge, Streak, UserAnswer, Subject, Bookmark, QuestionReport, StudyMaterial, Notification,
+	UserProfile, ChallengeParticipation, LeaderboardAggregate, QuestionStats, UserCounters, ActivityCalendar,
+	InboxItem, NotificationState, UserPreference, Delivery, DeliveryRecipient, LiveEvent
+)
+from .events import enqueue, process_pending_events, apply_results_submitted
+from .gamification import update_user_streak
+from .query_budget import QueryBudgetExceeded
+from .leaderboard import buckets_for
+from .local_time import next_boundary
+from .views import BookmarkViewSet
+from .counter_buffer import counters
+from .content_cache import get_answer_key
+from . import achievements, delivery, live
+from rest_framework_simplejwt.tokens import AccessToken
 
 class QuizFlowTests(TestCase):
 	def setUp(self):
+		cache.clear()
 		self.user = User.objects.create_user(username='tester', password='pass123')
 		self.client = APIClient()
 		self.client.force_authenticate(user=self.user)
@@ -21,11 +50,183 @@ class QuizFlowTests(TestCase):
 		}
 		resp = self.client.post('/api/results/submit/', payload, format='json')
 		self.assertEqual(resp.status_code, 201)
+		# Side effects are applied by the background workers
+		self.assertFalse(Achievement.objects.filter(user=self.user).exists())
+		self.assertEqual(process_pending_events(), 1)
 		# Perfect score achievement
 		self.assertTrue(Achievement.objects.filter(user=self.user, achievement_type='perfect_score').exists())
 		# Result created
 		self.assertEqual(Result.objects.filter(user=self.user).count(), 1)
 
+	def test_answer_key_cache_follows_question_edits(self):
+		answers = {str(self.q1.id): 0, str(self.q2.id): 1}
+		payload = {'quiz_id': self.quiz.id, 'answers': answers}
+		self.assertEqual(self.client.post('/api/results/submit/', payload, format='json').json()['score'], 100)
+		with self.captureOnCommitCallbacks(execute=True):
+			self.q2.correct_option = 0
+			self.q2.save()
+			# Nothing cached moves before the edit commits
+			self.assertEqual(get_answer_key(self.quiz.id)[1][1], 1)
+		self.assertEqual(get_answer_key(self.quiz.id)[1][1], 0)
+		self.assertEqual(self.client.post('/api/results/submit/', payload, format='json').json()['score'], 50)
+		with self.captureOnCommitCallbacks(execute=True):
+			self.q2.delete()
+		self.assertEqual(self.client.post('/api/results/submit/', payload, format='json').json()['score'], 100)
+
+	def test_quiz_reupload_keeps_answer_history(self):
+		self.client.post('/api/results/submit/', {
+			'quiz_id': self.quiz.id, 'answers': {str(self.q1.id): 0, str(self.q2.id): 1}
+		}, format='json')
+		data = {'title': 'Sample Quiz', 'category': 'GK', 'duration': 5, 'questions': [
+			{'question_text': 'New', 'options': ['A', 'B', 'C'], 'correct_option': 2},
+			{'question_text': 'Q1', 'options': ['A', 'B'], 'correct_option': 1, 'explanation': 'Fixed key'},
+		]}
+		with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as upload:
+			json.dump(data, upload)
+		self.addCleanup(os.remove, upload.name)
+		out = StringIO()
+		with self.captureOnCommitCallbacks(execute=True):
+			call_command('import_quiz', upload.name, update=True, stdout=out)
+		self.assertIn('Deleted 1 question(s) missing from the file, with 1 recorded answer(s)', out.getvalue())
+		self.q1.refresh_from_db()
+		self.assertEqual((self.q1.correct_option, self.q1.explanation), (1, 'Fixed key'))
+		self.assertEqual(UserAnswer.objects.get(user=self.user).question_id, self.q1.id)
+		self.assertFalse(Question.objects.filter(pk=self.q2.id).exists())
+		self.assertEqual(set(self.quiz.questions.values_list('question_text', flat=True)), {'Q1', 'New'})
+		self.assertEqual(get_answer_key(self.quiz.id)[0][1:], (1, 2))
+
+	def test_submit_batch_grades_all_and_awards_once(self):
+		taken_at = (timezone.now() - timedelta(hours=3)).isoformat()
+		payload = {'submissions': [
+			{'quiz_id': self.quiz.id, 'answers': {str(self.q1.id): 0, str(self.q2.id): 1}, 'client_timestamp': taken_at},
+			{'quiz_id': self.quiz.id, 'answers': {str(self.q1.id): 1}},
+			{'quiz_id': 9999, 'answers': {}},
+		]}
+		resp = self.client.post('/api/results/submit_batch/', payload, format='json')
+		self.assertEqual(resp.status_code, 201)
+		data = resp.json()
+		self.assertEqual([r['score'] for r in data['results']], [100, 0])
+		self.assertEqual(data['errors'], [{'index': 2, 'error': 'Quiz not found'}])
+		first = Result.objects.filter(user=self.user).order_by('date_taken').first()
+		self.assertLess(first.date_taken, timezone.now() - timedelta(hours=2))
+		self.assertEqual(QueuedEvent.objects.count(), 1)
+		process_pending_events()
+		self.assertTrue(Achievement.objects.filter(user=self.user, achievement_type='first_quiz').exists())
+		self.assertTrue(Achievement.objects.filter(user=self.user, achievement_type='perfect_score').exists())
+
+	def test_submit_batch_reports_repeated_idempotency_key(self):
+		payload = {'submissions': [
+			{'quiz_id': self.quiz.id, 'answers': {str(self.q1.id): 0}, 'idempotency_key': 'k1'},
+			{'quiz_id': self.quiz.id, 'answers': {str(self.q1.id): 1}, 'idempotency_key': 'k1'},
+		]}
+		data = self.client.post('/api/results/submit_batch/', payload, format='json').json()
+		self.assertEqual(len(data['results']), 1)
+		self.assertEqual(data['errors'], [{'index': 1, 'error': 'Duplicate idempotency key in batch'}])
+		self.assertEqual(Result.objects.filter(user=self.user, idempotency_key='k1').count(), 1)
+
+	def test_out_of_range_choices_are_rejected(self):
+		url = '/api/results/submit/'
+		for choice in [2, -1, 40000]:
+			resp = self.client.post(url, {'quiz_id': self.quiz.id, 'answers': {str(self.q1.id): choice}}, format='json')
+			self.assertEqual((resp.status_code, resp.json()), (400, {'error': 'Invalid answer value'}), choice)
+		payload = {'submissions': [
+			{'quiz_id': self.quiz.id, 'answers': {str(self.q1.id): 1}},
+			{'quiz_id': self.quiz.id, 'answers': {str(self.q2.id): 5}},
+		]}
+		data = self.client.post('/api/results/submit_batch/', payload, format='json').json()
+		self.assertEqual(data['errors'], [{'index': 1, 'error': 'Invalid answer value'}])
+		self.assertEqual(UserAnswer.objects.filter(user=self.user).count(), 2)
+
+	def test_event_retry_is_idempotent(self):
+		payload = {'quiz_id': self.quiz.id, 'answers': {str(self.q1.id): 0, str(self.q2.id): 1}}
+		self.client.post('/api/results/submit/', payload, format='json')
+		event = QueuedEvent.objects.get()
+		# A worker that crashed after applying the effects leaves the event to be retried
+		apply_results_submitted(event)
+		self.assertEqual(process_pending_events(), 1)
+		self.assertEqual(QueuedEvent.objects.count(), 0)
+		self.assertEqual(Badge.objects.filter(user=self.user, type='score_90').count(), 1)
+		self.assertEqual(Achievement.objects.filter(user=self.user, achievement_type='perfect_score').count(), 1)
+		self.assertEqual(Streak.objects.get(user=self.user).current_streak, 1)
+
+	def test_submit_replays_idempotency_key(self):
+		payload = {'quiz_id': self.quiz.id, 'answers': {str(self.q1.id): 0}}
+		first = self.client.post('/api/results/submit/', payload, format='json', HTTP_IDEMPOTENCY_KEY='abc-1')
+		cache.clear()
+		replay = self.client.post('/api/results/submit/', payload, format='json', HTTP_IDEMPOTENCY_KEY='abc-1')
+		again = self.client.post('/api/results/submit/', payload, format='json', HTTP_IDEMPOTENCY_KEY='abc-1')
+		self.assertEqual(replay.status_code, 201)
+		self.assertEqual(replay.json(), first.json())
+		self.assertEqual(again.json(), first.json())
+		self.assertEqual(Result.objects.filter(user=self.user).count(), 1)
+		self.assertEqual(QueuedEvent.objects.count(), 1)
+		batch = {'submissions': [
+			{'quiz_id': self.quiz.id, 'answers': {}, 'idempotency_key': 'abc-1'},
+			{'quiz_id': self.quiz.id, 'answers': {}, 'idempotency_key': 'abc-2'},
+			{'quiz_id': self.quiz.id, 'answers': {}, 'idempotency_key': 'abc-2'},
+		]}
+		resp = self.client.post('/api/results/submit_batch/', batch, format='json')
+		self.assertEqual([r['id'] for r in resp.json()['results']][0], first.json()['id'])
+		self.assertEqual(Result.objects.filter(user=self.user).count(), 2)
+
+	def test_submit_writes_user_answers_and_backfill(self):
+		payload = {'quiz_id': self.quiz.id, 'answers': {str(self.q1.id): 1}}
+		self.client.post('/api/results/submit/', payload, format='json')
+		rows = UserAnswer.objects.filter(user=self.user).order_by('question_id')
+		self.assertEqual([(a.question_id, a.chosen_option, a.is_correct) for a in rows], [(self.q1.id, 1, False), (self.q2.id, None, False)])
+		old = Result.objects.create(user=self.user, quiz=self.quiz, score=50, correct_count=1, wrong_count=1, answers={str(self.q1.id): 0, str(self.q2.id): 0})
+		call_command('backfill_user_answers', chunk_size=1, stdout=StringIO())
+		call_command('backfill_user_answers', stdout=StringIO())
+		self.assertEqual(UserAnswer.objects.filter(result=old).count(), 2)
+		self.assertEqual(UserAnswer.objects.filter(result=old, is_correct=True).get().question_id, self.q1.id)
+
+	def test_result_details_uses_grading_snapshot(self):
+		payload = {'quiz_id': self.quiz.id, 'answers': {str(self.q1.id): 0, str(self.q2.id): 0}}
+		result_id = self.client.post('/api/results/submit/', payload, format='json').json()['id']
+		self.client.get(f'/api/results/{result_id}/details/')
+		# Warm payload cache and forced auth: only the result row
+		with self.assertNumQueries(1):
+			resp = self.client.get(f'/api/results/{result_id}/details/')
+		self.assertEqual([q['is_correct'] for q in resp.json()['questions']], [True, False])
+		# Fixing the answer key later does not change a historical result
+		with self.captureOnCommitCallbacks(execute=True):
+			self.q2.correct_option = 0
+			self.q2.question_text = 'Q2 edited'
+			self.q2.save()
+		data = self.client.get(f'/api/results/{result_id}/details/').json()
+		self.assertEqual([q['is_correct'] for q in data['questions']], [True, False])
+		self.assertEqual(data['questions'][1]['correct_option'], 1)
+		self.assertEqual(data['questions'][1]['question_text'], 'Q2 edited')
+
+	def test_questions_etag_and_gzip(self):
+		url = f'/api/quizzes/{self.quiz.id}/questions/'
+		resp = self.client.get(url)
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual([q['id'] for q in json.loads(resp.content)], [self.q1.id, self.q2.id])
+		etag = resp['ETag']
+		with self.assertNumQueries(0):
+			cached = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+			zipped = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+		self.assertEqual(cached.status_code, 304)
+		self.assertEqual(zipped['Content-Encoding'], 'gzip')
+		self.assertEqual(gzip.decompress(zipped.content), resp.content)
+		self.assertEqual(zipped['ETag'], etag[:-1] + '-gz"')
+		revalidated = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=f'"x", W/{zipped["ETag"]}')
+		self.assertEqual((revalidated.status_code, revalidated['ETag']), (304, zipped['ETag']))
+		for refused in ['gzip;q=0', 'identity', 'br, *;q=0', 'gzip; q=0.0, deflate']:
+			plain = self.client.get(url, HTTP_ACCEPT_ENCODING=refused)
+			self.assertFalse(plain.has_header('Content-Encoding'), refused)
+			self.assertEqual((plain.content, plain['ETag']), (resp.content, etag))
+		self.assertEqual(self.client.get(url, HTTP_ACCEPT_ENCODING='br;q=1, *;q=0.5')['Content-Encoding'], 'gzip')
+		with self.captureOnCommitCallbacks(execute=True):
+			self.q1.question_text = 'Q1 edited'
+			self.q1.save()
+		fresh = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(fresh.status_code, 200)
+		self.assertNotEqual(fresh['ETag'], etag)
+		self.assertEqual(json.loads(fresh.content)[0]['question_text'], 'Q1 edited')
+		self.assertEqual(self.client.get('/api/quizzes/9999/questions/').status_code, 404)
+
 	def test_leaderboard_basic(self):
 		# Create a result for scoring
 		Result.objects.create(user=self.user, quiz=self.quiz, score=80, correct_count=1, wrong_count=1, answers={})
@@ -35,6 +236,63 @@ class QuizFlowTests(TestCase):
 		self.assertGreaterEqual(len(data), 1)
 		self.assertEqual(data[0]['username'], 'tester')
 
+	def test_leaderboard_reads_aggregates(self):
+		other = User.objects.create_user(username='other', password='pass123')
+		it_quiz = Quiz.objects.create(title='IT Quiz', category='IT', total_questions=1, duration=5)
+		Result.objects.create(user=self.user, quiz=self.quiz, score=80, correct_count=1, wrong_count=1)
+		Result.objects.create(user=self.user, quiz=it_quiz, score=40, correct_count=1, wrong_count=1)
+		Result.objects.create(user=other, quiz=self.quiz, score=100, correct_count=2, wrong_count=0,
+			date_taken=timezone.now() - timedelta(days=40))
+		stale = Result.objects.create(user=other, quiz=it_quiz, score=90, correct_count=1, wrong_count=0)
+		stale.delete()
+		board = self.client.get('/api/leaderboard/').json()
+		self.assertEqual([(e['username'], e['total_score'], e['quizzes_taken']) for e in board], [('tester', 120, 2), ('other', 100, 1)])
+		self.assertEqual(board[0]['average_score'], 60)
+		self.assertTrue(board[0]['is_current_user'])
+		self.assertEqual([e['username'] for e in self.client.get('/api/leaderboard/?category=GK').json()], ['other', 'tester'])
+		self.assertEqual([e['username'] for e in self.client.get('/api/leaderboard/?period=monthly').json()], ['tester'])
+		before = sorted(LeaderboardAggregate.objects.values_list('user_id', 'scope', 'bucket', 'total_score', 'quizzes_taken'))
+		LeaderboardAggregate.objects.filter(user=self.user).update(total_score=0)
+		call_command('rebuild_leaderboard', stdout=StringIO())
+		self.assertEqual(sorted(LeaderboardAggregate.objects.values_list('user_id', 'scope', 'bucket', 'total_score', 'quizzes_taken')), before)
+
+	def test_leaderboard_rank_around_me(self):
+		users = [User.objects.create_user(username=f'u{i}') for i in range(8)]
+		for i, user in enumerate(users):
+			Result.objects.create(user=user, quiz=self.quiz, score=10 * (i + 1), correct_count=1, wrong_count=1)
+			UserProfile.objects.create(user=user, profile_picture=f'http://img/{i}')
+		# Ties with u4 (score 50) rank by user id, so tester (created first) is ahead of it
+		Result.objects.create(user=self.user, quiz=self.quiz, score=50, correct_count=1, wrong_count=1)
+		with self.assertNumQueries(5):
+			resp = self.client.get('/api/leaderboard/?around=me&window=2')
+		data = resp.json()
+		self.assertEqual([(e['rank'], e['username']) for e in data], [(2, 'u6'), (3, 'u5'), (4, 'tester'), (5, 'u4'), (6, 'u3')])
+		self.assertEqual(data[0]['profile_picture'], 'http://img/6')
+		self.assertTrue(data[2]['is_current_user'])
+		top = self.client.get('/api/leaderboard/').json()
+		self.assertEqual((top[3]['rank'], top[3]['username']), (4, 'tester'))
+
+	def test_leaderboard_nepal_buckets_and_rolling_windows(self):
+		# 19:00 UTC is already 00:45 the next day in Kathmandu
+		late = datetime(2025, 1, 1, 19, 0, tzinfo=dt_timezone.utc)
+		# Thursday 2 January 2025 is in the Nepali week that began on Sunday 29 December
+		self.assertEqual(buckets_for(late), ['all', 'day:2025-01-02', 'week:2024-12-29', 'month:2025-01'])
+		self.assertEqual(next_boundary('daily', date(2025, 1, 2)).astimezone(dt_timezone.utc), datetime(2025, 1, 2, 18, 15, tzinfo=dt_timezone.utc))
+		self.assertEqual(next_boundary('weekly', date(2025, 1, 2)).date(), date(2025, 1, 5))
+		self.assertEqual(next_boundary('weekly', date(2025, 1, 5)).date(), date(2025, 1, 12))
+		self.assertEqual(next_boundary('monthly', date(2025, 1, 31)).date(), date(2025, 2, 1))
+		other = User.objects.create_user(username='other')
+		now = timezone.now()
+		Result.objects.create(user=self.user, quiz=self.quiz, score=60, correct_count=1, wrong_count=1, date_taken=now - timedelta(days=3))
+		Result.objects.create(user=self.user, quiz=self.quiz, score=60, correct_count=1, wrong_count=1, date_taken=now - timedelta(days=20))
+		Result.objects.create(user=other, quiz=self.quiz, score=100, correct_count=2, wrong_count=0, date_taken=now)
+		last7 = self.client.get('/api/leaderboard/?period=last_7_days').json()
+		self.assertEqual([(e['username'], e['total_score']) for e in last7], [('other', 100), ('tester', 60)])
+		last30 = self.client.get('/api/leaderboard/?period=last_30_days').json()
+		self.assertEqual([(e['username'], e['total_score'], e['quizzes_taken']) for e in last30], [('tester', 120, 2), ('other', 100, 1)])
+		around = self.client.get('/api/leaderboard/?period=last_7_days&around=me').json()
+		self.assertEqual([(e['rank'], e['username']) for e in around], [(1, 'other'), (2, 'tester')])
+
 	def test_analytics_recalculate(self):
 		Result.objects.create(user=self.user, quiz=self.quiz, score=50, correct_count=1, wrong_count=1, answers={})
 		resp = self.client.post('/api/analytics/user/recalculate/')
@@ -43,6 +301,222 @@ class QuizFlowTests(TestCase):
 		analytics = UserAnalytics.objects.get(user=self.user)
 		self.assertEqual(analytics.total_quizzes, 1)
 
+	def test_recompute_ranks(self):
+		users = [User.objects.create_user(username=f'r{i}') for i in range(5)]
+		for i, user in enumerate(users):
+			UserAnalytics.objects.create(user=user, average_score=[40, 90, 60, 90, 10][i], rank=1)
+		call_command('recompute_ranks', chunk_size=2, stdout=StringIO())
+		ranks = dict(UserAnalytics.objects.values_list('user__username', 'rank'))
+		self.assertEqual(ranks, {'r1': 1, 'r3': 2, 'r2': 3, 'r0': 4, 'r4': 5})
+		# recalculate only touches the caller's own row
+		Result.objects.create(user=self.user, quiz=self.quiz, score=70, correct_count=1, wrong_count=1)
+		with self.assertNumQueries(11):
+			resp = self.client.post('/api/analytics/user/recalculate/')
+		self.assertEqual(resp.json()['rank'], 3)
+		self.assertEqual(UserAnalytics.objects.get(user=users[2]).rank, 3)
+
+	def test_analytics_maintained_incrementally(self):
+		it_quiz = Quiz.objects.create(title='IT', category='IT', total_questions=0, duration=5)
+		Result.objects.create(user=self.user, quiz=self.quiz, score=50, correct_count=1, wrong_count=1)
+		Result.objects.create(user=self.user, quiz=self.quiz, score=100, correct_count=2, wrong_count=0)
+		self.client.post('/api/results/submit_batch/', {'submissions': [
+			{'quiz_id': it_quiz.id, 'answers': {}},
+		]}, format='json')
+		analytics = UserAnalytics.objects.get(user=self.user)
+		self.assertEqual(analytics.total_quizzes, 3)
+		self.assertEqual(analytics.total_questions_answered, 4)
+		self.assertEqual(analytics.average_score, 50.0)
+		self.assertEqual(analytics.category_stats[self.quiz.category]['avg_score'], 75.0)
+		self.assertEqual(analytics.category_stats[self.quiz.category]['best_score'], 100)
+		self.assertEqual(analytics.best_category, self.quiz.category)
+		self.assertEqual(analytics.worst_category, 'IT')
+
+		Result.objects.get(quiz=it_quiz).delete()
+		analytics.refresh_from_db()
+		self.assertEqual(analytics.total_quizzes, 2)
+		self.assertNotIn('IT', analytics.category_stats)
+
+		with self.assertNumQueries(1):
+			self.client.get('/api/analytics/user/')
+
+	def test_reconcile_analytics_fixes_drift(self):
+		Result.objects.create(user=self.user, quiz=self.quiz, score=80, correct_count=2, wrong_count=0)
+		UserAnalytics.objects.filter(user=self.user).update(total_quizzes=7, category_stats={})
+		out = StringIO()
+		call_command('reconcile_analytics', stdout=out)
+		self.assertIn('fixed 1 drifted', out.getvalue())
+		analytics = UserAnalytics.objects.get(user=self.user)
+		self.assertEqual(analytics.total_quizzes, 1)
+		self.assertEqual(analytics.category_stats[self.quiz.category]['score_sum'], 80)
+		out = StringIO()
+		call_command('reconcile_analytics', stdout=out)
+		self.assertIn('fixed 0 drifted', out.getvalue())
+
+	def test_analytics_endpoint_cached_per_user(self):
+		with self.captureOnCommitCallbacks(execute=True):
+			Result.objects.create(user=self.user, quiz=self.quiz, score=40, correct_count=0, wrong_count=2)
+			Result.objects.create(user=self.user, quiz=self.quiz, score=100, correct_count=2, wrong_count=0)
+		resp = self.client.get('/api/analytics/')
+		data = resp.json()
+		self.assertEqual(data['total_quizzes'], 2)
+		self.assertEqual(data['average_score'], 70.0)
+		self.assertEqual(data['recent_scores'], [100.0, 40.0])
+		self.assertEqual(data['weak_topics'], [{'quiz__category': 'GK', 'count': 1, 'avg_score': 40.0}])
+		stamp = data['stamp']
+
+		with self.assertNumQueries(0):
+			self.assertEqual(self.client.get('/api/analytics/').json()['stamp'], stamp)
+			self.assertEqual(self.client.get('/api/analytics/', {'since': stamp}).status_code, 304)
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.client.post('/api/results/submit/', {'quiz_id': self.quiz.id, 'answers': {}}, format='json')
+		data = self.client.get('/api/analytics/', {'since': stamp}).json()
+		self.assertNotEqual(data['stamp'], stamp)
+		self.assertEqual(data['total_quizzes'], 3)
+
+	def test_compute_question_stats(self):
+		# Strong students answer q1 right, weak ones miss it; q2 is always right
+		for i, (chosen, seconds) in enumerate([(0, 10), (0, 20), (1, 30)]):
+			user = User.objects.create_user(username=f's{i}')
+			answers = {str(self.q1.id): chosen, str(self.q2.id): 1}
+			self.client.force_authenticate(user)
+			self.client.post('/api/results/submit/', {
+				'quiz_id': self.quiz.id, 'answers': answers,
+				'answer_times': {str(self.q1.id): seconds}
+			}, format='json')
+		# Stored before choices were checked against the options
+		legacy = User.objects.create_user(username='legacy')
+		result = Result.objects.create(user=legacy, quiz=self.quiz, score=50, correct_count=1, wrong_count=1)
+		UserAnswer.objects.bulk_create([
+			UserAnswer(result=result, user=legacy, question=self.q1, chosen_option=2, is_correct=False),
+			UserAnswer(result=result, user=legacy, question=self.q2, chosen_option=1, is_correct=True),
+		])
+		UserAnswer.objects.create(
+			result=Result.objects.first(), user=self.user, question=self.q1, chosen_option=None, is_correct=False
+		)
+		call_command('compute_question_stats', chunk_size=3, stdout=StringIO())
+
+		stats = QuestionStats.objects.get(question=self.q1)
+		self.assertEqual(stats.responses, 5)
+		self.assertEqual(stats.p_value, 0.4)
+		self.assertGreater(stats.discrimination, 0.5)
+		self.assertEqual(stats.option_distribution, [0.4, 0.2])
+		self.assertEqual(stats.unanswered_rate, 0.2)
+		self.assertEqual(stats.avg_time, 20.0)
+		q2_stats = QuestionStats.objects.get(question=self.q2)
+		self.assertEqual(q2_stats.p_value, 1.0)
+		self.assertIsNone(q2_stats.discrimination)
+
+		resp = self.client.get(f'/api/questions/{self.q1.id}/stats/')
+		self.assertEqual(resp.json()['p_value'], 0.4)
+		call_command('compute_question_stats', stdout=StringIO())
+		self.assertEqual(QuestionStats.objects.count(), 2)
+
+	def test_counters_and_achievement_rules(self):
+		it_quiz = Quiz.objects.create(title='IT', category='IT', total_questions=0, duration=5)
+		results = [
+			Result.objects.create(user=self.user, quiz=it_quiz, score=40, correct_count=0, wrong_count=0)
+			for _ in range(20)
+		]
+		# Counters are the worker's job, not the request's
+		self.assertFalse(UserCounters.objects.filter(user=self.user).exists())
+		enqueue('results_submitted', self.user, {'result_ids': [r.id for r in results]})
+		process_pending_events()
+		for question in [self.q1, self.q2]:
+			Bookmark.objects.create(user=self.user, question=question)
+		counters = UserCounters.objects.get(user=self.user)
+		self.assertEqual(counters.total_quizzes, 20)
+		self.assertEqual(counters.category_quizzes, {'IT': 20})
+		self.assertEqual(sum(counters.daily_quizzes.values()), 20)
+		self.assertEqual(counters.bookmarks, 2)
+
+		self.client.post('/api/results/submit/', {'quiz_id': self.quiz.id, 'answers': {}}, format='json')
+		process_pending_events()
+		earned = set(Achievement.objects.filter(user=self.user).values_list('achievement_type', 'category'))
+		self.assertEqual(earned, {('first_quiz', ''), ('category_expert', 'IT'), ('fast_learner', '')})
+		self.assertEqual(set(Badge.objects.filter(user=self.user).values_list('type', flat=True)), {'attempt_10'})
+
+		Bookmark.objects.filter(user=self.user).first().delete()
+		self.assertEqual(UserCounters.objects.get(user=self.user).bookmarks, 1)
+		# Deleting the user must not recreate counter rows on the way out
+		self.user.delete()
+		self.assertFalse(UserCounters.objects.exists())
+
+	def test_concurrently_awarded_badge_is_not_duplicated(self):
+		counters = UserCounters.objects.create(user=self.user, total_quizzes=10)
+		original = achievements.satisfied_rules
+
+		def racing(counters, today):
+			# Another evaluation of the same user commits first
+			Badge.objects.get_or_create(user_id=counters.user_id, type='attempt_10')
+			return original(counters, today)
+
+		with mock.patch.object(achievements, 'satisfied_rules', racing):
+			achievements.evaluate_many([counters])
+		self.assertEqual(Badge.objects.filter(user=self.user, type='attempt_10').count(), 1)
+
+	def test_evaluate_achievements_backfill(self):
+		other = User.objects.create_user(username='other')
+		Result.objects.create(user=other, quiz=self.quiz, score=100, correct_count=2, wrong_count=0)
+		Streak.objects.create(user=other, current_streak=8, longest_streak=8)
+		QuestionReport.objects.bulk_create([
+			QuestionReport(user=other, question=self.q1, issue_type='typo', description='x') for _ in range(10)
+		])
+		UserCounters.objects.filter(user=other).update(total_quizzes=0, perfect_scores=0, best_score=0)
+		out = StringIO()
+		call_command('evaluate_achievements', chunk_size=1, stdout=out)
+		self.assertIn('Evaluated 2 user(s), 5 new award(s)', out.getvalue())
+		counters = UserCounters.objects.get(user=other)
+		self.assertEqual((counters.total_quizzes, counters.reports, counters.longest_streak), (1, 10, 8))
+		self.assertEqual(
+			set(Badge.objects.filter(user=other).values_list('type', flat=True)), {'score_90', 'streak_7'}
+		)
+		self.assertEqual(
+			set(Achievement.objects.filter(user=other).values_list('achievement_type', flat=True)),
+			{'first_quiz', 'perfect_score', 'helpful'}
+		)
+		out = StringIO()
+		call_command('evaluate_achievements', stdout=out)
+		self.assertIn('0 new award(s)', out.getvalue())
+
+	def test_expire_streaks_in_local_time(self):
+		today = date(2025, 1, 10)
+		users = [User.objects.create_user(username=f'k{i}') for i in range(3)]
+		for user, last_active, current in zip(users, [10, 9, 7], [4, 3, 5]):
+			Streak.objects.create(user=user, current_streak=current, longest_streak=5, last_active_date=today.replace(day=last_active))
+		# 20:00 UTC on the 9th is already the 10th in Kathmandu
+		now = datetime(2025, 1, 9, 20, 0, tzinfo=dt_timezone.utc)
+		out = StringIO()
+		with mock.patch('django.utils.timezone.now', return_value=now):
+			call_command('expire_streaks', '--notify', stdout=out)
+		self.assertIn('Expired 1 streak(s), 1 at risk on 2025-01-10', out.getvalue())
+		self.assertEqual(
+			dict(Streak.objects.filter(user__in=users).values_list('user__username', 'current_streak')),
+			{'k0': 4, 'k1': 3, 'k2': 0}
+		)
+		self.assertEqual(cache.get('streaks:at_risk:2025-01-10'), [users[1].id])
+		self.assertEqual(list(Notification.objects.get().target_users.all()), [users[1]])
+
+	def test_activity_calendar_drives_streaks(self):
+		today = date(2025, 1, 2)
+		with mock.patch('quizzes.gamification.local_date', return_value=today):
+			update_user_streak(self.user, {date(2024, 12, 29), date(2024, 12, 30)})
+			self.assertEqual(Streak.objects.get(user=self.user).current_streak, 0)
+			# Offline results synced late fill the gap across new year
+			update_user_streak(self.user, {date(2025, 1, 1), date(2025, 1, 2)})
+			update_user_streak(self.user, {date(2024, 12, 31)})
+		streak = Streak.objects.get(user=self.user)
+		self.assertEqual((streak.current_streak, streak.longest_streak), (5, 5))
+		self.assertEqual(streak.last_active_date, today)
+		self.assertEqual(ActivityCalendar.objects.filter(user=self.user).count(), 2)
+
+		with mock.patch('quizzes.views.local_date', return_value=date(2025, 1, 3)):
+			with self.assertNumQueries(1):
+				data = self.client.get('/api/streak/calendar/', {'year': 2024}).json()
+		self.assertEqual(data['active_days'], ['2024-12-29', '2024-12-30', '2024-12-31'])
+		self.assertEqual((data['current_streak'], data['longest_streak']), (5, 5))
+		self.assertEqual(self.client.get('/api/streak/calendar/', {'year': 'x'}).status_code, 400)
+
 class ChallengeTests(TestCase):
 	def setUp(self):
 		self.user = User.objects.create_user(username='challenger', password='pass123')
@@ -79,7 +553,73 @@ class ForumFeedbackTests(TestCase):
 		self.assertEqual(comment_resp.status_code, 201)
 		comment_id = comment_resp.json()['id']
 		comment_like = self.client.post(f'/api/forum/comments/{comment_id}/like/')
-		self.assertEqual(comment_like.status_code, 200)
+		self.assertEqual(comment_like.json(), {'liked': True, 'like_count': 1})
+		post = self.client.get(f'/api/forum/posts/{post_id}/').json()
+		self.assertEqual((post['comment_count'], post['like_count'], post['is_liked']), (1, 1, True))
+		self.assertNotIn('likes', post)
+		self.assertEqual(self.client.post(f'/api/forum/posts/{post_id}/like/').json(), {'liked': False, 'like_count': 0})
+		self.client.delete(f'/api/forum/comments/{comment_id}/')
+		self.assertEqual(ForumPost.objects.get(pk=post_id).comment_count, 0)
+
+	def test_like_changes_elsewhere_and_reconcile(self):
+		fan = User.objects.create_user(username='fan')
+		post = ForumPost.objects.create(title='P', content='c', author=self.user)
+		post.likes.add(self.user, fan)
+		fan.liked_posts.clear()
+		post.refresh_from_db()
+		self.assertEqual(post.like_count, 1)
+		self.user.delete()
+		post = ForumPost.objects.create(title='P2', content='c', author=fan)
+		ForumComment.objects.create(post=post, author=fan, content='c')
+		ForumPost.objects.filter(pk=post.pk).update(comment_count=7, like_count=3)
+		out = StringIO()
+		call_command('reconcile_forum_counters', stdout=out)
+		self.assertIn('fixed 1 drifted', out.getvalue())
+		post.refresh_from_db()
+		self.assertEqual((post.comment_count, post.like_count), (1, 0))
+
+	def test_comments_tree(self):
+		post = ForumPost.objects.create(title='Answer key', content='c', author=self.user)
+		other_post = ForumPost.objects.create(title='Other', content='c', author=self.user)
+
+		def reply(parent, text):
+			data = {'post': post.id, 'content': text}
+			if parent:
+				data['parent_comment'] = parent
+			return self.client.post('/api/forum/comments/', data, format='json').json()['id']
+
+		first = reply(None, 'first')
+		deep = reply(reply(first, 'first.1'), 'first.1.1')
+		reply(first, 'first.2')
+		second = reply(None, 'second')
+		reply(None, 'third')
+		self.assertEqual(ForumComment.objects.get(pk=deep).depth, 2)
+		self.assertEqual(ForumComment.objects.get(pk=first).reply_count, 2)
+
+		def contents(nodes):
+			return [(n['content'], contents(n['replies'])) for n in nodes]
+
+		url = f'/api/forum/posts/{post.id}/comments_tree/'
+		with self.assertNumQueries(1):
+			resp = self.client.get(url, {'limit': 2})
+		self.assertEqual(contents(resp.json()), [
+			('first', [('first.1', [('first.1.1', [])]), ('first.2', [])]),
+			('second', []),
+		])
+		rest = self.client.get(url, {'limit': 2, 'after': resp['X-Next-After']})
+		self.assertEqual(contents(rest.json()), [('third', [])])
+		self.assertNotIn('X-Next-After', rest)
+
+		shallow = self.client.get(url, {'max_depth': 1}).json()
+		self.assertEqual(contents(shallow)[0], ('first', [('first.1', []), ('first.2', [])]))
+		self.assertEqual(shallow[0]['replies'][0]['reply_count'], 1)
+		subtree = self.client.get(url, {'root': shallow[0]['replies'][0]['id']}).json()
+		self.assertEqual(contents(subtree), [('first.1', [('first.1.1', [])])])
+
+		cross = self.client.post('/api/forum/comments/', {'post': other_post.id, 'content': 'x', 'parent_comment': second}, format='json')
+		self.assertEqual(cross.status_code, 400)
+		self.assertEqual(self.client.get(f'/api/forum/posts/{other_post.id}/comments_tree/').json(), [])
+		self.assertEqual(self.client.get('/api/forum/posts/999/comments_tree/').status_code, 404)
 
 	def test_question_feedback_once(self):
 		fb_resp = self.client.post('/api/feedback/', {'question': self.question.id, 'difficulty_rating':3, 'is_helpful':True}, format='json')
@@ -90,3 +630,472 @@ class ForumFeedbackTests(TestCase):
 		self.assertEqual(QuestionFeedback.objects.filter(user=self.user, question=self.question).count(), 1)
 		updated = QuestionFeedback.objects.get(user=self.user, question=self.question)
 		self.assertEqual(updated.difficulty_rating, 4)
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class QueryBudgetTests(TestCase):
+	"""List endpoints must stay within their query budget at realistic row counts"""
+	ROWS = 30
+
+	@classmethod
+	def setUpTestData(cls):
+		cls.user = User.objects.create_user(username='budget', password='pass123')
+		cls.others = [User.objects.create_user(username=f'other{i}') for i in range(5)]
+		cls.token = Token.objects.create(user=cls.user)
+		UserProfile.objects.create(user=cls.user)
+		UserAnalytics.objects.create(user=cls.user)
+		Streak.objects.create(user=cls.user)
+		now = timezone.now()
+		for badge_type, _ in Badge.BADGE_TYPES:
+			Badge.objects.create(user=cls.user, type=badge_type)
+		for i in range(cls.ROWS):
+			subject = Subject.objects.create(name=f'Subject {i}')
+			quiz = Quiz.objects.create(title=f'Quiz {i}', category='GK', total_questions=1, duration=5, subject=subject)
+			question = Question.objects.create(quiz=quiz, question_text=f'Q{i}', options=['A', 'B'], correct_option=0, subject=subject)
+			result = Result.objects.create(user=cls.user, quiz=quiz, score=50, correct_count=1, wrong_count=1)
+			Bookmark.objects.create(user=cls.user, question=question, result=result)
+			QuestionReport.objects.create(user=cls.user, question=question, issue_type='typo', description='x')
+			QuestionFeedback.objects.create(user=cls.user, question=question, difficulty_rating=3)
+			StudyMaterial.objects.create(title=f'Material {i}', category='GK')
+			Achievement.objects.create(user=cls.user, achievement_type='first_quiz', category=str(i), title='t', description='d')
+			notification = Notification.objects.create(title=f'N{i}', message='m')
+			notification.target_users.add(cls.user, *cls.others)
+			challenge = DailyChallenge.objects.create(
+				title=f'C{i}', description='d', challenge_type='daily', quiz=quiz,
+				start_date=now - timedelta(hours=1), end_date=now + timedelta(hours=1)
+			)
+			ChallengeParticipation.objects.create(user=cls.user, challenge=challenge)
+			post = ForumPost.objects.create(title=f'P{i}', content='c', author=cls.others[i % 5])
+			post.likes.add(*cls.others)
+			comment = ForumComment.objects.create(post=post, author=cls.others[i % 5], content='c')
+			comment.likes.add(*cls.others)
+
+	def setUp(self):
+		self.client = APIClient()
+		# Real token auth so the budgets include the authentication query
+		self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+	def assertListWithinBudget(self, url):
+		resp = self.client.get(url)
+		self.assertEqual(resp.status_code, 200)
+		self.assertGreaterEqual(len(resp.json()), 1)
+		return resp.json()
+
+	def test_quizzes_list(self):
+		self.assertEqual(len(self.assertListWithinBudget('/api/quizzes/')), self.ROWS)
+
+	def test_questions_list(self):
+		self.assertListWithinBudget('/api/questions/')
+
+	def test_results_list(self):
+		self.assertListWithinBudget('/api/results/')
+
+	def test_subjects_list(self):
+		self.assertListWithinBudget('/api/subjects/')
+
+	def test_badges_list(self):
+		self.assertListWithinBudget('/api/badges/')
+
+	def test_streak_list(self):
+		self.assertListWithinBudget('/api/streak/')
+
+	def test_bookmarks_list(self):
+		self.assertListWithinBudget('/api/bookmarks/')
+
+	def test_reports_list(self):
+		self.assertListWithinBudget('/api/reports/')
+
+	def test_study_materials_list(self):
+		self.assertListWithinBudget('/api/study-materials/')
+
+	def test_notifications_list(self):
+		self.assertListWithinBudget('/api/notifications/')
+
+	def test_profile_list(self):
+		self.assertListWithinBudget('/api/profile/')
+
+	def test_achievements_list(self):
+		self.assertListWithinBudget('/api/achievements/')
+
+	def test_user_analytics_list(self):
+		self.assertListWithinBudget('/api/analytics/user/')
+
+	def test_challenges_list(self):
+		self.assertListWithinBudget('/api/challenges/')
+
+	def test_challenge_participation_list(self):
+		self.assertListWithinBudget('/api/challenge-participation/')
+
+	def test_feedback_list(self):
+		self.assertListWithinBudget('/api/feedback/')
+
+	def test_forum_posts_list(self):
+		posts = self.assertListWithinBudget('/api/forum/posts/')
+		self.assertEqual({(p['comments_count'], p['likes_count']) for p in posts}, {(1, 5)})
+
+	def test_forum_comments_list(self):
+		self.assertListWithinBudget('/api/forum/comments/')
+
+	def test_streak_calendar(self):
+		self.assertEqual(self.client.get('/api/streak/calendar/').status_code, 200)
+
+	def test_result_details_cold_cache(self):
+		# No grading snapshot, so the answer key is loaded as well
+		result = Result.objects.filter(user=self.user).first()
+		cache.clear()
+		self.assertEqual(self.client.get(f'/api/results/{result.id}/details/').status_code, 200)
+
+	def test_notification_actions(self):
+		# A user with no inbox state yet is the worst case for every action
+		reader = User.objects.create_user(username='fresh')
+		self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=reader).key)
+		targeted = Notification.objects.create(title='T', message='m')
+		targeted.target_users.add(reader)
+		broadcast = Notification.objects.create(title='B', message='m')
+		calls = [
+			('post', f'/api/notifications/{broadcast.id}/read/'),
+			('post', f'/api/notifications/{targeted.id}/read/'),
+			('get', '/api/notifications/'),
+			('get', f'/api/notifications/{targeted.id}/'),
+			('get', f'/api/notifications/{broadcast.id}/'),
+			('get', '/api/notifications/unread_count/'),
+			('post', '/api/notifications/read_all/'),
+		]
+		for method, url in calls:
+			NotificationState.objects.filter(user=reader).delete()
+			self.assertEqual(getattr(self.client, method)(url).status_code, 200, url)
+
+	def test_over_budget_raises_in_strict_mode(self):
+		with mock.patch.dict(BookmarkViewSet.query_budgets, {'list': 1}):
+			with self.assertRaises(QueryBudgetExceeded):
+				self.client.get('/api/bookmarks/')
+
+
+# Shared-cache in-memory SQLite fails concurrent row locks with "table is locked"
+# instead of waiting; run with DATABASE_URL pointing at PostgreSQL for those
+needs_row_locks = skipIf(connection.vendor == 'sqlite', 'needs a database with row-level locking')
+
+
+class NotificationInboxTests(TestCase):
+	def setUp(self):
+		self.user = User.objects.create_user(username='reader')
+		self.other = User.objects.create_user(username='other')
+		self.client = APIClient()
+		self.client.force_authenticate(self.user)
+
+	def unread(self):
+		return self.client.get('/api/notifications/unread_count/').json()['unread_count']
+
+	def test_fan_out_merge_and_read_state(self):
+		b1 = Notification.objects.create(title='B1', message='m')
+		t1 = Notification.objects.create(title='T1', message='m')
+		t1.target_users.add(self.user, self.other)
+		b2 = Notification.objects.create(title='B2', message='m')
+		hidden = Notification.objects.create(title='Other only', message='m')
+		hidden.target_users.add(self.other)
+
+		t1.refresh_from_db()
+		self.assertFalse(t1.is_broadcast)
+		self.assertEqual(InboxItem.objects.filter(notification=t1).count(), 2)
+		self.assertEqual(self.unread(), 3)
+
+		resp = self.client.get('/api/notifications/', {'limit': 2})
+		self.assertEqual([n['title'] for n in resp.json()], ['B2', 'T1'])
+		rest = self.client.get('/api/notifications/', {'before': resp['X-Next-Before']}).json()
+		self.assertEqual([n['title'] for n in rest], ['B1'])
+
+		self.client.post(f'/api/notifications/{t1.id}/read/')
+		self.client.post(f'/api/notifications/{b2.id}/read/')
+		self.assertEqual(self.unread(), 1)
+		self.assertEqual(NotificationState.objects.get(user=self.user).unread_count, 0)
+		self.assertEqual(self.client.post(f'/api/notifications/{hidden.id}/read/').status_code, 404)
+		read = {n['title']: n['is_read'] for n in self.client.get('/api/notifications/').json()}
+		self.assertEqual(read, {'B2': True, 'T1': True, 'B1': False})
+
+		self.client.post('/api/notifications/read_all/')
+		self.assertEqual(self.unread(), 0)
+		Notification.objects.create(title='B3', message='m')
+		self.assertEqual(self.unread(), 1)
+
+		anonymous = APIClient().get('/api/notifications/').json()
+		self.assertEqual([n['title'] for n in anonymous], ['B3', 'B2', 'B1'])
+
+	def test_retrieve_broadcast_read_by_several_users(self):
+		broadcast = Notification.objects.create(title='B', message='m')
+		for user in (self.user, self.other):
+			client = APIClient()
+			client.force_authenticate(user)
+			client.post(f'/api/notifications/{broadcast.id}/read/')
+		resp = self.client.get(f'/api/notifications/{broadcast.id}/')
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual(resp.json()['title'], 'B')
+
+	def test_broadcast_read_marks_do_not_survive_targeting(self):
+		broadcast = Notification.objects.create(title='B', message='m')
+		self.client.post(f'/api/notifications/{broadcast.id}/read/')
+		broadcast.target_users.add(self.other)
+		self.assertEqual(self.client.get('/api/notifications/').json(), [])
+		self.assertEqual(self.client.get(f'/api/notifications/{broadcast.id}/').status_code, 404)
+		self.assertEqual(self.unread(), 0)
+
+	def test_target_changes_keep_counters_exact(self):
+		n = Notification.objects.create(title='T', message='m')
+		n.target_users.add(self.user, self.other)
+		n.target_users.remove(self.other)
+		self.assertEqual(NotificationState.objects.get(user=self.other).unread_count, 0)
+		n.is_active = False
+		n.save()
+		self.assertEqual(self.unread(), 0)
+		n.is_active = True
+		n.save()
+		self.assertEqual(self.unread(), 1)
+		n.target_users.clear()
+		n.refresh_from_db()
+		self.assertTrue(n.is_broadcast)
+		self.assertFalse(InboxItem.objects.exists())
+		self.assertEqual(NotificationState.objects.get(user=self.user).unread_count, 0)
+		self.user.notification_set.add(n)
+		self.assertEqual(NotificationState.objects.get(user=self.user).unread_count, 1)
+		n.delete()
+		self.assertEqual(NotificationState.objects.get(user=self.user).unread_count, 0)
+
+
+class CounterBufferTests(TestCase):
+	def setUp(self):
+		counters.flush()
+		self.user = User.objects.create_user(username='reader')
+		self.client = APIClient()
+		self.client.force_authenticate(self.user)
+		self.posts = [ForumPost.objects.create(title=f'P{i}', content='c', author=self.user) for i in range(3)]
+
+	@override_settings(COUNTER_BUFFER_FLUSH_SECONDS=60, COUNTER_BUFFER_MAX_PENDING=1000)
+	def test_taps_are_coalesced_into_one_update(self):
+		with self.assertNumQueries(0):
+			for post in self.posts:
+				for _ in range(post.id):
+					counters.increment(ForumPost, post.id, 'views')
+		resp = self.client.post(f'/api/forum/posts/{self.posts[0].id}/view/')
+		self.assertEqual(resp.json()['views'], self.posts[0].id + 1)
+		self.assertEqual(ForumPost.objects.get(pk=self.posts[0].pk).views, 0)
+		with self.assertNumQueries(3):
+			self.assertEqual(counters.flush(), 3)
+		self.assertEqual(
+			list(ForumPost.objects.order_by('id').values_list('views', flat=True)),
+			[self.posts[0].id + 1, self.posts[1].id, self.posts[2].id]
+		)
+
+	@override_settings(COUNTER_BUFFER_FLUSH_SECONDS=60, COUNTER_BUFFER_MAX_PENDING=5)
+	def test_size_threshold_flushes(self):
+		for _ in range(5):
+			counters.increment(ForumPost, self.posts[0].id, 'views')
+		self.assertEqual(ForumPost.objects.get(pk=self.posts[0].pk).views, 5)
+		self.assertEqual(counters.pending(ForumPost, self.posts[0].id, 'views'), 0)
+
+	@override_settings(COUNTER_BUFFER_FLUSH_SECONDS=0)
+	def test_unbuffered_writes_through(self):
+		material = StudyMaterial.objects.create(title='M', category='GK')
+		resp = self.client.post(f'/api/study-materials/{material.id}/increment_download/')
+		self.assertEqual(resp.json()['download_count'], 1)
+		material.refresh_from_db()
+		self.assertEqual(material.download_count, 1)
+
+
+@override_settings(DELIVERY_TRANSPORTS={
+	'default': {'BACKEND': 'quizzes.delivery.LoopbackTransport', 'BATCH_SIZE': 2},
+})
+class DeliveryTests(TestCase):
+	def setUp(self):
+		delivery.reset_transports()
+		self.users = [User.objects.create_user(username=f'u{i}') for i in range(5)]
+		UserPreference.objects.create(user=self.users[4], notifications_enabled=False)
+		self.transport = delivery.get_transport()
+
+	def drain(self):
+		while delivery.process_deliveries():
+			pass
+
+	def test_exam_alert_is_batched_to_everyone(self):
+		alert = Notification.objects.create(title='Exam', message='Sunday', notification_type='exam')
+		job = Delivery.objects.get(notification=alert)
+		self.assertEqual(job.kind, 'exam')
+		self.drain()
+		self.assertEqual([len(ids) for _, ids in self.transport.sent], [2, 2])
+		self.assertEqual(
+			sorted(i for _, ids in self.transport.sent for i in ids), [u.id for u in self.users[:4]]
+		)
+		job.refresh_from_db()
+		self.assertEqual((job.status, job.total_recipients, job.sent_count), ('done', 4, 4))
+		# Saving it again does not push twice
+		alert.save()
+		self.assertEqual(Delivery.objects.count(), 1)
+
+	def test_failed_recipients_back_off_and_give_up(self):
+		self.transport.fail_users = {self.users[0].id: 'unregistered'}
+		target = Notification.objects.create(title='T', message='m')
+		target.target_users.add(self.users[0], self.users[1])
+		self.drain()
+		failing = DeliveryRecipient.objects.get(user=self.users[0])
+		self.assertEqual((failing.status, failing.attempts, failing.last_error), ('pending', 1, 'unregistered'))
+		self.assertGreater(failing.available_at, timezone.now())
+		self.assertEqual(DeliveryRecipient.objects.get(user=self.users[1]).status, 'sent')
+
+		for _ in range(delivery.MAX_ATTEMPTS - 1):
+			DeliveryRecipient.objects.filter(pk=failing.pk).update(available_at=timezone.now())
+			self.drain()
+		failing.refresh_from_db()
+		self.assertEqual((failing.status, failing.attempts), ('failed', delivery.MAX_ATTEMPTS))
+		job = Delivery.objects.get(notification=target)
+		self.assertEqual((job.status, job.sent_count, job.failed_count), ('done', 1, 1))
+
+	def test_reminders_follow_reminder_time(self):
+		now = datetime(2025, 3, 1, 2, 17, tzinfo=dt_timezone.utc)  # 08:02 in Kathmandu
+		UserPreference.objects.create(user=self.users[0], reminder_time='08:03')
+		UserPreference.objects.create(user=self.users[1], reminder_time='08:30')
+		UserPreference.objects.create(user=self.users[2], reminder_time='08:04')
+		Streak.objects.create(user=self.users[2], last_active_date=date(2025, 3, 1))
+		self.assertTrue(delivery.queue_due_reminders(now))
+		self.assertFalse(delivery.queue_due_reminders(now))
+		self.drain()
+		self.assertEqual([ids for _, ids in self.transport.sent], [[self.users[0].id]])
+
+
+@override_settings(LIVE_BROKER='quizzes.live.LocalBroker')
+class LiveStreamTests(TestCase):
+	def setUp(self):
+		live.reset_broker()
+		self.user = User.objects.create_user(username='watcher')
+		self.other = User.objects.create_user(username='other')
+		quiz = Quiz.objects.create(title='Q', category='GK', total_questions=0, duration=5)
+		now = timezone.now()
+		self.challenge = DailyChallenge.objects.create(
+			title='C', description='d', challenge_type='daily', quiz=quiz,
+			start_date=now - timedelta(hours=1), end_date=now + timedelta(hours=1)
+		)
+
+	async def next_frame(self, content):
+		return (await asyncio.wait_for(anext(content), 2)).decode()
+
+	async def test_stream_pushes_notifications_and_leaderboard_rows(self):
+		token = str(AccessToken.for_user(self.user))
+		response = await self.async_client.get('/api/live/', {'token': token, 'challenge': self.challenge.id})
+		self.assertEqual(response['Content-Type'], 'text/event-stream')
+		content = response.streaming_content
+		self.assertIn('event: ready', await self.next_frame(content))
+
+		def changes():
+			with self.captureOnCommitCallbacks(execute=True):
+				hidden = Notification.objects.create(title='Not yours', message='m')
+				hidden.target_users.add(self.other)
+				mine = Notification.objects.create(title='Yours', message='m')
+				mine.target_users.add(self.user)
+			with self.captureOnCommitCallbacks(execute=True):
+				ChallengeParticipation.objects.create(
+					user=self.other, challenge=self.challenge, completed=True, points_earned=40
+				)
+		await sync_to_async(changes)()
+
+		frame = await self.next_frame(content)
+		self.assertIn('event: notification', frame)
+		self.assertIn('"title": "Yours"', frame)
+		frame = await self.next_frame(content)
+		self.assertIn('event: leaderboard', frame)
+		self.assertIn('"points_earned": 40', frame)
+		# A client disconnect cancels the response task mid-wait
+		waiting = asyncio.ensure_future(anext(content))
+		await asyncio.sleep(0)
+		waiting.cancel()
+		with self.assertRaises(asyncio.CancelledError):
+			await waiting
+		self.assertEqual(live.get_broker().subscriptions, {})
+
+	async def test_bad_token_is_rejected(self):
+		response = await self.async_client.get('/api/live/', {'token': 'nope'})
+		self.assertEqual(response.status_code, 401)
+
+	async def test_database_broker_relays_rows_from_other_processes(self):
+		broker = live.DatabaseBroker(poll=False)
+		subscription = broker.subscribe([live.user_topic(self.user.id)])
+		self.assertEqual(await sync_to_async(broker.relay)(), 0)
+		# What another web worker's publish() leaves behind
+		await sync_to_async(broker.publish)(live.user_topic(self.other.id), {'type': 'notification', 'data': {'n': 1}})
+		await sync_to_async(broker.publish)(live.user_topic(self.user.id), {'type': 'notification', 'data': {'n': 2}})
+		self.assertEqual(await sync_to_async(broker.relay)(), 2)
+
+		event = await subscription.get(2)
+		self.assertEqual((event['type'], event['data']), ('notification', {'n': 2}))
+		self.assertEqual(event['id'], (await LiveEvent.objects.alatest('id')).id)
+		self.assertIsNone(await subscription.get(0.05))
+		subscription.close()
+		self.assertEqual(await sync_to_async(broker.relay)(), 0)
+		self.assertIsNone(broker.last_id)
+
+
+	@override_settings(LIVE_BROKER='quizzes.live.DatabaseBroker')
+	def test_database_broker_publishes_a_group_in_one_insert(self):
+		live.reset_broker()
+		self.addCleanup(live.reset_broker)
+		users = User.objects.bulk_create([User(username=f'member{i}') for i in range(200)])
+		notification = Notification.objects.create(title='Group', message='m')
+		with self.captureOnCommitCallbacks() as callbacks:
+			notification.target_users.add(*users)
+		with self.assertNumQueries(1):
+			for callback in callbacks:
+				callback()
+		self.assertEqual(LiveEvent.objects.filter(event_type='notification').count(), 200)
+
+class ConcurrencyTests(TransactionTestCase):
+	"""Hammer the counter endpoints from threads with their own connections"""
+	THREADS = 8
+
+	def setUp(self):
+		cache.clear()
+		self.user = User.objects.create_user(username='racer')
+		self.quiz = Quiz.objects.create(title='Race', category='GK', total_questions=1, duration=5)
+		self.question = Question.objects.create(quiz=self.quiz, question_text='Q', options=['A', 'B'], correct_option=0)
+
+	def run_concurrently(self, func):
+		barrier = threading.Barrier(self.THREADS)
+		errors = []
+
+		def worker():
+			try:
+				barrier.wait()
+				func()
+			except Exception as exc:
+				errors.append(exc)
+			finally:
+				connection.close()
+
+		threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		self.assertEqual(errors, [])
+
+	def post(self, url, data=None):
+		client = APIClient()
+		client.force_authenticate(self.user)
+		self.assertLess(client.post(url, data or {}, format='json').status_code, 300)
+
+	def test_download_and_view_counters_lose_no_updates(self):
+		material = StudyMaterial.objects.create(title='M', category='GK')
+		post = ForumPost.objects.create(title='P', content='c', author=self.user)
+		self.run_concurrently(lambda: self.post(f'/api/study-materials/{material.id}/increment_download/'))
+		self.run_concurrently(lambda: self.post(f'/api/forum/posts/{post.id}/view/'))
+		counters.flush()
+		material.refresh_from_db()
+		post.refresh_from_db()
+		self.assertEqual(material.download_count, self.THREADS)
+		self.assertEqual(post.views, self.THREADS)
+
+	@needs_row_locks
+	def test_concurrent_bookmark_toggles_never_error(self):
+		self.run_concurrently(lambda: self.post('/api/bookmarks/toggle/', {'question_id': self.question.id}))
+		self.assertLessEqual(Bookmark.objects.filter(user=self.user).count(), 1)
+
+	@needs_row_locks
+	def test_concurrent_streak_updates_agree(self):
+		self.run_concurrently(lambda: update_user_streak(User.objects.get(pk=self.user.pk)))
+		streak = Streak.objects.get(user=self.user)
+		self.assertEqual((streak.current_streak, streak.longest_streak), (1, 1))
+		self.assertEqual(ActivityCalendar.objects.filter(user=self.user).count(), 1)
@@ -6,14 +6,20 @@ from rest_framework.authtoken.models import Token
 from rest_framework.renderers import JSONRenderer
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
-from django.db.models import Q, Avg, Count, Sum, Max
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.db import transaction, IntegrityError
+from django.db.models import Exists, OuterRef, Q
 from django.utils import timezone
-from datetime import timedelta
+from django.utils.dateparse import parse_datetime
 from .models import (
     Quiz, Question, Result, StudyMaterial, Notification, UserProfile,
     Subject, Badge, Streak, Bookmark, QuestionReport, Achievement,
     UserAnalytics, DailyChallenge, ChallengeParticipation,
-    QuestionFeedback, ForumPost, ForumComment
+    QuestionFeedback, ForumPost, ForumComment, UserAnswer, QuestionStats, InboxItem
 )
 from .serializers import (
     QuizSerializer, QuestionSerializer, ResultSerializer, UserSerializer,
@@ -22,249 +28,352 @@ from .serializers import (
     QuestionReportSerializer, AchievementSerializer, UserAnalyticsSerializer,
     DailyChallengeSerializer, ChallengeParticipationSerializer,
     LeaderboardEntrySerializer, QuestionFeedbackSerializer,
-    ForumPostSerializer, ForumCommentSerializer
+    ForumPostSerializer, ForumCommentSerializer, QuestionStatsSerializer, InboxEntrySerializer
 )
-
-def update_user_streak(user):
-    """Update user's streak based on their quiz activity"""
-    streak, created = Streak.objects.get_or_create(user=user)
-    today = timezone.now().date()
-    
-    if created or streak.last_active_date is None:
-        # First time taking a quiz
-        streak.current_streak = 1
-        streak.longest_streak = 1
-        streak.last_active_date = today
-        streak.save()
-        print(f"Streak initialized for {user.username}: 1 day")
-        return
-    
-    # Check if already took a quiz today
-    if streak.last_active_date == today:
-        # Already took a quiz today, no change
-        print(f"Streak unchanged for {user.username}: already active today")
-        return
-    
-    # Check if it's consecutive days
-    yesterday = today - timedelta(days=1)
-    if streak.last_active_date == yesterday:
-        # Consecutive day! Increment streak
-        streak.current_streak += 1
-        if streak.current_streak > streak.longest_streak:
-            streak.longest_streak = streak.current_streak
-        streak.last_active_date = today
-        streak.save()
-        print(f"Streak increased for {user.username}: {streak.current_streak} days")
-        
-        # Award 7-day streak badge
-        if streak.current_streak >= 7:
-            award_badge(user, 'streak_7')
-    else:
-        # Streak broken, reset to 1
-        streak.current_streak = 1
-        streak.last_active_date = today
-        streak.save()
-        print(f"Streak reset for {user.username}: was inactive since {streak.last_active_date}")
-
-def award_badge(user, badge_type):
-    """Award a badge to user if they don't have it already"""
-    badge, created = Badge.objects.get_or_create(user=user, type=badge_type)
-    if created:
-        print(f"🏆 Badge '{badge_type}' awarded to {user.username}!")
-        return True
-    return False
-
-def check_and_award_badges(user, score):
-    """Check if user earned any badges and award them"""
-    # Award 90%+ score badge
-    if score >= 90:
-        award_badge(user, 'score_90')
-    
-    # Award 10 quizzes badge
-    total_quizzes = Result.objects.filter(user=user).count()
-    if total_quizzes >= 10:
-        award_badge(user, 'attempt_10')
-    # Achievements integration (simple triggers)
-    if total_quizzes == 1:
-        Achievement.objects.get_or_create(
-            user=user,
-            achievement_type='first_quiz',
-            defaults={
-                'title': 'First Quiz Completed',
-                'description': 'Completed the first quiz',
-                'icon': 'rocket',
-                'points': 10
-            }
-        )
-    if score == 100:
-        Achievement.objects.get_or_create(
-            user=user,
-            achievement_type='perfect_score',
-            defaults={
-                'title': 'Perfect Score',
-                'description': 'Achieved a 100% score in a quiz',
-                'icon': 'star',
-                'points': 25
-            }
-        )
-
-class QuizViewSet(viewsets.ModelViewSet):
-    queryset = Quiz.objects.all()
+from .content_cache import (
+    get_content_version, get_answer_key, get_versioned_answer_key,
+    get_question_payload, get_rendered_questions, grade_answers, build_user_answers,
+    parse_answer_times
+)
+from .counter_buffer import counters
+from .events import enqueue
+from .activity import active_days, history, summarize, year_bits
+from .analytics import analytics_payload, get_analytics_stamp, rebuild_analytics, record_analytics
+from . import forum, inbox, live
+from .leaderboard import GLOBAL_SCOPE, rank_window, record_results, top_entries
+from .local_time import local_date
+from .query_budget import QueryBudgetMixin
+
+MAX_BATCH_SUBMISSIONS = 100
+IDEMPOTENCY_KEY_MAX_LENGTH = 64
+IDEMPOTENCY_CACHE_SECONDS = 60 * 60 * 24
+MAX_LIVE_CHALLENGES = 10
+
+
+def _accepts_gzip(accept_encoding):
+    """Whether an Accept-Encoding header allows gzip (q=0 refuses it)"""
+    quality = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        quality[coding.strip().lower()] = q
+    return quality.get('gzip', quality.get('*', 0)) > 0
+
+
+class QuizViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
+    queryset = Quiz.objects.select_related('subject')
+    query_budgets = {'list': 2, 'retrieve': 2}
     serializer_class = QuizSerializer
     permission_classes = [AllowAny]  # Allow viewing quizzes without auth
 
     @action(detail=True, methods=['get'])
     def questions(self, request, pk=None):
-        quiz = self.get_object()
-        questions = Question.objects.filter(quiz=quiz).order_by('id')
-        serializer = QuestionSerializer(questions, many=True)
-        return Response(serializer.data)
+        # Served from pre-rendered bytes per quiz content version; clients
+        # revalidate with If-None-Match and usually get a 304
+        if not str(pk).isdigit():
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        quiz_id = int(pk)
+        # Each encoding is a different body, so it gets its own strong ETag
+        gzip_ok = _accepts_gzip(request.headers.get('Accept-Encoding', ''))
+        suffix = '-gz' if gzip_ok else ''
+        current = f'quiz-{quiz_id}-{get_content_version(quiz_id)}'
+        sent = [tag.strip().removeprefix('W/') for tag in request.headers.get('If-None-Match', '').split(',')]
+        matched = next((tag for tag in sent if tag in (f'"{current}"', f'"{current}-gz"')), None)
+        if matched:
+            response = HttpResponseNotModified()
+            etag = matched
+        else:
+            rendered = get_rendered_questions(quiz_id)
+            if rendered is None:
+                return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+            version, body, gzipped = rendered
+            etag = f'"quiz-{quiz_id}-{version}{suffix}"'
+            if gzip_ok:
+                response = HttpResponse(gzipped, content_type='application/json')
+                response['Content-Encoding'] = 'gzip'
+            else:
+                response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        response['Vary'] = 'Accept-Encoding'
+        return response
 
-class QuestionViewSet(viewsets.ModelViewSet):
-    queryset = Question.objects.all()
+class QuestionViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
+    queryset = Question.objects.select_related('subject')
+    query_budgets = {'list': 2, 'retrieve': 2, 'stats': 2}
     serializer_class = QuestionSerializer
     permission_classes = [IsAuthenticated]
 
-class ResultViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        """Item statistics from the last compute_question_stats run"""
+        stats = QuestionStats.objects.filter(question_id=pk).first() if str(pk).isdigit() else None
+        if stats is None:
+            return Response({'error': 'No statistics yet'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(QuestionStatsSerializer(stats).data)
+
+class ResultViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     queryset = Result.objects.all()
     serializer_class = ResultSerializer
     permission_classes = [IsAuthenticated]
+    # details, cold cache: token, result, question payload and, for results
+    # stored before grading snapshots, the answer key
+    query_budgets = {'list': 2, 'retrieve': 2, 'details': 4}
 
     def get_queryset(self):
-        return Result.objects.filter(user=self.request.user).order_by('-date_taken')
+        return Result.objects.filter(user=self.request.user).select_related('quiz', 'user').order_by('-date_taken')
 
     @action(detail=False, methods=['post'])
     def submit(self, request):
         quiz_id = request.data.get('quiz_id')
         answers = request.data.get('answers', {})
 
+        # Retried requests carrying the same key get the original response back
+        idempotency_key = request.headers.get('Idempotency-Key') or request.data.get('idempotency_key')
+        if idempotency_key:
+            if len(str(idempotency_key)) > IDEMPOTENCY_KEY_MAX_LENGTH:
+                return Response({'error': 'Idempotency key too long'}, status=status.HTTP_400_BAD_REQUEST)
+            idempotency_key = str(idempotency_key)
+            cache_key = f'submit:{request.user.id}:{idempotency_key}'
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return Response(cached, status=status.HTTP_201_CREATED)
+            existing = Result.objects.filter(user=request.user, idempotency_key=idempotency_key).first()
+            if existing:
+                data = ResultSerializer(existing).data
+                cache.set(cache_key, data, IDEMPOTENCY_CACHE_SECONDS)
+                return Response(data, status=status.HTTP_201_CREATED)
+
         try:
             quiz = Quiz.objects.get(id=quiz_id)
-            questions = Question.objects.filter(quiz=quiz).order_by('id')
-
-            correct_count = 0
-            wrong_count = 0
-            total_questions = len(questions)
-
-            print(f"\n=== QUIZ SUBMISSION ===")
-            print(f"Quiz ID: {quiz_id}, Total Questions: {total_questions}")
-            print(f"Received answers: {answers}")
-
-            for question in questions:
-                user_answer = answers.get(str(question.id))
-                # Also try integer key
-                if user_answer is None:
-                    user_answer = answers.get(question.id)
-                
-                is_correct = False
-                if user_answer is not None:
-                    user_answer_int = int(user_answer) if not isinstance(user_answer, int) else user_answer
-                    is_correct = user_answer_int == question.correct_option
-                    
-                    print(f"Q{question.id}: user={user_answer_int}, correct={question.correct_option}, match={is_correct}")
-                    
-                    if is_correct:
-                        correct_count += 1
-                    else:
-                        wrong_count += 1
-                else:
-                    print(f"Q{question.id}: No answer provided")
-                    wrong_count += 1
-
-            score = (correct_count / total_questions * 100) if total_questions > 0 else 0
-            
-            print(f"Final Score: {score}% (Correct: {correct_count}, Wrong: {wrong_count})")
-            print(f"======================\n")
+            answer_key_version, answer_key = get_versioned_answer_key(quiz.id)
+            try:
+                correct_count, wrong_count, score, graded = grade_answers(answer_key, answers)
+            except (AttributeError, TypeError, ValueError):
+                return Response({'error': 'Invalid answer value'}, status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                with transaction.atomic():
+                    result = Result.objects.create(
+                        user=request.user,
+                        quiz=quiz,
+                        score=score,
+                        correct_count=correct_count,
+                        wrong_count=wrong_count,
+                        answers=answers,  # Store user answers
+                        graded_answers=graded,
+                        answer_key_version=answer_key_version,
+                        idempotency_key=idempotency_key or None
+                    )
+                    UserAnswer.objects.bulk_create(build_user_answers(
+                        result, graded, parse_answer_times(request.data.get('answer_times'))
+                    ))
+                    # Streak and badges are applied by the background workers
+                    enqueue('results_submitted', request.user, {'result_ids': [result.id]})
+            except IntegrityError:
+                if not idempotency_key:
+                    raise
+                # A concurrent retry with the same key got there first
+                result = Result.objects.get(user=request.user, idempotency_key=idempotency_key)
+
+            serializer = ResultSerializer(result)
+            if idempotency_key:
+                cache.set(cache_key, serializer.data, IDEMPOTENCY_CACHE_SECONDS)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        except Quiz.DoesNotExist:
+            return Response({'error': 'Quiz not found'}, status=status.HTTP_404_NOT_FOUND)
 
-            result = Result.objects.create(
+    @action(detail=False, methods=['post'])
+    def submit_batch(self, request):
+        """Submit quizzes taken offline in one call: {"submissions": [{quiz_id, answers, answer_times?, client_timestamp}]}"""
+        submissions = request.data.get('submissions')
+        if not isinstance(submissions, list) or not submissions:
+            return Response({'error': 'submissions must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(submissions) > MAX_BATCH_SUBMISSIONS:
+            return Response(
+                {'error': f'At most {MAX_BATCH_SUBMISSIONS} submissions per batch'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        quiz_ids = set()
+        idempotency_keys = set()
+        for item in submissions:
+            if isinstance(item, dict) and str(item.get('quiz_id', '')).isdigit():
+                quiz_ids.add(int(item['quiz_id']))
+            if isinstance(item, dict) and item.get('idempotency_key'):
+                idempotency_keys.add(str(item['idempotency_key']))
+        quizzes = Quiz.objects.in_bulk(quiz_ids)
+        # Submissions already stored by an earlier attempt of this sync
+        existing = {
+            r.idempotency_key: r
+            for r in Result.objects.filter(user=request.user, idempotency_key__in=idempotency_keys)
+        } if idempotency_keys else {}
+
+        now = timezone.now()
+        pending = []
+        ordered = []
+        seen_keys = set()
+        errors = []
+        for index, item in enumerate(submissions):
+            if not isinstance(item, dict) or not str(item.get('quiz_id', '')).isdigit():
+                errors.append({'index': index, 'error': 'quiz_id required'})
+                continue
+            idempotency_key = str(item['idempotency_key']) if item.get('idempotency_key') else None
+            if idempotency_key:
+                if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+                    errors.append({'index': index, 'error': 'Idempotency key too long'})
+                    continue
+                if idempotency_key in existing:
+                    ordered.append(existing[idempotency_key])
+                    continue
+                if idempotency_key in seen_keys:
+                    errors.append({'index': index, 'error': 'Duplicate idempotency key in batch'})
+                    continue
+                seen_keys.add(idempotency_key)
+            quiz = quizzes.get(int(item['quiz_id']))
+            if quiz is None:
+                errors.append({'index': index, 'error': 'Quiz not found'})
+                continue
+            answers = item.get('answers') or {}
+            if not isinstance(answers, dict):
+                errors.append({'index': index, 'error': 'answers must be an object'})
+                continue
+            try:
+                answer_key_version, answer_key = get_versioned_answer_key(quiz.id)
+                correct_count, wrong_count, score, graded = grade_answers(answer_key, answers)
+            except (TypeError, ValueError):
+                errors.append({'index': index, 'error': 'Invalid answer value'})
+                continue
+
+            # Offline results keep the time they were taken, but never a future one
+            date_taken = None
+            if item.get('client_timestamp'):
+                try:
+                    date_taken = parse_datetime(str(item['client_timestamp']))
+                except ValueError:
+                    date_taken = None
+            if date_taken is None:
+                date_taken = now
+            elif timezone.is_naive(date_taken):
+                date_taken = timezone.make_aware(date_taken)
+            date_taken = min(date_taken, now)
+
+            result = Result(
                 user=request.user,
                 quiz=quiz,
                 score=score,
                 correct_count=correct_count,
                 wrong_count=wrong_count,
-                answers=answers  # Store user answers
+                answers=answers,
+                graded_answers=graded,
+                answer_key_version=answer_key_version,
+                date_taken=date_taken,
+                idempotency_key=idempotency_key
             )
+            pending.append((result, graded, parse_answer_times(item.get('answer_times'))))
+            ordered.append(result)
 
-            # Update user streak
-            update_user_streak(request.user)
-            
-            # Check and award badges
-            check_and_award_badges(request.user, score)
+        try:
+            with transaction.atomic():
+                results = Result.objects.bulk_create([result for result, _, _ in pending])
+                record_results(results)
+                record_analytics(results)
+                UserAnswer.objects.bulk_create([
+                    row for result, graded, times in pending
+                    for row in build_user_answers(result, graded, times)
+                ])
+                if results:
+                    # One event so gamification runs once for the whole batch
+                    enqueue('results_submitted', request.user, {'result_ids': [r.id for r in results]})
+        except IntegrityError:
+            # A concurrent attempt of the same sync stored some of these; retrying replays them
+            return Response(
+                {'error': 'Submissions are already being processed, retry the request'},
+                status=status.HTTP_409_CONFLICT
+            )
 
-            serializer = ResultSerializer(result)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        except Quiz.DoesNotExist:
-            return Response({'error': 'Quiz not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(
+            {'results': ResultSerializer(ordered, many=True).data, 'errors': errors},
+            status=status.HTTP_201_CREATED if ordered else status.HTTP_400_BAD_REQUEST
+        )
     
     @action(detail=True, methods=['get'])
     def details(self, request, pk=None):
         """Get detailed result with all questions, user answers, and correct answers"""
         try:
-            result = self.get_object()
-            quiz = result.quiz
-            questions = Question.objects.filter(quiz=quiz).order_by('id')
-            
-            detailed_questions = []
-            for question in questions:
-                # Try to get user answer with both string and int keys
-                user_answer = result.answers.get(str(question.id))
-                if user_answer is None:
-                    user_answer = result.answers.get(question.id)
-                
-                # Convert to int if it's not None
-                if user_answer is not None:
-                    user_answer_int = int(user_answer) if not isinstance(user_answer, int) else user_answer
-                else:
-                    user_answer_int = None
-                
-                # Check if answer is correct
-                is_correct = user_answer_int == question.correct_option if user_answer_int is not None else False
-                
-                # Debug logging
-                print(f"Question {question.id}: user_answer={user_answer}, user_answer_int={user_answer_int}, correct={question.correct_option}, is_correct={is_correct}")
-                
-                detailed_questions.append({
-                    'id': question.id,
-                    'question_text': question.question_text,
-                    'options': question.options,
-                    'correct_option': question.correct_option,
-                    'user_answer': user_answer_int,
-                    'is_correct': is_correct,
-                    'explanation': question.explanation,
-                    'difficulty': question.difficulty
-                })
-            
-            return Response({
-                'id': result.id,
-                'quiz': {
-                    'id': quiz.id,
-                    'title': quiz.title,
-                    'category': quiz.category
-                },
-                'score': result.score,
-                'correct_count': result.correct_count,
-                'wrong_count': result.wrong_count,
-                'date_taken': result.date_taken,
-                'questions': detailed_questions
-            })
-        except Result.DoesNotExist:
+            result = self.get_queryset().select_related('quiz').get(pk=pk)
+        except (Result.DoesNotExist, ValueError):
             return Response({'error': 'Result not found'}, status=status.HTTP_404_NOT_FOUND)
+        quiz = result.quiz
+
+        graded = result.graded_answers
+        if not graded:
+            # Results stored before grading snapshots: grade against the current key
+            try:
+                graded = grade_answers(get_answer_key(quiz.id), result.answers or {})[3]
+            except (AttributeError, TypeError, ValueError):
+                graded = []  # Answers no longer fit the questions; show no review
+
+        # Question text comes from the shared per-quiz payload; correctness
+        # comes from the snapshot so later answer-key edits don't rewrite history
+        payload = get_question_payload(quiz.id)
+        detailed_questions = []
+        for question_id, user_answer, correct_option in graded:
+            question = payload.get(question_id)
+            if question is None:
+                continue  # Question deleted since
+            detailed_questions.append({
+                'id': question_id,
+                'question_text': question['question_text'],
+                'options': question['options'],
+                'correct_option': correct_option,
+                'user_answer': user_answer,
+                'is_correct': user_answer == correct_option,
+                'explanation': question['explanation'],
+                'difficulty': question['difficulty']
+            })
+
+        return Response({
+            'id': result.id,
+            'quiz': {
+                'id': quiz.id,
+                'title': quiz.title,
+                'category': quiz.category
+            },
+            'score': result.score,
+            'correct_count': result.correct_count,
+            'wrong_count': result.wrong_count,
+            'date_taken': result.date_taken,
+            'answer_key_version': result.answer_key_version,
+            'questions': detailed_questions
+        })
 
-class SubjectViewSet(viewsets.ModelViewSet):
+class SubjectViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     queryset = Subject.objects.all().order_by('name')
+    query_budgets = {'list': 2}
     serializer_class = SubjectSerializer
     permission_classes = [AllowAny]
 
-class BadgeViewSet(viewsets.ReadOnlyModelViewSet):
+class BadgeViewSet(QueryBudgetMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = BadgeSerializer
     permission_classes = [IsAuthenticated]
+    query_budgets = {'list': 2}
 
     def get_queryset(self):
         return Badge.objects.filter(user=self.request.user)
 
-class StreakViewSet(viewsets.ModelViewSet):
+class StreakViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     serializer_class = StreakSerializer
     permission_classes = [IsAuthenticated]
+    # Token lookup plus the user's calendar rows
+    query_budgets = {'list': 2, 'calendar': 2}
 
     def get_queryset(self):
         return Streak.objects.filter(user=self.request.user)
@@ -272,12 +381,36 @@ class StreakViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class BookmarkViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def calendar(self, request):
+        """Heatmap of active days in ?year= (default this year, Nepal time) plus streaks"""
+        today = local_date()
+        try:
+            year = int(request.query_params.get('year', today.year))
+        except ValueError:
+            return Response({'error': 'Invalid year'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 2000 <= year <= today.year + 1:
+            return Response({'error': 'Invalid year'}, status=status.HTTP_400_BAD_REQUEST)
+
+        origin, bits = history(request.user.id)
+        current, longest, last_active = summarize(origin, bits, today)
+        days = active_days(year_bits(origin, bits, year), year)
+        return Response({
+            'year': year,
+            'active_days': [day.isoformat() for day in days],
+            'total_active_days': len(days),
+            'current_streak': current,
+            'longest_streak': longest,
+            'last_active_date': last_active.isoformat() if last_active else None,
+        })
+
+class BookmarkViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     serializer_class = BookmarkSerializer
     permission_classes = [IsAuthenticated]
+    query_budgets = {'list': 2, 'retrieve': 2}
 
     def get_queryset(self):
-        return Bookmark.objects.filter(user=self.request.user)
+        return Bookmark.objects.filter(user=self.request.user).select_related('question__quiz')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -290,30 +423,36 @@ class BookmarkViewSet(viewsets.ModelViewSet):
             return Response({'error': 'question_id required'}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            question = Question.objects.get(id=question_id)
-            bookmark = Bookmark.objects.filter(user=request.user, question=question).first()
-            
-            if bookmark:
-                bookmark.delete()
+            # Delete-or-insert without reading first; the unique (user, question)
+            # constraint settles concurrent toggles
+            deleted, _ = Bookmark.objects.filter(user=request.user, question_id=question_id).delete()
+            if deleted:
                 return Response({'message': 'Bookmark removed', 'bookmarked': False})
-            else:
-                bookmark = Bookmark.objects.create(user=request.user, question=question)
-                return Response({
-                    'message': 'Bookmark added',
-                    'bookmarked': True,
-                    'bookmark': BookmarkSerializer(bookmark).data
-                }, status=status.HTTP_201_CREATED)
-        except Question.DoesNotExist:
+            question = Question.objects.get(id=question_id)
+            try:
+                with transaction.atomic():
+                    bookmark = Bookmark.objects.create(user=request.user, question=question)
+            except IntegrityError:
+                # A concurrent toggle added it first
+                bookmark = Bookmark.objects.get(user=request.user, question=question)
+            return Response({
+                'message': 'Bookmark added',
+                'bookmarked': True,
+                'bookmark': BookmarkSerializer(bookmark).data
+            }, status=status.HTTP_201_CREATED)
+        except (Question.DoesNotExist, ValueError):
             return Response({'error': 'Question not found'}, status=status.HTTP_404_NOT_FOUND)
 
-class QuestionReportViewSet(viewsets.ModelViewSet):
+class QuestionReportViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     serializer_class = QuestionReportSerializer
     permission_classes = [IsAuthenticated]
+    query_budgets = {'list': 2, 'retrieve': 2}
 
     def get_queryset(self):
+        queryset = QuestionReport.objects.select_related('question__quiz', 'user')
         if self.request.user.is_staff:
-            return QuestionReport.objects.all()
-        return QuestionReport.objects.filter(user=self.request.user)
+            return queryset
+        return queryset.filter(user=self.request.user)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user, status='pending')
@@ -377,10 +516,11 @@ def login(request):
     return response
 
 # Study Materials ViewSet
-class StudyMaterialViewSet(viewsets.ModelViewSet):
+class StudyMaterialViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     queryset = StudyMaterial.objects.all()
     serializer_class = StudyMaterialSerializer
     permission_classes = [AllowAny]  # Allow viewing without auth
+    query_budgets = {'list': 2}
     
     def get_queryset(self):
         queryset = StudyMaterial.objects.all()
@@ -392,122 +532,127 @@ class StudyMaterialViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def increment_download(self, request, pk=None):
         material = self.get_object()
-        material.download_count += 1
-        material.save()
-        return Response({'download_count': material.download_count})
+        # Buffered and written in batches; the count returned is approximate
+        behind = counters.increment(StudyMaterial, material.pk, 'download_count')
+        return Response({'download_count': material.download_count + behind})
 
 # Notifications ViewSet
-class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
+class NotificationViewSet(QueryBudgetMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = NotificationSerializer
     permission_classes = [AllowAny]
+    # Measured with token auth for a user whose inbox state is not created yet
+    query_budgets = {'list': 7, 'retrieve': 3, 'unread_count': 6, 'read': 11, 'read_all': 7}
     
     def get_queryset(self):
         queryset = Notification.objects.filter(is_active=True)
         user = self.request.user
         if user.is_authenticated:
-            # Get notifications for all users or specific user
-            queryset = queryset.filter(
-                Q(target_users__isnull=True) | Q(target_users=user)
-            ).distinct()
-        else:
-            queryset = queryset.filter(target_users__isnull=True)
-        return queryset
+            # Broadcasts plus this user's fanned-out notifications
+            # Exists(): broadcast read marks are InboxItems too, a join would repeat rows
+            delivered = InboxItem.objects.filter(notification=OuterRef('pk'), user=user)
+            return queryset.filter(Q(is_broadcast=True) | Q(Exists(delivered)))
+        return queryset.filter(is_broadcast=True)
+
+    def list(self, request):
+        """Newest first; page with ?before=<id of the last item>&limit=N"""
+        try:
+            before = int(request.query_params['before']) if request.query_params.get('before') else None
+            limit = min(max(int(request.query_params.get('limit', inbox.PAGE_SIZE)), 1), inbox.MAX_PAGE_SIZE)
+        except ValueError:
+            return Response({'error': 'before and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        entries, next_before = inbox.page(request.user, before, limit)
+        response = Response(InboxEntrySerializer(entries, many=True).data)
+        if next_before is not None:
+            response['X-Next-Before'] = str(next_before)
+        return response
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def unread_count(self, request):
+        return Response({'unread_count': inbox.unread_count(request.user)})
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def read(self, request, pk=None):
+        if not str(pk).isdigit() or not inbox.mark_read(request.user, int(pk)):
+            return Response({'error': 'Notification not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'read': True})
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def read_all(self, request):
+        inbox.mark_all_read(request.user)
+        return Response({'unread_count': 0})
 
 # User Profile ViewSet
-class UserProfileViewSet(viewsets.ModelViewSet):
+class UserProfileViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     serializer_class = UserProfileSerializer
     permission_classes = [IsAuthenticated]
+    query_budgets = {'list': 2}
     
     def get_queryset(self):
-        return UserProfile.objects.filter(user=self.request.user)
+        return UserProfile.objects.filter(user=self.request.user).select_related('user')
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
 # Analytics API
-class AchievementViewSet(viewsets.ReadOnlyModelViewSet):
+class AchievementViewSet(QueryBudgetMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = AchievementSerializer
     permission_classes = [IsAuthenticated]
+    query_budgets = {'list': 2}
 
     def get_queryset(self):
         return Achievement.objects.filter(user=self.request.user)
 
-class UserAnalyticsViewSet(viewsets.ReadOnlyModelViewSet):
+class UserAnalyticsViewSet(QueryBudgetMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = UserAnalyticsSerializer
     permission_classes = [IsAuthenticated]
+    query_budgets = {'list': 2}
 
     def get_queryset(self):
-        return UserAnalytics.objects.filter(user=self.request.user)
+        return UserAnalytics.objects.filter(user=self.request.user).select_related('user')
 
     @action(detail=False, methods=['post'])
     def recalculate(self, request):
-        user = request.user
-        results = Result.objects.filter(user=user)
-        total_quizzes = results.count()
-        total_questions_answered = results.aggregate(total=Sum('correct_count') + Sum('wrong_count'))['total'] if total_quizzes else 0
-        avg_score = results.aggregate(avg=Avg('score'))['avg'] or 0
-
-        # Category stats
-        category_stats = {}
-        cat_rows = results.values('quiz__category').annotate(
-            quizzes=Count('id'),
-            avg_score=Avg('score'),
-            best_score=Max('score')
-        )
-        for row in cat_rows:
-            category_stats[row['quiz__category']] = {
-                'quizzes': row['quizzes'],
-                'avg_score': round(row['avg_score'] or 0, 2),
-                'best_score': round(row['best_score'] or 0, 2)
-            }
-
-        best_category = None
-        worst_category = None
-        if category_stats:
-            sorted_cats = sorted(category_stats.items(), key=lambda x: x[1]['avg_score'])
-            worst_category = sorted_cats[0][0]
-            best_category = sorted_cats[-1][0]
-
-        analytics_obj, _ = UserAnalytics.objects.get_or_create(user=user)
-        analytics_obj.total_quizzes = total_quizzes
-        analytics_obj.total_questions_answered = total_questions_answered or 0
-        analytics_obj.average_score = round(avg_score, 2)
-        analytics_obj.best_category = best_category or ''
-        analytics_obj.worst_category = worst_category or ''
-        analytics_obj.category_stats = category_stats
-        analytics_obj.save()
-        # Recalculate global ranks based on average_score (descending)
-        all_analytics = UserAnalytics.objects.all().order_by('-average_score')
-        for idx, ua in enumerate(all_analytics, start=1):
-            if ua.rank != idx:
-                ua.rank = idx
-                ua.save(update_fields=['rank'])
+        # Analytics are kept current on every submission; this rebuilds the
+        # row from the full history in case it drifted
+        analytics_obj = rebuild_analytics(request.user.id)
+        # Only this user's rank is refreshed here; everyone else's is
+        # reassigned in bulk by the recompute_ranks command
+        analytics_obj.rank = UserAnalytics.objects.filter(
+            Q(average_score__gt=analytics_obj.average_score) |
+            Q(average_score=analytics_obj.average_score, id__lt=analytics_obj.id)
+        ).count() + 1
+        analytics_obj.save(update_fields=['rank'])
         return Response(UserAnalyticsSerializer(analytics_obj).data)
 
-class DailyChallengeViewSet(viewsets.ReadOnlyModelViewSet):
+class DailyChallengeViewSet(QueryBudgetMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = DailyChallengeSerializer
     permission_classes = [AllowAny]
+    query_budgets = {'list': 3}
 
     def get_queryset(self):
         now = timezone.now()
-        return DailyChallenge.objects.filter(start_date__lte=now, end_date__gte=now, is_active=True)
+        return DailyChallenge.objects.filter(
+            start_date__lte=now, end_date__gte=now, is_active=True
+        ).select_related('quiz').prefetch_related('participants')
 
-class ChallengeParticipationViewSet(viewsets.ModelViewSet):
+class ChallengeParticipationViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     serializer_class = ChallengeParticipationSerializer
     permission_classes = [IsAuthenticated]
+    query_budgets = {'list': 2}
 
     def get_queryset(self):
-        return ChallengeParticipation.objects.filter(user=self.request.user)
+        return ChallengeParticipation.objects.filter(user=self.request.user).select_related('challenge__quiz')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class QuestionFeedbackViewSet(viewsets.ModelViewSet):
+class QuestionFeedbackViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     serializer_class = QuestionFeedbackSerializer
     permission_classes = [IsAuthenticated]
+    query_budgets = {'list': 2}
 
     def get_queryset(self):
-        return QuestionFeedback.objects.filter(user=self.request.user)
+        return QuestionFeedback.objects.filter(user=self.request.user).select_related('question')
 
     def perform_create(self, serializer):
         # Prevent duplicate feedback gracefully
@@ -523,10 +668,17 @@ class QuestionFeedbackViewSet(viewsets.ModelViewSet):
         else:
             serializer.save(user=self.request.user)
 
-class ForumPostViewSet(viewsets.ModelViewSet):
+class ForumPostViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     serializer_class = ForumPostSerializer
     permission_classes = [IsAuthenticated]
     queryset = ForumPost.objects.all()
+    query_budgets = {'list': 2, 'retrieve': 2, 'like': 9, 'comments_tree': 3}
+
+    def get_queryset(self):
+        # Counts are stored columns (quizzes/forum.py); only "did I like it" is looked up
+        return ForumPost.objects.select_related('author').annotate(
+            is_liked=forum.liked_by(ForumPost, self.request.user)
+        )
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
@@ -534,23 +686,57 @@ class ForumPostViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def like(self, request, pk=None):
         post = self.get_object()
-        if request.user in post.likes.all():
-            post.likes.remove(request.user)
-            return Response({'liked': False})
-        post.likes.add(request.user)
-        return Response({'liked': True})
+        liked, like_count = forum.toggle_like(post, request.user)
+        return Response({'liked': liked, 'like_count': like_count})
 
     @action(detail=True, methods=['post'])
     def view(self, request, pk=None):
         post = self.get_object()
-        post.views += 1
-        post.save(update_fields=['views'])
-        return Response({'views': post.views})
+        behind = counters.increment(ForumPost, post.pk, 'views')
+        return Response({'views': post.views + behind})
 
-class ForumCommentViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'])
+    def comments_tree(self, request, pk=None):
+        """
+        Nested comments, one query: ?limit=N top-level comments per page
+        (next page with ?after=<X-Next-After>), replies down to ?max_depth
+        levels; ?root=<comment id> loads the replies under one comment.
+        Comments show reply_count, so clients know where a cut thread goes on.
+        """
+        params = request.query_params
+        try:
+            after = int(params['after']) if params.get('after') else None
+            limit = min(max(int(params.get('limit', forum.THREAD_PAGE_SIZE)), 1), forum.MAX_THREAD_PAGE_SIZE)
+            max_depth = min(max(int(params.get('max_depth', forum.MAX_COMMENT_DEPTH)), 0), forum.MAX_COMMENT_DEPTH)
+            root_id = int(params['root']) if params.get('root') else None
+            post_id = int(pk)
+        except ValueError:
+            return Response({'error': 'after, limit, max_depth and root must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        root = None
+        if root_id is not None:
+            root = ForumComment.objects.filter(pk=root_id, post_id=post_id).only('path', 'depth').first()
+            if root is None:
+                return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        comments, next_after = forum.thread(post_id, request.user, after, limit, max_depth, root)
+        if not comments and not ForumPost.objects.filter(pk=post_id).exists():
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        response = Response(forum.build_tree(ForumCommentSerializer(comments, many=True).data))
+        if next_after is not None:
+            response['X-Next-After'] = str(next_after)
+        return response
+
+class ForumCommentViewSet(QueryBudgetMixin, viewsets.ModelViewSet):
     serializer_class = ForumCommentSerializer
     permission_classes = [IsAuthenticated]
     queryset = ForumComment.objects.all()
+    query_budgets = {'list': 2, 'retrieve': 2, 'like': 9}
+
+    def get_queryset(self):
+        return ForumComment.objects.select_related('author').annotate(
+            is_liked=forum.liked_by(ForumComment, self.request.user)
+        )
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
@@ -558,105 +744,62 @@ class ForumCommentViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def like(self, request, pk=None):
         comment = self.get_object()
-        if request.user in comment.likes.all():
-            comment.likes.remove(request.user)
-            return Response({'liked': False})
-        comment.likes.add(request.user)
-        return Response({'liked': True})
+        liked, like_count = forum.toggle_like(comment, request.user)
+        return Response({'liked': liked, 'like_count': like_count})
 
 @api_view(['GET'])
 def analytics(request):
+    """
+    Home screen stats, served from the user's precomputed analytics and
+    cached per user. Pass ?since=<stamp> from a previous response to get
+    304 Not Modified while nothing changed.
+    """
     if not request.user.is_authenticated:
         return Response({'error': 'Authentication required'}, status=401)
-    
-    user = request.user
-    
-    # Overall stats
-    total_results = Result.objects.filter(user=user).count()
-    avg_score = Result.objects.filter(user=user).aggregate(Avg('score'))['score__avg'] or 0
-    
-    # Category-wise performance
-    category_stats = Result.objects.filter(user=user).values('quiz__category').annotate(
-        avg_score=Avg('score'),
-        count=Count('id')
-    )
-    
-    # Recent performance (last 5 quizzes)
-    recent_results = Result.objects.filter(user=user).order_by('-date_taken')[:5]
-    recent_scores = [r.score for r in recent_results]
-    
-    # Weak topics (categories with score < 50)
-    weak_topics = Result.objects.filter(user=user, score__lt=50).values('quiz__category').annotate(
-        count=Count('id'),
-        avg_score=Avg('score')
-    )
-    
-    # Streak and badges
-    current_streak = 0
-    longest_streak = 0
-    try:
-        s = Streak.objects.get(user=user)
-        current_streak = s.current_streak
-        longest_streak = s.longest_streak
-    except Streak.DoesNotExist:
-        pass
 
-    badges = list(Badge.objects.filter(user=user).values('type', 'date_awarded'))
+    since = request.query_params.get('since')
+    if since and since == get_analytics_stamp(request.user.id):
+        return Response(status=status.HTTP_304_NOT_MODIFIED)
 
-    return Response({
-        'total_quizzes': total_results,
-        'average_score': round(avg_score, 2),
-        'category_stats': list(category_stats),
-        'recent_scores': recent_scores,
-        'weak_topics': list(weak_topics),
-        'current_streak': current_streak,
-        'longest_streak': longest_streak,
-        'badges': badges,
-        'user_name': user.username,
-    })
+    stamp, payload = analytics_payload(request.user)
+    return Response(payload)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def leaderboard(request):
-    """Multi-mode leaderboard: global, category, timeframe"""
+    """
+    Multi-mode leaderboard: global or ?category=, ?period= daily/weekly/monthly
+    (Nepal calendar) or last_7_days/last_30_days, and ?around=me for your own rank
+    """
     category = request.query_params.get('category')  # e.g., GK
-    period = request.query_params.get('period')  # daily, weekly, monthly
-
-    results = Result.objects.all()
-    if category:
-        results = results.filter(quiz__category=category)
-
-    now = timezone.now()
-    if period == 'daily':
-        results = results.filter(date_taken__date=now.date())
-    elif period == 'weekly':
-        week_ago = now - timedelta(days=7)
-        results = results.filter(date_taken__gte=week_ago)
-    elif period == 'monthly':
-        month_ago = now - timedelta(days=30)
-        results = results.filter(date_taken__gte=month_ago)
-
-    # Aggregate per user
-    aggregated = results.values('user').annotate(
-        total_score=Sum('score'),
-        quizzes_taken=Count('id'),
-        average_score=Avg('score')
-    ).order_by('-total_score')[:50]
-
-    # Map user objects for efficiency
-    user_map = {u.id: u for u in User.objects.filter(id__in=[a['user'] for a in aggregated])}
+    period = request.query_params.get('period')
+    scope = category or GLOBAL_SCOPE
+
+    # Pre-aggregated totals, kept up to date on every submission
+    if request.query_params.get('around') == 'me':
+        try:
+            window = min(max(int(request.query_params.get('window', 5)), 0), 25)
+        except ValueError:
+            window = 5
+        first_rank, rows = rank_window(scope, period, request.user.id, window)
+    else:
+        rows = top_entries(scope, period)
+        first_rank = 1
+    pictures = dict(
+        UserProfile.objects.filter(user_id__in=[row['user_id'] for row in rows])
+        .values_list('user_id', 'profile_picture')
+    )
+
     data = []
-    for rank, row in enumerate(aggregated, 1):
-        user_obj = user_map[row['user']]
-        profile = UserProfile.objects.filter(user=user_obj).first()
+    for rank, row in enumerate(rows, first_rank):
         data.append({
             'rank': rank,
-            'username': user_obj.username,
-            'total_score': round(row['total_score'] or 0, 2),
-            'quizzes_taken': row['quizzes_taken'],
-            'average_score': round(row['average_score'] or 0, 2),
-            'profile_picture': profile.profile_picture if profile else None,
-            'is_current_user': user_obj == request.user
+            'username': row['username'],
+            'total_score': round(row['score'], 2),
+            'quizzes_taken': row['quizzes'],
+            'average_score': round(row['score'] / row['quizzes'], 2),
+            'profile_picture': pictures.get(row['user_id']),
+            'is_current_user': row['user_id'] == request.user.id
         })
     serializer = LeaderboardEntrySerializer(data, many=True)
     return Response(serializer.data)
@@ -709,3 +852,42 @@ def google_login(request):
         'profile': UserProfileSerializer(profile).data,
         'created': created
     })
+
+
+def _stream_user(request):
+    """
+    (user, ok) for a live stream. EventSource cannot send headers, so a JWT
+    or API token may come as ?token=; otherwise the session is used.
+    """
+    raw = request.GET.get('token')
+    if not raw:
+        return (request.user if request.user.is_authenticated else None), True
+    try:
+        jwt = JWTAuthentication()
+        return jwt.get_user(jwt.get_validated_token(raw)), True
+    except AuthenticationFailed:
+        token = Token.objects.select_related('user').filter(key=raw, user__is_active=True).first()
+        return (token.user if token else None), token is not None
+
+
+async def live_stream(request):
+    """
+    Server-sent events: new notifications for the user (broadcasts for
+    anyone) and leaderboard changes of each ?challenge=<id>. Replaces
+    polling of /api/notifications/ and /api/challenges/; needs the ASGI app.
+    """
+    user, ok = await sync_to_async(_stream_user)(request)
+    if not ok:
+        return JsonResponse({'error': 'Invalid token'}, status=401)
+
+    topics = [live.BROADCAST_TOPIC]
+    if user is not None:
+        topics.append(live.user_topic(user.id))
+    challenge_ids = [c for c in request.GET.getlist('challenge') if c.isdigit()][:MAX_LIVE_CHALLENGES]
+    topics += [live.challenge_topic(int(c)) for c in challenge_ids]
+
+    response = StreamingHttpResponse(live.stream(topics), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response